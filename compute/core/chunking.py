@@ -0,0 +1,154 @@
+import contextvars
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from detectors.interfaces import IDetector
+
+PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+AGGREGATIONS = ('length', 'mean', 'confidence')
+
+
+@dataclass(frozen=True)
+class ChunkingConfig:
+    """
+    Describes how long requests are split and how verdicts of their chunks are combined.
+    :param max_chunk_chars: upper bound of chunk length, shorter texts are scored whole. Detectors that truncate their
+    input lower it with their own `max_chunk_chars`
+    :param aggregation: weight of chunk verdicts, 'length' (number of characters), 'mean' (equal) or 'confidence'
+    (the highest probability of the chunk)
+    :param return_chunks: add verdict of every chunk to the response
+    :param max_workers: number of chunks scored concurrently by detectors without batch prediction
+    """
+    max_chunk_chars: int = 4000
+    aggregation: str = 'length'
+    return_chunks: bool = False
+    max_workers: int = 4
+
+    def __post_init__(self):
+        if self.aggregation not in AGGREGATIONS:
+            raise Exception(f"Unknown aggregation {self.aggregation}, expected one of {AGGREGATIONS}.")
+        if self.max_chunk_chars <= 0:
+            raise Exception(f"Chunks should be at least one character long, got {self.max_chunk_chars}.")
+
+
+def _split_long(text: str, start: int, end: int, max_chars: int) -> List[Tuple[int, int]]:
+    # Splits span at the last whitespace before the limit, or exactly at the limit if there is none.
+    spans = []
+    while end - start > max_chars:
+        cut = max(text.rfind(space, start + 1, start + max_chars + 1) for space in ' \n\t')
+        cut = cut if cut > start else start + max_chars
+        spans.append((start, cut))
+        start = cut
+        while start < end and text[start].isspace():
+            start += 1
+    if start < end:
+        spans.append((start, end))
+    return spans
+
+
+def split_text(text: str, max_chars: int) -> List[Tuple[int, int]]:
+    """
+    Splits text into chunks on paragraph boundaries. Consecutive paragraphs are packed into one chunk while it stays
+    within max_chars, paragraphs longer than that are split on whitespace.
+    :param text: input text
+    :param max_chars: upper bound of chunk length
+    :return: list of (start, end) character spans of chunks, whitespace between paragraphs is dropped
+    """
+    paragraphs = []
+    start = 0
+    for match in PARAGRAPH_BREAK.finditer(text):
+        paragraphs.append((start, match.start()))
+        start = match.end()
+    paragraphs.append((start, len(text)))
+
+    chunks = []
+    for begin, end in paragraphs:
+        if not text[begin:end].strip():
+            continue
+        for piece in _split_long(text, begin, end, max_chars):
+            if chunks and piece[1] - chunks[-1][0] <= max_chars:
+                chunks[-1] = (chunks[-1][0], piece[1])
+            else:
+                chunks.append(piece)
+    return chunks or [(0, len(text))]
+
+
+def aggregate(probabilities: np.ndarray, lengths: List[int], aggregation: str) -> np.ndarray:
+    """
+    :param probabilities: array of shape (chunks, labels)
+    :param lengths: number of characters of every chunk
+    :param aggregation: see `ChunkingConfig`
+    :return: weighted mean of chunk probabilities
+    """
+    if aggregation == 'length':
+        weights = np.asarray(lengths, dtype=np.float64)
+    elif aggregation == 'confidence':
+        weights = probabilities.max(axis=1)
+    else:
+        weights = np.ones(len(probabilities))
+    return weights @ probabilities / weights.sum()
+
+
+class ChunkedScorer:
+    """
+    Scores long texts chunk by chunk, so that a single forward pass and feature vector never grow with the length of
+    the request. Detectors with `predict_proba_batch` score all chunks in one batch, others score them concurrently.
+    """
+
+    def __init__(self, config: Optional[ChunkingConfig] = None):
+        self.config = config or ChunkingConfig()
+        self.executor = ThreadPoolExecutor(max_workers=self.config.max_workers)
+
+    def chunk_limit(self, detector: IDetector) -> int:
+        """
+        :return: configured chunk length, lowered to the `max_chunk_chars` of the detector if it has one, so that
+        chunks are never truncated by the detector
+        """
+        limit = getattr(detector, 'max_chunk_chars', None)
+        return min(self.config.max_chunk_chars, limit) if limit else self.config.max_chunk_chars
+
+    def _predict(self, detector: IDetector, texts: List[str]) -> List[Tuple[np.ndarray, Optional[str]]]:
+        if hasattr(detector, 'predict_decision'):
+            predict = detector.predict_decision
+        else:
+            predict = lambda text: (detector.predict_proba(text), None)
+
+        if len(texts) == 1:
+            return [predict(texts[0])]
+        if hasattr(detector, 'predict_proba_batch') and not hasattr(detector, 'predict_decision'):
+            return [(probabilities, None) for probabilities in detector.predict_proba_batch(texts)]
+        # Every chunk runs in a copy of the caller's context, so it sees the request scope.
+        futures = [self.executor.submit(contextvars.copy_context().run, predict, text) for text in texts]
+        return [future.result() for future in futures]
+
+    def score(self, detector: IDetector, text: str) -> dict:
+        """
+        :param detector: detector to score chunks with
+        :param text: request content
+        :return: verdict with aggregated 'labels', 'stage' if the detector reports one and all chunks agree on it, and
+        'chunks' with spans and labels of every chunk if configured
+        """
+        spans = split_text(text, self.chunk_limit(detector))
+        results = self._predict(detector, [text[start:end] for start, end in spans])
+        probabilities = np.array([np.asarray(p, dtype=np.float64) for p, _ in results])
+        labels = detector.get_labels()
+
+        verdict = aggregate(probabilities, [end - start for start, end in spans], self.config.aggregation)
+        response = {"labels": [{"label": label, "probability": float(score)} for label, score in zip(labels, verdict)]}
+        stages = {stage for _, stage in results}
+        if len(stages) == 1 and None not in stages:
+            response["stage"] = stages.pop()
+        if self.config.return_chunks:
+            response["chunks"] = [
+                {"start": start, "end": end,
+                 "labels": [{"label": label, "probability": float(score)} for label, score in zip(labels, p)],
+                 **({"stage": stage} if stage is not None else {})}
+                for (start, end), (p, stage) in zip(spans, results)]
+        return response
+
+    def close(self):
+        self.executor.shutdown(wait=False)
@@ -1,19 +1,11 @@
 import logging
 import traceback
-import importlib
 from compute.models.detectors import DetectorSignature
 from detectors.interfaces import IDetector
 from detectors.interfaces import Nexus
 from typing import List, Optional
-import psycopg2
-from psycopg2.extras import RealDictCursor
 from detectors.mocks import MockDetector
-
-
-def get_class_constructor(classpath: str):
-    module_path, class_name = classpath.rsplit('.', 1)
-    module = importlib.import_module(module_path)
-    return getattr(module, class_name)
+from detectors.utils.loading import load_detector
 
 
 class IDetectorsProvider:
@@ -23,6 +15,8 @@ class IDetectorsProvider:
 
 class PostgresDetectorsProvider(IDetectorsProvider):
     def __init__(self, postgres_host: str, postgres_db: str, postgres_user: str, postgres_password: str):
+        import psycopg2
+
         self.conn = psycopg2.connect(
             host=postgres_host,
             database=postgres_db,
@@ -32,6 +26,8 @@ class PostgresDetectorsProvider(IDetectorsProvider):
         )
 
     def get_detectors(self) -> List[DetectorSignature]:
+        from psycopg2.extras import RealDictCursor
+
         with self.conn.cursor(cursor_factory=RealDictCursor) as cursor:
             cursor.execute("SELECT run_id, name, classpath FROM detectors")
             rows = cursor.fetchall()
@@ -68,11 +64,15 @@ class DetectorsEngine:
     def __init__(self, provider: IDetectorsProvider, nexus: Nexus):
         self.detectors_signatures = provider.get_detectors()
         self.detectors = {"mock": MockDetector(['Human', "AI"])}
+        if hasattr(nexus, 'get_run_ids'):
+            # Resolves all runs with a single metadata query instead of one query per detector.
+            try:
+                nexus.get_run_ids([signature.run_id for signature in self.detectors_signatures])
+            except:
+                logging.warning("Could not resolve detector runs. Ex = " + traceback.format_exc())
         for signature in self.detectors_signatures:
             try:
-                detector: IDetector = get_class_constructor(signature.classpath)()
-                detector.load_weights(nexus.load_run_weights(signature.run_id))
-                self.detectors[signature.name] = detector
+                self.detectors[signature.name] = load_detector(nexus, signature.classpath, signature.run_id)
                 logging.info(f"Successfully loaded detector {signature.name}.")
             except:
                 logging.warning(f"Could not instantiate detector {signature.name}. Ex = " + traceback.format_exc())
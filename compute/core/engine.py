@@ -1,12 +1,18 @@
+from typing import Optional
+
+from compute.core.chunking import ChunkingConfig, ChunkedScorer
 from compute.core.interfaces import IMessageBroker
 from compute.models.communication import ComputeRequest, ComputeResponse
 from compute.core.detectors import DetectorsEngine
+from detectors.models.scope import request_scope
 
 
 class ComputeEngine:
-    def __init__(self, detectors_engine: DetectorsEngine, broker: IMessageBroker):
+    def __init__(self, detectors_engine: DetectorsEngine, broker: IMessageBroker,
+                 chunking: Optional[ChunkingConfig] = None):
         self.detectors_engine = detectors_engine
         self.broker = broker
+        self.scorer = ChunkedScorer(chunking)
         self.broker.set_process_request_method(self.process_request)
 
     def start_consuming(self):
@@ -23,9 +29,9 @@ class ComputeEngine:
                 verdict=None,
                 request_id=str(request.request_id)
             )
-        predictions = detector.predict_proba(request.content)
-        predictions_mapping = {"labels": [{"label": label, "probability": score} for label, score in
-                                          zip(detector.get_labels(), predictions)]}
+        # Long content is scored in bounded chunks, cascades also report which of their stages decided.
+        with request_scope():
+            predictions_mapping = self.scorer.score(detector, request.content)
 
         return ComputeResponse(
             status="SUCCESS",
@@ -35,3 +41,4 @@ class ComputeEngine:
 
     def close(self):
         self.broker.close()
+        self.scorer.close()
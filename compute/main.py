@@ -6,6 +6,7 @@ from typing import Any
 import yaml
 from dotenv import load_dotenv
 
+from compute.core.chunking import ChunkingConfig
 from compute.core.detectors import DetectorsEngine, PostgresDetectorsProvider
 from compute.core.engine import ComputeEngine
 from compute.core.rabbitmq_broker import RabbitMQBroker
@@ -65,7 +66,8 @@ if __name__ == "__main__":
             nexus = None
         detector_engine = DetectorsEngine(detection_provider, nexus)
 
-        engine = ComputeEngine(detectors_engine=detector_engine, broker=broker)
+        engine = ComputeEngine(detectors_engine=detector_engine, broker=broker,
+                               chunking=ChunkingConfig(**config.get("chunking", dict())))
         logging.info("Starting the Compute Engine...")
         engine.start_consuming()
 
@@ -1,7 +1,7 @@
 import json
 from dataclasses import dataclass
 from uuid import uuid4
-from typing import Dict, List, Optional
+from typing import Any, Dict, Optional
 
 
 @dataclass
@@ -29,4 +29,4 @@ class ComputeRequest:
 class ComputeResponse:
     request_id: str
     status: str
-    verdict: Optional[Dict[str, List[Dict[str, float]]]]
+    verdict: Optional[Dict[str, Any]]
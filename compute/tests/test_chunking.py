@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from compute.core.chunking import ChunkingConfig, ChunkedScorer, split_text, aggregate
+from compute.core.detectors import MockDetectorsEngine
+from compute.core.engine import ComputeEngine
+from compute.core.mock_broker import MockMessageBroker
+from compute.models.communication import ComputeRequest
+from detectors.mocks import MockDetector
+
+
+class LengthDetector(MockDetector):
+    """
+    Probability of 'AI' grows with the number of 'x' characters in the text.
+    """
+
+    def __init__(self):
+        super().__init__(['Human', 'AI'])
+        self.texts = []
+
+    def predict_proba(self, text: str) -> np.array:
+        self.texts.append(text)
+        ai = text.count('x') / len(text)
+        return np.array([1 - ai, ai])
+
+
+def test_split_respects_bound_and_paragraphs():
+    text = 'a' * 30 + '\n\n' + 'b' * 30 + '\n\n' + ' '.join(['c' * 9] * 10)
+
+    spans = split_text(text, 64)
+
+    assert all(end - start <= 64 for start, end in spans)
+    assert text[spans[0][0]:spans[0][1]] == 'a' * 30 + '\n\n' + 'b' * 30
+    assert ''.join(text[start:end] for start, end in spans[1:]).replace(' ', '') == 'c' * 90
+    assert split_text('short text', 64) == [(0, 10)]
+
+
+def test_aggregation_weights():
+    probabilities = np.array([[0.9, 0.1], [0.4, 0.6]])
+
+    assert np.allclose(aggregate(probabilities, [3, 1], 'length'), [0.775, 0.225])
+    assert np.allclose(aggregate(probabilities, [3, 1], 'mean'), [0.65, 0.35])
+    assert np.allclose(aggregate(probabilities, [3, 1], 'confidence'), [0.7, 0.3])
+    with pytest.raises(Exception):
+        ChunkingConfig(aggregation='median')
+
+
+def test_long_request_is_scored_in_chunks():
+    detector = LengthDetector()
+    engine = ComputeEngine(MockDetectorsEngine(detector), MockMessageBroker(),
+                           ChunkingConfig(max_chunk_chars=100, return_chunks=True))
+    content = 'x' * 100 + '\n\n' + 'y' * 300
+
+    verdict = engine.process_request(ComputeRequest('id', content, 'mock_detector')).verdict
+
+    assert max(len(text) for text in detector.texts) <= 100 and len(detector.texts) == 4
+    assert np.isclose(verdict['labels'][1]['probability'], 0.25)
+    assert [(chunk['start'], chunk['end']) for chunk in verdict['chunks']] == [(0, 100), (102, 202), (202, 302),
+                                                                              (302, 402)]
+    assert verdict['chunks'][0]['labels'][1]['probability'] == 1.0
+
+
+def test_batch_detectors_score_chunks_at_once():
+    class BatchDetector(LengthDetector):
+        def predict_proba_batch(self, texts):
+            self.batches = getattr(self, 'batches', 0) + 1
+            return np.array([self.predict_proba(text) for text in texts])
+
+    detector = BatchDetector()
+    ChunkedScorer(ChunkingConfig(max_chunk_chars=10)).score(detector, 'x ' * 50)
+
+    assert detector.batches == 1 and len(detector.texts) > 1
+
+
+def test_chunks_fit_into_truncating_detector():
+    class TruncatingDetector(LengthDetector):
+        max_chunk_chars = 50
+
+        def predict_proba(self, text: str) -> np.array:
+            return super().predict_proba(text[:self.max_chunk_chars])
+
+    detector = TruncatingDetector()
+    content = 'y ' * 100 + 'x ' * 25
+    verdict = ChunkedScorer().score(detector, content)
+
+    assert max(len(text) for text in detector.texts) <= 50
+    assert ''.join(detector.texts).replace(' ', '') == content.replace(' ', '')
+    assert verdict['labels'][1]['probability'] > 0
@@ -1,13 +1,16 @@
 import json
 from dataclasses import asdict
+from uuid import uuid4
 
 import pytest
 
 from compute.core.engine import ComputeEngine
 from compute.core.mock_broker import MockMessageBroker
 from compute.models.communication import ComputeRequest
+from compute.models.detectors import DetectorSignature
 from detectors.mocks import MockDetector
-from compute.core.detectors import MockDetectorsEngine
+from detectors.neptune.local import MockNexus
+from compute.core.detectors import MockDetectorsEngine, DetectorsEngine, ListDetectorsProvider
 
 
 @pytest.fixture
@@ -89,3 +92,17 @@ def test_start_and_stop_consuming(setup_engine):
 def test_close(setup_engine):
     engine, _, _ = setup_engine
     engine.close()
+
+
+def test_detectors_load_weights_from_nexus_files(tmp_path, monkeypatch):
+    run = uuid4()
+    nexus = MockNexus(str(tmp_path))
+    nexus.store_run_weights(run, MockDetector().store_weights())
+    paths = []
+    monkeypatch.setattr(MockDetector, 'load_weights_from_path', lambda self, path: paths.append(path))
+
+    engine = DetectorsEngine(ListDetectorsProvider(
+        [DetectorSignature(run, 'mocked', 'detectors.mocks.MockDetector')]), nexus)
+
+    assert isinstance(engine.get_detector_by_name('mocked'), MockDetector)
+    assert paths == [nexus.load_run_weights_path(run)]
@@ -0,0 +1,26 @@
+import json
+import subprocess
+import sys
+
+# Modules imported by compute worker before any detector is instantiated.
+COLD_PATH = ['compute.core.engine', 'compute.core.detectors', 'detectors.interfaces', 'detectors.mocks',
+             'detectors.models.hf', 'detectors.perplexity.model']
+HEAVY = ['matplotlib', 'sklearn', 'torch', 'transformers', 'openai', 'psycopg2', 'neptune']
+BUDGET_SECONDS = 1.0
+
+SCRIPT = f"""
+import json, sys, time
+start = time.perf_counter()
+for module in {COLD_PATH!r}:
+    __import__(module)
+print(json.dumps({{'elapsed': time.perf_counter() - start,
+                  'heavy': [m for m in {HEAVY!r} if m in sys.modules]}}))
+"""
+
+
+def test_cold_path_imports_are_light():
+    result = json.loads(subprocess.run([sys.executable, '-c', SCRIPT], capture_output=True, check=True,
+                                       text=True).stdout)
+
+    assert result['heavy'] == []
+    assert result['elapsed'] < BUDGET_SECONDS
@@ -0,0 +1,136 @@
+import pickle
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from detectors.interfaces import IDetector
+from detectors.utils.loading import ensure_type, ensure_obj, get_class_constructor
+
+LABELS = ['Human', 'AI']
+LABEL_ALIASES = {'LLM': 'AI'}
+
+
+def label_order(labels: List[str]) -> np.ndarray:
+    """
+    :param labels: labels of some detector, such as ['LLM', 'Human']
+    :return: indices that reorder its probabilities into cascade labels
+    :raises Exception: if some of cascade labels are missing
+    """
+    labels = [LABEL_ALIASES.get(label, label) for label in labels]
+    missing = set(LABELS) - set(labels)
+    if missing:
+        raise Exception(f"Labels {labels} lack {sorted(missing)}.")
+    return np.array([labels.index(label) for label in LABELS])
+
+
+def classpath_of(detector: IDetector) -> str:
+    return f'{type(detector).__module__}.{type(detector).__qualname__}'
+
+
+@dataclass
+class CascadeStage:
+    """
+    Stage of the cascade. Its verdict is final unless probability of 'AI' falls strictly inside (lower, upper), in
+    which case the request is escalated to the next stage. Band of the last stage is ignored.
+    """
+    name: str
+    detector: IDetector
+    lower: float = 0.0
+    upper: float = 1.0
+
+    def is_uncertain(self, probability: float) -> bool:
+        return self.lower < probability < self.upper
+
+
+class CascadeDetector(IDetector):
+    """
+    Runs stages from the cheapest to the most expensive one, and stops at the first stage that is certain. Stages may
+    order or name their labels differently, their probabilities are mapped onto cascade labels by name.
+    """
+
+    def __init__(self, stages: Optional[List[CascadeStage]] = None):
+        self.stages: List[CascadeStage] = []
+        self.orders: List[np.ndarray] = []
+        self.decisions = Counter()
+        self.lock = threading.Lock()
+        self.set_stages(stages or [])
+
+    def set_stages(self, stages: List[CascadeStage]) -> None:
+        """
+        :raises Exception: if a stage lacks some of cascade labels or its band is malformed
+        """
+        orders = []
+        for stage in stages:
+            if not 0 <= stage.lower <= stage.upper <= 1:
+                raise Exception(f"Stage {stage.name} has malformed uncertainty band ({stage.lower}, {stage.upper}).")
+            try:
+                orders.append(label_order(stage.detector.get_labels()))
+            except Exception as e:
+                raise Exception(f"Stage {stage.name} does not predict cascade labels.", e)
+        self.stages = stages
+        self.orders = orders
+
+    def predict_decision(self, text: str) -> Tuple[np.array, str]:
+        """
+        Returns probabilities together with the name of the stage that decided.
+        :param text: input text sequence to classify
+        :return: tuple of probabilities in the order of cascade labels and name of the deciding stage
+        """
+        if not self.stages:
+            raise Exception("Cascade has no stages.")
+        for i, (stage, order) in enumerate(zip(self.stages, self.orders)):
+            probabilities = np.asarray(stage.detector.predict_proba(text))[order]
+            if i + 1 == len(self.stages) or not stage.is_uncertain(probabilities[LABELS.index('AI')]):
+                with self.lock:
+                    self.decisions[stage.name] += 1
+                return probabilities, stage.name
+
+    def predict_proba(self, text: str) -> np.array:
+        return self.predict_decision(text)[0]
+
+    @property
+    def max_chunk_chars(self) -> Optional[int]:
+        """
+        :return: the smallest input length of stages that truncate their input, None if none of them does
+        """
+        limits = [stage.detector.max_chunk_chars for stage in self.stages
+                  if getattr(stage.detector, 'max_chunk_chars', None)]
+        return min(limits) if limits else None
+
+    def get_labels(self) -> List[str]:
+        return LABELS
+
+    def decision_rates(self) -> Dict[str, float]:
+        """
+        :return: fraction of predictions decided by every stage so far
+        """
+        with self.lock:
+            total = sum(self.decisions.values())
+            return {stage.name: self.decisions[stage.name] / total if total else 0.0 for stage in self.stages}
+
+    def store_weights(self) -> bytes:
+        return pickle.dumps({'stages': [{
+            'name': stage.name,
+            'classpath': classpath_of(stage.detector),
+            'weights': stage.detector.store_weights(),
+            'lower': stage.lower,
+            'upper': stage.upper} for stage in self.stages]})
+
+    def load_weights(self, weights: bytes) -> None:
+        """
+        Loads cascade stored by `store_weights`. Every stage is instantiated by its classpath and loads its own weights.
+        """
+        try:
+            dct = ensure_type(pickle.loads(weights), dict)
+            stages = []
+            for stage in ensure_type(ensure_obj(dct, 'stages'), list):
+                detector = ensure_type(get_class_constructor(ensure_obj(stage, 'classpath'))(), IDetector)
+                detector.load_weights(ensure_obj(stage, 'weights'))
+                stages.append(CascadeStage(ensure_obj(stage, 'name'), detector, ensure_obj(stage, 'lower'),
+                                           ensure_obj(stage, 'upper')))
+            self.set_stages(stages)
+        except Exception as e:
+            raise Exception("Error occurred while loading weights.", e)
@@ -1,12 +1,16 @@
+import os
 import pickle
-from typing import List
+from typing import List, Optional, Union
 
 import numpy as np
 from sklearn.pipeline import Pipeline
 
 from detectors.ghostbuster.features import extract_features
+from detectors.ghostbuster.ngrams import TrainableLanguageModel
 from detectors.interfaces import IDetector, EstimationLanguageModel
+from detectors.models.cache import LogProbCache, CachedEstimationLanguageModel
 from detectors.utils.loading import ensure_type, ensure_obj
+from detectors.utils.mapped import dump_mapped, is_mapped, load_mapped
 
 
 class GhostbusterDetector(IDetector):
@@ -21,9 +25,20 @@ class GhostbusterDetector(IDetector):
     def get_labels(self) -> List[str]:
         return ['Human', 'AI']
 
-    def load_weights(self, weights: bytes) -> None:
+    def load_weights(self, weights: Union[bytes, str, os.PathLike]) -> None:
+        """
+        Loads weights stored by `store_weights`. N-gram tables are memory mapped read-only, so all processes that load
+        the same weights share one copy of them. Bytes are first spilled to content-addressed file in ./cache/mapped,
+        path to the weights file is mapped directly and loads in constant time.
+        """
         try:
-            dct = pickle.loads(weights)
+            if is_mapped(weights):
+                dct = load_mapped(weights)
+            else:
+                if not isinstance(weights, bytes):
+                    with open(weights, 'rb') as f:
+                        weights = f.read()
+                dct = pickle.loads(weights)
             ensure_type(dct, dict)
 
             self.clf = ensure_obj(dct, 'clf')
@@ -34,8 +49,28 @@ class GhostbusterDetector(IDetector):
             for estimator in self.estimators:
                 ensure_type(estimator, EstimationLanguageModel)
 
+            self.use_cache(LogProbCache.from_env())
+
         except Exception as e:
             raise Exception("Error occurred while loading weights.", e)
 
+    def load_weights_from_path(self, path: str) -> None:
+        # Mapped weights are mapped directly from the path, without reading or copying them.
+        self.load_weights(path)
+
+    def use_cache(self, cache: Optional[LogProbCache]) -> None:
+        """
+        Wraps estimators that query large language models with persistent log-probability cache. N-gram models are
+        cheaper to evaluate than to look up, so they are left as is.
+        :param cache: cache to use, None keeps estimators unchanged
+        """
+        if cache is None:
+            return
+        self.estimators = [
+            estimator if isinstance(estimator, (TrainableLanguageModel, CachedEstimationLanguageModel))
+            else CachedEstimationLanguageModel(estimator, cache) for estimator in self.estimators]
+
     def store_weights(self) -> bytes:
-        return pickle.dumps({"clf": self.clf, "estimator": self.estimators})
+        estimators = [estimator.model if isinstance(estimator, CachedEstimationLanguageModel) else estimator
+                      for estimator in self.estimators]
+        return dump_mapped({"clf": self.clf, "estimator": estimators})
@@ -1,75 +1,214 @@
-from collections import defaultdict
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 
 import numpy as np
-from typing import List
-from nltk import FreqDist, bigrams, trigrams
-from transformers import AutoTokenizer
+from typing import Iterable, Iterator, List, Sequence, Union
+from detectors.ghostbuster.tables import NgramTable, NgramCounts, NgramCounter, pack_ngrams, suffix_keys, gather
 from detectors.interfaces import EstimationLanguageModel
+from detectors.models.tokenizers import get_tokenizer, register_tokenizer, tokenize
 
 
 class TrainableLanguageModel(EstimationLanguageModel):
+    max_order = 1
+
     def __init__(self, tokenizer_handle="google/gemma-2-27b-it", discount=0.9):
         self.discount = discount
-        self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_handle)
+        self.tokenizer_handle = tokenizer_handle
+
+    @property
+    def tokenizer(self):
+        return get_tokenizer(self.tokenizer_handle)
+
+    def tokenize(self, text: str) -> List[int]:
+        return tokenize(self.tokenizer_handle, text)
+
+    def __setstate__(self, state):
+        if 'tokenizer' in state:  # Weights that pickled the whole tokenizer instance.
+            tokenizer = state.pop('tokenizer')
+            state['tokenizer_handle'] = tokenizer.name_or_path
+            register_tokenizer(tokenizer.name_or_path, tokenizer)
+        self.__dict__.update(state)
+
+    def train(self, corpus_text: Union[str, Iterable[str]], chunk_size: int = 1000, num_workers: int = 0):
+        """
+        Trains model on the corpus. Corpus is consumed lazily in chunks, so it can be arbitrary large iterator.
+        :param corpus_text: texts to train on. Texts are treated as one continuous token stream.
+        :param chunk_size: number of texts tokenized in one batched call
+        :param num_workers: number of worker processes counting chunks in parallel, 0 counts in this process
+        """
+        self._fit(self._count_corpus(corpus_text, chunk_size, num_workers))
+
+    def train_tokens(self, token_sequences: Iterable[Sequence[int]], chunk_size: int = 1000):
+        """
+        Trains model on already tokenized corpus, same as `train` on the corresponding texts if they were tokenized by
+        `tokenize_corpus`.
+        :param token_sequences: token ids of every text, treated as one continuous token stream
+        :param chunk_size: number of texts counted at once
+        """
+        counter = NgramCounter()
+        counter.add(NgramCounts.from_tokens([], self.max_order))
+        for chunk in _iterate_chunks(token_sequences, chunk_size):
+            tokens = np.concatenate([np.asarray(ids, dtype=np.int64) for ids in chunk])
+            counter.add(NgramCounts.from_tokens(tokens, self.max_order))
+        self._fit(counter.result())
+
+    def _fit(self, counts: NgramCounts):
+        raise NotImplementedError("This method should be implemented by subclasses.")
 
-    def train(self, corpus_text: List[str]):
+    def get_tokens_log_proba(self, tokens: Sequence[int]) -> np.array:
+        """
+        Returns log-probabilities of already tokenized text.
+        """
         raise NotImplementedError("This method should be implemented by subclasses.")
 
+    def get_text_log_proba(self, text):
+        tokens = self.tokenize(text)
+        return tokens, self.get_tokens_log_proba(tokens)
 
-MIN_PROBABILITY = 1e-9
+    def _count_corpus(self, corpus_text: Union[str, Iterable[str]], chunk_size: int, num_workers: int) -> NgramCounts:
+        if isinstance(corpus_text, str):
+            corpus_text = [corpus_text]
+        chunks = _iterate_chunks(corpus_text, chunk_size)
+        counter = NgramCounter()
+        counter.add(NgramCounts.from_tokens([], self.max_order))
 
+        if num_workers == 0:
+            for chunk in chunks:
+                counter.add(_count_chunk(chunk, self.tokenizer, self.max_order))
+            return counter.result()
 
-class UnigramModel(TrainableLanguageModel):
-    def train(self, corpus_text: List[str]):
-        tokens_seq = self.tokenizer(corpus_text)['input_ids']
-        tokens = []
-        for token in tokens_seq:
-            tokens.extend(token)
-        self.total_tokens = len(tokens)
-        self.unigram_freq = FreqDist(tokens)
-        self.unigram_probabilities = {token: count / self.total_tokens for token, count in self.unigram_freq.items()}
+        with ProcessPoolExecutor(num_workers, initializer=_init_worker, initargs=(self.tokenizer_handle,)) as pool:
+            # Bounded number of chunks in flight keeps memory flat; results are merged in corpus order.
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.submit(_count_chunk, chunk, None, self.max_order))
+                if len(pending) >= 2 * num_workers:
+                    counter.add(pending.popleft().result())
+            while pending:
+                counter.add(pending.popleft().result())
+        return counter.result()
 
-    def get_text_log_proba(self, text):
-        tokens = self.tokenizer(text, add_special_tokens=False)['input_ids']
-        return tokens, np.array(
-            [np.log(self.unigram_probabilities.get(token, MIN_PROBABILITY)) for token in tokens])
 
+def _iterate_chunks(corpus_text: Iterable[str], chunk_size: int) -> Iterator[List[str]]:
+    iterator = iter(corpus_text)
+    while chunk := list(islice(iterator, chunk_size)):
+        yield chunk
 
-class TrigramModel(TrainableLanguageModel):
-    def train(self, corpus_text: List[str]):
-        tokens_seq = self.tokenizer(corpus_text)['input_ids']
-        tokens = []
-        for token in tokens_seq:
-            tokens.extend(token)
 
-        self.unigram_freq = FreqDist(tokens)
-        self.bigram_freq = FreqDist(bigrams(tokens))
-        self.trigram_freq = FreqDist(trigrams(tokens))
+_worker_tokenizer = None
 
-        self.bigram_continuation_counts = defaultdict(int)
-        self.trigram_continuation_counts = defaultdict(int)
-        for (w1, w2) in self.bigram_freq:
-            self.bigram_continuation_counts[w2] += 1
-        for (w1, w2, w3) in self.trigram_freq:
-            self.trigram_continuation_counts[(w2, w3)] += 1
 
-        self.total_trigrams = sum(self.trigram_freq.values())
+def _init_worker(tokenizer_handle: str):
+    global _worker_tokenizer
+    _worker_tokenizer = get_tokenizer(tokenizer_handle)
 
-    def get_text_log_proba(self, text):
-        tokens = self.tokenizer(text, add_special_tokens=False)['input_ids']
-        trigram_probabilities = []
-
-        for w1, w2, w3 in trigrams(tokens + [self.tokenizer.pad_token, self.tokenizer.pad_token]):
-            trigram_count = self.trigram_freq.get((w1, w2, w3), 0)
-            trigram_discounted = max(trigram_count - self.discount, 0) / self.total_trigrams
-            bigram_continuation = (self.discount * self.trigram_continuation_counts.get((w2, w3),
-                                                                                        0)) / self.total_trigrams
-            bigram_count = self.bigram_freq.get((w2, w3), 0)
-            bigram_prob = (max(bigram_count - self.discount, 0) / len(tokens) +
-                           (self.discount * self.bigram_continuation_counts.get(w3, 0)) / len(tokens))
-            trigram_prob = trigram_discounted + bigram_continuation * bigram_prob
-            trigram_probabilities.append(trigram_prob)
-
-        trigram_probabilities = np.array(trigram_probabilities)
-        return tokens, np.log(trigram_probabilities, out=np.ones(len(tokens)) * np.log(MIN_PROBABILITY),
-                              where=(trigram_probabilities != 0.0))
+
+def tokenize_corpus(tokenizer, texts: List[str]) -> List[List[int]]:
+    """
+    Tokenizes training texts the way `train` does, special tokens of the tokenizer are kept.
+    :param tokenizer: HF tokenizer
+    :param texts: batch of texts
+    :return: token ids of every text
+    """
+    return tokenizer(texts, add_special_tokens=True)['input_ids']
+
+
+def _count_chunk(chunk: List[str], tokenizer, max_order: int) -> NgramCounts:
+    tokens_seq = tokenize_corpus(tokenizer or _worker_tokenizer, chunk)
+    return NgramCounts.from_tokens(np.fromiter((token for tokens in tokens_seq for token in tokens), dtype=np.int64),
+                                   max_order)
+
+
+MIN_PROBABILITY = 1e-9
+
+
+class UnigramModel(TrainableLanguageModel):
+    def _fit(self, counts: NgramCounts):
+        unigram_counts, = counts.tables
+        self.total_tokens = unigram_counts.total()
+        self._build_log_proba(unigram_counts)
+
+    def _build_log_proba(self, unigram_table: NgramTable):
+        self.unigram_log_proba = np.full(int(unigram_table.keys.max(initial=-1)) + 1, np.log(MIN_PROBABILITY))
+        self.unigram_log_proba[unigram_table.keys] = np.log(unigram_table.values / self.total_tokens)
+
+    def get_tokens_log_proba(self, tokens: Sequence[int]) -> np.array:
+        return gather(self.unigram_log_proba, tokens, np.log(MIN_PROBABILITY))
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        if 'unigram_freq' in state:  # Weights stored before n-gram tables were introduced.
+            self._build_log_proba(NgramTable.from_counts(self.__dict__.pop('unigram_freq')))
+            self.__dict__.pop('unigram_probabilities', None)
+
+
+class TrigramModel(TrainableLanguageModel):
+    max_order = 3
+
+    def __init__(self, tokenizer_handle="google/gemma-2-27b-it", discount=0.9, min_count=1, table_dtype='float64'):
+        """
+        :param tokenizer_handle: HF handle of the tokenizer
+        :param discount: absolute discount applied to observed counts
+        :param min_count: trigrams seen less than this number of times are pruned from the finalized tables
+        :param table_dtype: floating dtype of the stored log-probabilities, e.g. 'float16' to halve memory again
+        """
+        super().__init__(tokenizer_handle, discount)
+        self.min_count = min_count
+        self.table_dtype = table_dtype
+
+    def _fit(self, counts: NgramCounts):
+        _, bigram_counts, trigram_counts = counts.tables
+        self._build_tables(bigram_counts, trigram_counts)
+
+    def _build_tables(self, bigram_counts: NgramTable, trigram_counts: NgramTable):
+        """
+        Finalizes raw counts into two log-probability tables, so that the probability of trigram (w1, w2, w3) in text
+        of n tokens is exp(trigram_log_proba[w1, w2, w3]) + exp(backoff_log_proba[w2, w3]) / n.
+        """
+        self.total_trigrams = trigram_counts.total()
+
+        # Keys are unique, so counting suffixes gives the number of distinct left contexts of each (n-1)-gram.
+        # Every trigram suffix is itself an observed bigram, so its count is aligned with the bigram table.
+        bigram_continuation_counts = np.bincount(suffix_keys(bigram_counts.keys, 1))
+        trigram_continuation = NgramTable.from_keys(suffix_keys(trigram_counts.keys, 2))
+        trigram_continuation_counts = np.zeros(len(bigram_counts), dtype=np.int64)
+        trigram_continuation_counts[bigram_counts.find(trigram_continuation.keys)[0]] = trigram_continuation.values
+
+        trigram_discounted = np.maximum(trigram_counts.values - self.discount, 0) / self.total_trigrams
+        kept = (trigram_counts.values >= self.min_count) & (trigram_discounted > 0)
+        self.trigram_log_proba = trigram_counts.select(kept, np.log(trigram_discounted, where=kept,
+                                                                    out=np.zeros(len(kept))).astype(self.table_dtype))
+
+        backoff_weight = (self.discount * trigram_continuation_counts) / self.total_trigrams
+        bigram_mass = (np.maximum(bigram_counts.values - self.discount, 0) +
+                       self.discount * bigram_continuation_counts[suffix_keys(bigram_counts.keys, 1)])
+        backoff = backoff_weight * bigram_mass
+        kept = backoff > 0
+        self.backoff_log_proba = bigram_counts.select(kept, np.log(backoff, where=kept,
+                                                                   out=np.zeros(len(kept))).astype(self.table_dtype))
+
+    def get_tokens_log_proba(self, tokens: Sequence[int]) -> np.array:
+        n = len(tokens)
+        ids = np.asarray(tokens, dtype=np.int64)
+
+        # Position i scores trigram (w[i], w[i + 1], w[i + 2]). Text is padded with two pad tokens, which are never
+        # seen in training, hence the last two positions always get zero probability.
+        trigram_probabilities = np.zeros(n)
+        if n > 2:
+            trigram = np.exp(self.trigram_log_proba.lookup(pack_ngrams(ids, 3), -np.inf).astype(np.float64))
+            backoff = np.exp(self.backoff_log_proba.lookup(pack_ngrams(ids[1:], 2), -np.inf).astype(np.float64))
+            trigram_probabilities[:n - 2] = trigram + backoff / n
+
+        return np.log(trigram_probabilities, out=np.ones(n) * np.log(MIN_PROBABILITY),
+                      where=(trigram_probabilities != 0.0))
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        if 'trigram_freq' in state:  # Weights stored before n-gram tables were introduced.
+            self.min_count = 1
+            self.table_dtype = 'float64'
+            for legacy in ['unigram_freq', 'bigram_continuation_counts', 'trigram_continuation_counts']:
+                self.__dict__.pop(legacy, None)
+            self._build_tables(NgramTable.from_counts(self.__dict__.pop('bigram_freq')),
+                               NgramTable.from_counts(self.__dict__.pop('trigram_freq')))
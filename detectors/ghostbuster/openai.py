@@ -1,28 +1,106 @@
 import os
-from typing import Tuple, List
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple, List, Optional
 
 import numpy as np
 
 from detectors.interfaces import EstimationLanguageModel
-from openai import OpenAI
+from openai import OpenAI, RateLimitError, APIConnectionError, InternalServerError
+
+
+class AdaptiveLimiter:
+    """
+    Bounds number of concurrent requests. The bound is halved on every rate limit response and grows back by one
+    request per `limit` successful ones.
+    """
+
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max_concurrency
+        self.limit = float(max_concurrency)
+        self.active = 0
+        self.condition = threading.Condition()
+
+    def __enter__(self):
+        with self.condition:
+            while self.active >= int(self.limit):
+                self.condition.wait()
+            self.active += 1
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        with self.condition:
+            self.active -= 1
+            if exc_type is not None and issubclass(exc_type, RateLimitError):
+                self.limit = max(1.0, self.limit / 2)
+            elif exc_type is None:
+                self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+            self.condition.notify_all()
 
 
 class OpenaiProbabilityEstimator(EstimationLanguageModel):
-    def __init__(self, api_key: str = None, model_name: str = "davinci-002"):
+    def __init__(self, api_key: str = None, model_name: str = "davinci-002", base_url: Optional[str] = None,
+                 batch_size: int = 16, max_concurrency: int = 4, max_retries: int = 8, backoff: float = 1.0):
+        """
+        :param api_key: OpenAI key, OPENAI_API_KEY environment variable takes precedence
+        :param model_name: completion model to score texts with
+        :param base_url: alternative API url, e.g. of a local server
+        :param batch_size: number of prompts sent in one completions request
+        :param max_concurrency: maximal number of requests in flight
+        :param max_retries: number of retries of rate limited or failed request
+        :param backoff: initial delay between retries in seconds, doubled on every retry
+        """
         self.api_key = api_key
-        self.openai = OpenAI(api_key=os.getenv('OPENAI_API_KEY', api_key))
         self.model_name = model_name
+        self.base_url = base_url
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        # Single client keeps one pool of connections for all threads, retries are handled by the estimator.
+        self.openai = OpenAI(api_key=os.getenv('OPENAI_API_KEY', api_key), base_url=base_url, max_retries=0)
+        self.limiter = AdaptiveLimiter(max_concurrency)
 
     def get_text_log_proba(self, text: str) -> Tuple[List[str], np.array]:
-        response = self.openai.completions.create(
-            model=self.model_name,
-            prompt="<|endoftext|>" + text,
-            max_tokens=0,
-            echo=True,
-            logprobs=1,
-        )
+        return self._request([text])[0]
+
+    def get_text_log_proba_batch(self, texts: List[str]) -> List[Tuple[List[str], np.array]]:
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        with ThreadPoolExecutor(self.max_concurrency) as pool:
+            return [result for batch in pool.map(self._request, batches) for result in batch]
+
+    def _request(self, texts: List[str]) -> List[Tuple[List[str], np.array]]:
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self.limiter:
+                    response = self.openai.completions.create(
+                        model=self.model_name,
+                        prompt=["<|endoftext|>" + text for text in texts],
+                        max_tokens=0,
+                        echo=True,
+                        logprobs=1,
+                    )
+                break
+            except (RateLimitError, APIConnectionError, InternalServerError) as e:
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(self._retry_delay(e, attempt))
+
+        choices = sorted(response.choices, key=lambda choice: choice.index)
+        return [(choice.logprobs.tokens[1:], np.array(choice.logprobs.token_logprobs[1:])) for choice in choices]
 
-        return response.choices[0].logprobs.tokens[1:], np.array(response.choices[0].logprobs.token_logprobs[1:])
+    def _retry_delay(self, error: Exception, attempt: int) -> float:
+        retry_after = None
+        if isinstance(error, RateLimitError):
+            retry_after = error.response.headers.get('retry-after')
+        if retry_after is not None:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return self.backoff * 2 ** attempt * (1 + random.random())
 
     def __reduce__(self):
-        return self.__class__, (self.api_key, self.model_name)
+        return self.__class__, (self.api_key, self.model_name, self.base_url, self.batch_size, self.max_concurrency,
+                                self.max_retries, self.backoff)
@@ -0,0 +1,229 @@
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+TOKEN_BITS = 21
+TOKEN_MASK = (1 << TOKEN_BITS) - 1
+MAX_ORDER = 3
+
+
+def pack_ngrams(tokens: Sequence[int], order: int) -> np.ndarray:
+    """
+    Packs every contiguous n-gram of the token sequence into a single int64 key. Each token occupies TOKEN_BITS bits,
+    the first token of the n-gram being the most significant one.
+    :param tokens: sequence of token ids
+    :param order: n-gram order, at most MAX_ORDER
+    :return: array of len(tokens) - order + 1 packed keys
+    """
+    if order > MAX_ORDER:
+        raise Exception(f"Only n-grams up to order {MAX_ORDER} can be packed, got {order}.")
+    tokens = np.asarray(tokens, dtype=np.int64)
+    if len(tokens) and (tokens.min() < 0 or tokens.max() > TOKEN_MASK):
+        raise Exception(f"Token ids should be in range [0, {TOKEN_MASK}].")
+
+    n = len(tokens) - order + 1
+    if n <= 0:
+        return np.empty(0, dtype=np.int64)
+
+    keys = tokens[:n].copy()
+    for i in range(1, order):
+        keys = (keys << TOKEN_BITS) | tokens[i:i + n]
+    return keys
+
+
+def suffix_keys(keys: np.ndarray, order: int) -> np.ndarray:
+    """
+    Drops the first token of every packed n-gram key.
+    :param keys: packed n-gram keys
+    :param order: order of the resulting (n-1)-grams
+    :return: packed keys of the n-gram suffixes
+    """
+    return keys & ((1 << (TOKEN_BITS * order)) - 1)
+
+
+class NgramTable:
+    """
+    Compact table mapping packed n-gram keys to values, e.g. counts or log-probabilities. Keys are kept sorted and
+    unique, so lookups are a single vectorized binary search.
+    """
+
+    def __init__(self, keys: np.ndarray, values: np.ndarray):
+        self.keys = keys
+        self.values = values
+
+    @classmethod
+    def from_keys(cls, keys: np.ndarray) -> 'NgramTable':
+        """
+        Builds table counting occurrences of every key.
+        :param keys: packed n-gram keys, possibly repeated
+        :return: table of unique keys and their counts
+        """
+        keys, counts = np.unique(np.asarray(keys, dtype=np.int64), return_counts=True)
+        return cls(keys, counts.astype(np.int64))
+
+    @classmethod
+    def from_counts(cls, counts: dict) -> 'NgramTable':
+        """
+        Builds table from mapping of token tuples (or single tokens) to their counts.
+        :param counts: mapping such as nltk.FreqDist
+        :return: equivalent table
+        """
+        if not counts:
+            return cls(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+        ngrams = np.array([key if isinstance(key, tuple) else (key,) for key in counts.keys()], dtype=np.int64)
+        keys = ngrams[:, 0]
+        for i in range(1, ngrams.shape[1]):
+            keys = (keys << TOKEN_BITS) | ngrams[:, i]
+        values = np.fromiter(counts.values(), dtype=np.int64, count=len(counts))
+        permutation = np.argsort(keys)
+        return cls(keys[permutation], values[permutation])
+
+    def find(self, keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Locates the given keys in the table.
+        :param keys: packed n-gram keys
+        :return: tuple of positions in the table and boolean mask of keys that were found
+        """
+        keys = np.asarray(keys, dtype=np.int64)
+        if len(self.keys) == 0:
+            return np.zeros(keys.shape, dtype=np.int64), np.zeros(keys.shape, dtype=bool)
+        idx = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        return idx, self.keys[idx] == keys
+
+    def lookup(self, keys: np.ndarray, default=0) -> np.ndarray:
+        """
+        Returns values for the given keys.
+        :param keys: packed n-gram keys
+        :param default: value for keys that are missing from the table
+        :return: array of values of the same shape as keys
+        """
+        idx, found = self.find(keys)
+        if len(self.keys) == 0:
+            return np.full(found.shape, default, dtype=self.values.dtype)
+        return np.where(found, self.values[idx], default)
+
+    def select(self, mask: np.ndarray, values: np.ndarray = None) -> 'NgramTable':
+        """
+        Builds table from subset of keys, optionally replacing the values.
+        :param mask: boolean mask of keys to keep
+        :param values: new values aligned with the current keys, defaults to the current values
+        :return: new table
+        """
+        if values is None:
+            values = self.values
+        return NgramTable(self.keys[mask], values[mask])
+
+    def total(self) -> int:
+        return int(self.values.sum())
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def nbytes(self) -> int:
+        return self.keys.nbytes + self.values.nbytes
+
+
+def gather(values: np.ndarray, ids: np.ndarray, default) -> np.ndarray:
+    """
+    Indexes dense per-token array, returning default for ids outside of it.
+    :param values: array indexed by token id
+    :param ids: token ids
+    :param default: value for ids that are out of range
+    :return: array of the same shape as ids
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    if len(values) == 0:
+        return np.full(ids.shape, default, dtype=values.dtype)
+    inside = ids < len(values)
+    return np.where(inside, values[np.where(inside, ids, 0)], default)
+
+
+def merge_tables(left: NgramTable, right: NgramTable) -> NgramTable:
+    """
+    Sums two count tables.
+    :param left: count table
+    :param right: count table
+    :return: table with union of the keys and summed counts
+    """
+    keys, inverse = np.unique(np.concatenate([left.keys, right.keys]), return_inverse=True)
+    counts = np.bincount(inverse, weights=np.concatenate([left.values, right.values]), minlength=len(keys))
+    return NgramTable(keys, counts.astype(np.int64))
+
+
+class NgramCounts:
+    """
+    Partial n-gram counts of contiguous piece of token stream. Partial counts of adjacent pieces can be merged, which
+    gives exactly the counts of the concatenated stream, so corpus can be counted in chunks and in parallel.
+    """
+
+    def __init__(self, tables: List[NgramTable], head: List[int], tail: List[int]):
+        self.tables = tables
+        self.head = head
+        self.tail = tail
+
+    @classmethod
+    def from_tokens(cls, tokens: Sequence[int], max_order: int) -> 'NgramCounts':
+        """
+        Counts all n-grams of orders 1..max_order.
+        :param tokens: token ids
+        :param max_order: the highest n-gram order to count
+        :return: partial counts
+        """
+        tokens = np.asarray(tokens, dtype=np.int64)
+        tables = [NgramTable.from_keys(pack_ngrams(tokens, order)) for order in range(1, max_order + 1)]
+        return cls(tables, tokens[:max_order - 1].tolist(), tokens[max(len(tokens) - max_order + 1, 0):].tolist())
+
+    @property
+    def max_order(self) -> int:
+        return len(self.tables)
+
+    def merge(self, other: 'NgramCounts') -> 'NgramCounts':
+        """
+        Merges counts of the piece of stream that immediately follows this one.
+        :param other: counts of the next piece
+        :return: counts of both pieces concatenated, including n-grams that cross the boundary
+        """
+        tables = [merge_tables(a, b) for a, b in zip(self.tables, other.tables)]
+
+        boundary = np.asarray(self.tail + other.head, dtype=np.int64)
+        for order in range(2, self.max_order + 1):
+            # Only n-grams that start in this piece and end in the other one are missing.
+            first = max(len(self.tail) - order + 1, 0)
+            last = min(len(self.tail), len(boundary) - order + 1)
+            if first < last:
+                crossing = pack_ngrams(boundary[first:last + order - 1], order)
+                tables[order - 1] = merge_tables(tables[order - 1], NgramTable.from_keys(crossing))
+
+        keep = self.max_order - 1
+        head = self.head if len(self.head) >= keep else (self.head + other.head)[:keep]
+        tail = other.tail if len(other.tail) >= keep else (self.tail + other.tail)[max(len(boundary) - keep, 0):]
+        return NgramCounts(tables, head, tail)
+
+    @property
+    def size(self) -> int:
+        return sum(len(table) for table in self.tables)
+
+
+class NgramCounter:
+    """
+    Accumulates partial counts of consecutive stream pieces. Adjacent partials of similar size are merged eagerly,
+    so every n-gram takes part in logarithmic number of merges.
+    """
+
+    def __init__(self):
+        self.stack: List[NgramCounts] = []
+
+    def add(self, counts: NgramCounts) -> None:
+        self.stack.append(counts)
+        while len(self.stack) > 1 and self.stack[-2].size <= 2 * self.stack[-1].size:
+            right = self.stack.pop()
+            self.stack[-1] = self.stack[-1].merge(right)
+
+    def result(self) -> NgramCounts:
+        if not self.stack:
+            raise Exception("No counts were added.")
+        while len(self.stack) > 1:
+            right = self.stack.pop()
+            self.stack[-1] = self.stack[-1].merge(right)
+        return self.stack[0]
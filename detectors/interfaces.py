@@ -1,3 +1,4 @@
+from concurrent.futures import Future
 from typing import Optional, Dict, Union, List, Tuple
 from uuid import uuid4
 
@@ -38,6 +39,15 @@ class IDetector:
         """
         pass
 
+    def load_weights_from_path(self, path: str) -> None:
+        """
+        Loads weights from file with content created by `store_weights`. Detectors that can map the file instead of
+        reading it into memory should override it.
+        :param path: path to the weights file
+        """
+        with open(path, 'rb') as f:
+            self.load_weights(f.read())
+
 
 class Nexus:
     def load_run_weights(self, run_id: uuid4) -> bytes:
@@ -50,6 +60,16 @@ class Nexus:
         """
         pass
 
+    def load_run_weights_path(self, run_id: uuid4) -> Optional[str]:
+        """
+        Same as `load_run_weights`, but returns path to the local file with the weights instead of reading it, so
+        detectors can map it. Blocks until action is completed.
+        :param run_id: UUID of the run
+        :return: path to the weights file, None if the nexus does not keep weights in local files
+        :throws: Exception in case run is unknown for the remote or other inconsistency
+        """
+        return None
+
     def store_run_weights(self, run_id: uuid4, content: bytes):
         """
         Stores content corresponding to run run_id to the remote nexus. Blocks until action is completed.
@@ -73,6 +93,20 @@ class TrainingNexus:
         """
         pass
 
+    def conclude_run_async(self, run_id: uuid4, conclusion: Conclusion,
+                           extra_data: Optional[Dict[str, Union[float, List[float]]]]) -> Future:
+        """
+        Same as `conclude_run`, but returns without waiting for the upload. Nexuses that can upload in background
+        should override it.
+        :return: future that completes once the conclusion is persisted
+        """
+        future = Future()
+        try:
+            future.set_result(self.conclude_run(run_id, conclusion, extra_data))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
 
 class CompletionLanguageModel:
     def complete_text(self, prefix: str, predict_log_proba: bool) -> Union[List[str], Tuple[List[str], np.array]]:
@@ -93,3 +127,11 @@ class EstimationLanguageModel:
         :return: Tuple of text split in model's tokens and np.array representing probabilities of corresponding tokens.
         """
         pass
+
+    def get_text_log_proba_batch(self, texts: List[str]) -> List[Tuple[List[str], np.array]]:
+        """
+        Returns log token probabilities for every text. Models that can score several texts at once should override it.
+        :param texts: input texts
+        :return: list of results of `get_text_log_proba` in the same order as texts.
+        """
+        return [self.get_text_log_proba(text) for text in texts]
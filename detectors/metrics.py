@@ -1,8 +1,9 @@
 
+from concurrent.futures import Future
 from dataclasses import dataclass
-from typing import List
+from typing import Dict, List
 
-from matplotlib import pyplot as plt
+import numpy as np
 
 
 @dataclass
@@ -18,8 +19,28 @@ class ClassificationMetrics:
 
 @dataclass
 class ClassificationRepresentations:
-    roc_curve: plt.Figure
-    clf_report: plt.Figure
+    """
+    Data of classification charts. Charts are rendered to PNG only when they are needed, e.g. on upload.
+    """
+    fpr: np.ndarray
+    tpr: np.ndarray
+    auc: float
+    confusion: np.ndarray
+
+    def render(self) -> Dict[str, bytes]:
+        """
+        :return: PNG bytes of 'roc_curve' and 'clf_report' charts
+        """
+        from detectors.utils.charts import render_representations
+        return render_representations(self)
+
+    def render_async(self) -> Future:
+        """
+        Renders charts in a background process.
+        :return: future of the result of `render`
+        """
+        from detectors.utils.charts import render_in_background
+        return render_in_background(self)
 
 
 @dataclass
@@ -0,0 +1,106 @@
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+from detectors.utils.loading import lazy_import
+
+
+@dataclass(frozen=True)
+class BackendConfig:
+    """
+    Describes how causal language model is loaded for inference.
+    :param device: 'cuda', 'cpu' or 'auto' that picks cuda when available
+    :param dtype: weights dtype, defaults to float16 on GPU and float32 on CPU, where float16 is slow or unsupported
+    :param quantize: apply int8 dynamic quantization to linear layers (CPU only)
+    :param compile: wrap model with torch.compile
+    :param onnx: export model to ONNX and run it with ONNX Runtime (CPU only, requires optimum[onnxruntime])
+    :param num_threads: number of intra-op threads, defaults to torch's choice
+    """
+    device: str = 'auto'
+    dtype: Optional[str] = None
+    quantize: bool = False
+    compile: bool = False
+    onnx: bool = False
+    num_threads: Optional[int] = None
+
+    @classmethod
+    def from_env(cls) -> 'BackendConfig':
+        """
+        Reads config from LLM_DEVICE, LLM_DTYPE, LLM_QUANTIZE, LLM_COMPILE, LLM_ONNX and LLM_NUM_THREADS environment
+        variables.
+        """
+        flag = lambda name: os.getenv(name, 'false').lower() in ('1', 'true', 'yes')
+        num_threads = os.getenv('LLM_NUM_THREADS')
+        return cls(device=os.getenv('LLM_DEVICE', 'auto'),
+                   dtype=os.getenv('LLM_DTYPE'),
+                   quantize=flag('LLM_QUANTIZE'),
+                   compile=flag('LLM_COMPILE'),
+                   onnx=flag('LLM_ONNX'),
+                   num_threads=int(num_threads) if num_threads else None)
+
+    def resolve_device(self) -> str:
+        if self.device == 'auto':
+            return 'cuda' if lazy_import('torch').cuda.is_available() else 'cpu'
+        return self.device
+
+    def resolve_dtype(self) -> str:
+        if self.dtype is not None:
+            return self.dtype
+        return 'float16' if self.resolve_device() == 'cuda' else 'float32'
+
+    def numerics(self) -> str:
+        """
+        :return: description of settings that change computed values, devices and threads only change speed
+        """
+        return f'dtype={self.resolve_dtype()}|quantize={self.quantize}|onnx={self.onnx}'
+
+
+def _load_pretrained(auto_class: str, ort_class: str, model_handle: str, config: BackendConfig, **ort_kwargs):
+    torch = lazy_import('torch')
+
+    device = config.resolve_device()
+    if (config.quantize or config.onnx) and device != 'cpu':
+        raise Exception("Quantized and ONNX backends are only supported on CPU.")
+    if config.num_threads is not None:
+        torch.set_num_threads(config.num_threads)
+
+    if config.onnx:
+        import onnxruntime
+        from optimum import onnxruntime as ort
+
+        options = onnxruntime.SessionOptions()
+        if config.num_threads is not None:
+            options.intra_op_num_threads = config.num_threads
+        return getattr(ort, ort_class).from_pretrained(model_handle, export=True, session_options=options,
+                                                        **ort_kwargs)
+
+    model = lazy_import('transformers', auto_class).from_pretrained(model_handle,
+                                                                    torch_dtype=getattr(torch, config.resolve_dtype()),
+                                                                    device_map='auto' if device == 'cuda' else None)
+    model.eval()
+    if config.quantize:
+        model = torch.ao.quantization.quantize_dynamic(model.float(), {torch.nn.Linear}, dtype=torch.qint8)
+    if config.compile:
+        model = torch.compile(model)
+    return model
+
+
+def load_causal_lm(model_handle: str, config: BackendConfig):
+    """
+    Loads causal language model for inference with the given backend.
+    :param model_handle: HF handle or local path of the model
+    :param config: backend configuration
+    :return: model callable with input_ids and attention_mask, exposing `device` and `config`
+    """
+    return _load_pretrained('AutoModelForCausalLM', 'ORTModelForCausalLM', model_handle, config, use_cache=False)
+
+
+def load_sequence_classifier(model_handle: str, config: BackendConfig):
+    """
+    Loads sequence classification model for inference with the given backend.
+    :param model_handle: HF handle or local path of the model
+    :param config: backend configuration
+    :return: model callable with input_ids and attention_mask, exposing `device` and `config`
+    """
+    return _load_pretrained('AutoModelForSequenceClassification', 'ORTModelForSequenceClassification', model_handle,
+                            config)
@@ -0,0 +1,188 @@
+import hashlib
+import json
+import os
+import pathlib
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from detectors.interfaces import EstimationLanguageModel
+
+DEFAULT_MAX_BYTES = 4 * 1024 ** 3
+ACCESS_FLUSH_INTERVAL = 60.0
+MAX_PENDING_ACCESSES = 10000
+
+
+class LogProbCache:
+    """
+    Persistent SQLite store of per-token log-probabilities. Entries are keyed by model handle, tokenizer handle and hash
+    of the text, log-probabilities are stored as raw float32 blobs. Least recently used entries are evicted once
+    the stored size exceeds max_bytes. Total size is kept in a metadata row, and access times of hits are written in
+    batches at most once per access_flush_interval seconds, so reads do not write to the shared database.
+    """
+
+    def __init__(self, path: str, max_bytes: int = DEFAULT_MAX_BYTES,
+                 access_flush_interval: float = ACCESS_FLUSH_INTERVAL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.access_flush_interval = access_flush_interval
+        self.lock = threading.Lock()
+        self.connection = None
+        self.accessed: Dict[str, float] = {}
+        self.flushed = time.monotonic()
+
+    @classmethod
+    def from_env(cls) -> Optional['LogProbCache']:
+        """
+        Creates cache configured by LOGPROB_CACHE_PATH and LOGPROB_CACHE_MAX_BYTES environment variables.
+        :return: cache or None if LOGPROB_CACHE_PATH is not set
+        """
+        path = os.getenv('LOGPROB_CACHE_PATH')
+        if path is None:
+            return None
+        return cls(path, int(os.getenv('LOGPROB_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)))
+
+    @staticmethod
+    def make_key(model_handle: str, tokenizer_handle: str, text: str) -> str:
+        digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        return f'{model_handle}\0{tokenizer_handle}\0{digest}'
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.connection is None:
+            pathlib.Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            self.connection = sqlite3.connect(self.path, check_same_thread=False, timeout=60)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS logprobs (key TEXT PRIMARY KEY, tokens TEXT NOT NULL, '
+                                    'logprobs BLOB NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS logprobs_accessed ON logprobs (accessed)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+            # Databases created before the metadata row are measured once.
+            self.connection.execute("INSERT OR IGNORE INTO meta SELECT 'size', COALESCE(SUM(size), 0) FROM logprobs")
+            self.connection.commit()
+        return self.connection
+
+    @staticmethod
+    def _size(connection: sqlite3.Connection) -> int:
+        return connection.execute("SELECT value FROM meta WHERE name = 'size'").fetchone()[0]
+
+    def _flush_accessed(self, connection: sqlite3.Connection) -> None:
+        if self.accessed:
+            connection.executemany('UPDATE logprobs SET accessed = ? WHERE key = ?',
+                                   [(accessed, key) for key, accessed in self.accessed.items()])
+        self.accessed = {}
+        self.flushed = time.monotonic()
+
+    def get_many(self, keys: List[str]) -> List[Optional[Tuple[List, np.array]]]:
+        """
+        :param keys: keys created by `make_key`
+        :return: cached (tokens, log-probabilities) for every key, None for missing ones
+        """
+        with self.lock:
+            connection = self._connect()
+            found = {}
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows = connection.execute(
+                    f'SELECT key, tokens, logprobs FROM logprobs WHERE key IN ({",".join("?" * len(chunk))})', chunk)
+                found.update({key: (json.loads(tokens), np.frombuffer(blob, dtype=np.float32).astype(np.float64))
+                              for key, tokens, blob in rows})
+            now = time.time()
+            self.accessed.update((key, now) for key in found)
+            if self.accessed and (time.monotonic() - self.flushed >= self.access_flush_interval
+                                  or len(self.accessed) >= MAX_PENDING_ACCESSES):
+                self._flush_accessed(connection)
+                connection.commit()
+        return [found.get(key) for key in keys]
+
+    def put_many(self, entries: List[Tuple[str, List, np.array]]) -> None:
+        """
+        Stores entries and evicts least recently used ones if cache grew over its size.
+        :param entries: tuples of key, tokens and log-probabilities
+        """
+        rows = []
+        for key, tokens, logprobs in entries:
+            tokens = json.dumps(list(tokens))
+            blob = np.asarray(logprobs, dtype=np.float32).tobytes()
+            rows.append((key, tokens, blob, len(key) + len(tokens) + len(blob), time.time()))
+        # Duplicate keys would be counted twice in the total size.
+        rows = list({row[0]: row for row in rows}.values())
+
+        with self.lock:
+            connection = self._connect()
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                keys = [row[0] for row in rows]
+                replaced = 0
+                for i in range(0, len(keys), 500):
+                    chunk = keys[i:i + 500]
+                    replaced += connection.execute(f'SELECT COALESCE(SUM(size), 0) FROM logprobs WHERE key IN '
+                                                   f'({",".join("?" * len(chunk))})', chunk).fetchone()[0]
+                connection.executemany('INSERT OR REPLACE INTO logprobs VALUES (?, ?, ?, ?, ?)', rows)
+                total = self._size(connection) + sum(row[3] for row in rows) - replaced
+                if total > self.max_bytes:
+                    # Eviction order should reflect recent hits.
+                    self._flush_accessed(connection)
+                    total -= self._evict(connection, total - self.max_bytes)
+                connection.execute("UPDATE meta SET value = ? WHERE name = 'size'", (total,))
+                connection.commit()
+            except BaseException:
+                connection.rollback()
+                raise
+
+    @staticmethod
+    def _evict(connection: sqlite3.Connection, excess: int) -> int:
+        freed = 0
+        evicted = []
+        for key, size in connection.execute('SELECT key, size FROM logprobs ORDER BY accessed'):
+            if freed >= excess:
+                break
+            evicted.append((key,))
+            freed += size
+        connection.executemany('DELETE FROM logprobs WHERE key = ?', evicted)
+        return freed
+
+    def __getstate__(self):
+        return {'path': self.path, 'max_bytes': self.max_bytes, 'access_flush_interval': self.access_flush_interval}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+
+class CachedEstimationLanguageModel(EstimationLanguageModel):
+    """
+    Wraps any estimator with persistent cache, so every text is scored by the wrapped model only once.
+    Log-probabilities are returned with float32 precision whether they come from cache or not.
+    """
+
+    def __init__(self, model: EstimationLanguageModel, cache: LogProbCache, model_handle: Optional[str] = None,
+                 tokenizer_handle: Optional[str] = None):
+        """
+        :param model: estimator to wrap
+        :param cache: cache to store results in
+        :param model_handle: identity of the model in cache, defaults to model's `cache_identity`, `model_name` or its
+        class name
+        :param tokenizer_handle: identity of the tokenizer in cache, defaults to model's `tokenizer_handle`
+        """
+        self.model = model
+        self.cache = cache
+        self.model_handle = (model_handle or getattr(model, 'cache_identity', None) or getattr(model, 'model_name', None)
+                             or type(model).__name__)
+        self.tokenizer_handle = tokenizer_handle or getattr(model, 'tokenizer_handle', None) or ''
+
+    def get_text_log_proba(self, text: str) -> Tuple[List[str], np.array]:
+        return self.get_text_log_proba_batch([text])[0]
+
+    def get_text_log_proba_batch(self, texts: List[str]) -> List[Tuple[List[str], np.array]]:
+        keys = [LogProbCache.make_key(self.model_handle, self.tokenizer_handle, text) for text in texts]
+        results = self.cache.get_many(keys)
+
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            computed = self.model.get_text_log_proba_batch([texts[i] for i in missing])
+            self.cache.put_many([(keys[i], tokens, logprobs) for i, (tokens, logprobs) in zip(missing, computed)])
+            for i, (tokens, logprobs) in zip(missing, computed):
+                results[i] = (tokens, np.asarray(logprobs, dtype=np.float32).astype(np.float64))
+        return results
@@ -0,0 +1,86 @@
+from typing import List, Optional, Tuple, TYPE_CHECKING
+
+import numpy as np
+
+from detectors.interfaces import EstimationLanguageModel
+from detectors.models.backends import BackendConfig
+from detectors.models.registry import acquire_model
+from detectors.models.scope import memoized_log_proba
+from detectors.utils.loading import lazy_import
+
+if TYPE_CHECKING:
+    from detectors.perplexity.engine import PerplexityEngine
+
+
+class HFProbabilityEstimator(EstimationLanguageModel):
+    """
+    Per-token log-probabilities from HF causal language model. The model is taken from the shared registry and scored
+    by batched `PerplexityEngine`. Inside `request_scope` results are memoized, so every detector using the same model
+    derives its score from a single forward pass over the text.
+    """
+
+    def __init__(self, model_handle: str, backend: Optional[BackendConfig] = None, window: Optional[int] = None,
+                 stride: Optional[int] = None, max_batch_tokens: int = 8192):
+        """
+        :param model_handle: HF handle or local path of the model
+        :param backend: how the model is loaded, defaults to configuration from environment variables
+        :param window: sliding window for long texts, defaults to model's context size
+        :param stride: stride of sliding window, defaults to half of the window
+        :param max_batch_tokens: upper bound of padded tokens in one forward pass
+        """
+        self.model_name = model_handle
+        self.tokenizer_handle = model_handle
+        self.backend = backend or BackendConfig.from_env()
+        self.window = window
+        self.stride = stride
+        self.max_batch_tokens = max_batch_tokens
+        self.lease = acquire_model(model_handle, self.backend)
+        self._engine = None
+
+    @property
+    def engine(self) -> 'PerplexityEngine':
+        if self._engine is None:
+            PerplexityEngine = lazy_import('detectors.perplexity.engine', 'PerplexityEngine')
+            self._engine = PerplexityEngine(self.lease.model, self.lease.tokenizer, window=self.window,
+                                            stride=self.stride, max_batch_tokens=self.max_batch_tokens)
+        return self._engine
+
+    @property
+    def cache_identity(self) -> str:
+        """
+        Identity of the model in persistent log-probability cache. Backend numerics and non-default sliding window
+        change log-probabilities, so they are a part of it.
+        """
+        identity = f'{self.model_name}|{self.backend.numerics()}'
+        if self.window is not None or self.stride is not None:
+            identity = f'{identity}|window={self.window}|stride={self.stride}'
+        return identity
+
+    def memo_key(self) -> Tuple:
+        return self.model_name, self.backend, self.window, self.stride
+
+    def get_text_log_proba(self, text: str) -> Tuple[List[str], np.array]:
+        return self.get_text_log_proba_batch([text])[0]
+
+    def get_text_log_proba_batch(self, texts: List[str]) -> List[Tuple[List[str], np.array]]:
+        return memoized_log_proba(self.memo_key(), texts, self.engine.token_log_proba)
+
+    def release(self) -> None:
+        """
+        Releases the shared model.
+        """
+        if getattr(self, 'lease', None) is not None:
+            self.lease.release()
+        self.lease = None
+        self._engine = None
+
+    def __getstate__(self):
+        # Backend describes the machine, not the model, so it is resolved again where weights are loaded.
+        return {'model_handle': self.model_name, 'window': self.window, 'stride': self.stride,
+                'max_batch_tokens': self.max_batch_tokens}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def __del__(self):
+        self.release()
@@ -0,0 +1,100 @@
+import logging
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from detectors.models.backends import BackendConfig, load_causal_lm
+from detectors.models.tokenizers import get_tokenizer
+
+
+class _Entry:
+    def __init__(self):
+        self.references = 0
+        self.model = None
+        self.lock = threading.Lock()
+
+
+class ModelLease:
+    """
+    Reference to language model held in registry. The model is loaded on first access and is shared by all leases
+    with the same handle and backend. Release the lease once it is not needed, the model is unloaded when the last
+    lease is released.
+    """
+
+    def __init__(self, registry: 'ModelRegistry', handle: str, backend: BackendConfig):
+        self.registry = registry
+        self.handle = handle
+        self.backend = backend
+        self.released = False
+
+    @property
+    def model(self):
+        if self.released:
+            raise Exception(f"Lease of {self.handle} was already released.")
+        return self.registry.get_model(self.handle, self.backend)
+
+    @property
+    def tokenizer(self):
+        return get_tokenizer(self.handle)
+
+    def release(self) -> None:
+        if not self.released:
+            self.released = True
+            self.registry.release(self.handle, self.backend)
+
+
+class ModelRegistry:
+    """
+    Process-wide, reference counted storage of causal language models keyed by handle and backend (device, dtype,
+    quantization...). Detectors and estimators that use the same base model share one copy of its weights.
+    """
+
+    def __init__(self):
+        self.entries: Dict[Tuple[str, BackendConfig], _Entry] = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, handle: str, backend: Optional[BackendConfig] = None) -> ModelLease:
+        """
+        Registers usage of the model, without loading it yet.
+        :param handle: HF handle or local path of the model
+        :param backend: backend to load the model with, defaults to configuration from environment variables
+        :return: lease giving access to the model
+        """
+        backend = backend or BackendConfig.from_env()
+        with self.lock:
+            self.entries.setdefault((handle, backend), _Entry()).references += 1
+        return ModelLease(self, handle, backend)
+
+    def get_model(self, handle: str, backend: BackendConfig) -> Any:
+        with self.lock:
+            entry = self.entries.get((handle, backend))
+        if entry is None:
+            raise Exception(f"Model {handle} is not acquired.")
+        with entry.lock:
+            if entry.model is None:
+                logging.info(f"Loading model {handle} with {backend}.")
+                entry.model = load_causal_lm(handle, backend)
+            return entry.model
+
+    def release(self, handle: str, backend: BackendConfig) -> None:
+        with self.lock:
+            entry = self.entries[(handle, backend)]
+            entry.references -= 1
+            if entry.references == 0:
+                del self.entries[(handle, backend)]
+
+    def loaded(self) -> Dict[Tuple[str, BackendConfig], int]:
+        """
+        :return: number of references of every loaded model
+        """
+        with self.lock:
+            return {key: entry.references for key, entry in self.entries.items() if entry.model is not None}
+
+
+registry = ModelRegistry()
+
+
+def acquire_model(handle: str, backend: Optional[BackendConfig] = None) -> ModelLease:
+    """
+    Acquires model from the process-wide registry.
+    """
+    return registry.acquire(handle, backend)
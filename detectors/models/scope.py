@@ -0,0 +1,48 @@
+import contextlib
+import contextvars
+from typing import Callable, Dict, Hashable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+_memo: contextvars.ContextVar[Optional[Dict]] = contextvars.ContextVar('request_memo', default=None)
+
+
+@contextlib.contextmanager
+def request_scope() -> Iterator[Dict]:
+    """
+    Scope of one request. Inside it, log-probabilities of every text are computed at most once per model, so several
+    detectors built on the same language model share one forward pass. Results are dropped on scope exit.
+    Nested scopes reuse the outer one.
+    """
+    memo = _memo.get()
+    if memo is not None:
+        yield memo
+        return
+    token = _memo.set({})
+    try:
+        yield _memo.get()
+    finally:
+        _memo.reset(token)
+
+
+def memoized_log_proba(model_key: Hashable, texts: List[str],
+                       compute: Callable[[List[str]], List[Tuple[List[str], np.array]]]) \
+        -> List[Tuple[List[str], np.array]]:
+    """
+    Returns log-probabilities of texts, computing only those that were not computed in the current request scope.
+    Outside of request scope everything is computed.
+    :param model_key: identity of the model, estimators with equal keys share results
+    :param texts: input texts
+    :param compute: batched computation of log-probabilities of the missing texts
+    :return: list of (tokens, log-probabilities) in the same order as texts
+    """
+    memo = _memo.get()
+    if memo is None:
+        return compute(texts)
+
+    keys = [(model_key, text) for text in texts]
+    missing = list(dict.fromkeys(text for key, text in zip(keys, texts) if key not in memo))
+    if missing:
+        for text, result in zip(missing, compute(missing)):
+            memo[(model_key, text)] = result
+    return [memo[key] for key in keys]
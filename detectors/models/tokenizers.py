@@ -0,0 +1,67 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List
+
+from detectors.utils.loading import lazy_import
+
+TOKENIZATION_CACHE_SIZE = 16
+
+_tokenizers: Dict[str, Any] = {}
+_tokenizations: OrderedDict = OrderedDict()
+_lock = threading.Lock()
+
+
+def register_tokenizer(handle: str, tokenizer: Any) -> Any:
+    """
+    Registers already loaded tokenizer under the handle, unless some tokenizer is registered there already.
+    :param handle: tokenizer handle
+    :param tokenizer: tokenizer instance
+    :return: tokenizer that is registered under the handle
+    """
+    with _lock:
+        return _tokenizers.setdefault(handle, tokenizer)
+
+
+def get_tokenizer(handle: str) -> Any:
+    """
+    Returns process-wide tokenizer instance for the handle, loading it on first use.
+    :param handle: HF handle of the tokenizer
+    :return: tokenizer
+    """
+    tokenizer = _tokenizers.get(handle)
+    if tokenizer is None:
+        tokenizer = register_tokenizer(handle, lazy_import('transformers', 'AutoTokenizer').from_pretrained(handle))
+    return tokenizer
+
+
+def tokenize(handle: str, text: str) -> List[int]:
+    """
+    Tokenizes text without special tokens. Several recent results are memoized, so all estimators that share the
+    tokenizer tokenize the text of a request only once. Returned list is shared and should not be modified.
+    :param handle: tokenizer handle
+    :param text: input text
+    :return: token ids
+    """
+    key = (handle, text)
+    with _lock:
+        if key in _tokenizations:
+            _tokenizations.move_to_end(key)
+            return _tokenizations[key]
+
+    tokens = get_tokenizer(handle)(text, add_special_tokens=False)['input_ids']
+
+    with _lock:
+        _tokenizations[key] = tokens
+        while len(_tokenizations) > TOKENIZATION_CACHE_SIZE:
+            _tokenizations.popitem(last=False)
+    return tokens
+
+
+def tokenize_batch(handle: str, texts: List[str]) -> List[List[int]]:
+    """
+    Tokenizes texts the same way as `tokenize`, in one batched call and without memoization.
+    :param handle: tokenizer handle
+    :param texts: input texts
+    :return: token ids of every text
+    """
+    return get_tokenizer(handle)(texts, add_special_tokens=False)['input_ids']
@@ -0,0 +1,41 @@
+import pathlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional, Dict
+from uuid import uuid4
+
+from detectors.interfaces import Nexus, TrainingNexus
+from detectors.metrics import Conclusion
+from detectors.neptune.upload import LocalArtifactStore, upload_conclusion
+
+
+class MockNexus(Nexus, TrainingNexus):
+    """
+    Stand-in for remote nexus, that keeps every run in its own subdirectory of a local directory.
+    """
+
+    def __init__(self, directory: str = './cache/nexus', max_workers: int = 4):
+        self.directory = pathlib.Path(directory)
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def run_directory(self, run_id: uuid4) -> pathlib.Path:
+        return self.directory.joinpath(str(run_id))
+
+    def load_run_weights_path(self, run_id: uuid4) -> str:
+        path = self.run_directory(run_id).joinpath('checkpoint.pkl')
+        if not path.exists():
+            raise Exception(f"Run for name {run_id} was not found.")
+        return str(path)
+
+    def load_run_weights(self, run_id: uuid4) -> bytes:
+        return pathlib.Path(self.load_run_weights_path(run_id)).read_bytes()
+
+    def store_run_weights(self, run_id: uuid4, content: bytes):
+        LocalArtifactStore(str(self.run_directory(run_id))).upload('checkpoint', [content], 'pkl')
+
+    def conclude_run(self, run_id: uuid4, conclusion: Conclusion, extra_data: Optional[Dict] = None):
+        self.conclude_run_async(run_id, conclusion, extra_data).result()
+
+    def conclude_run_async(self, run_id: uuid4, conclusion: Conclusion, extra_data: Optional[Dict] = None) -> Future:
+        return self.executor.submit(upload_conclusion, LocalArtifactStore(str(self.run_directory(run_id))),
+                                    conclusion, extra_data, self.max_workers)
@@ -1,14 +1,17 @@
+import json
+import os
 import pathlib
-from dataclasses import asdict
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from os import getenv
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 from uuid import uuid4
 
 import neptune
-from neptune.types import File
 
 from detectors.interfaces import Nexus, TrainingNexus
-from detectors.metrics import Conclusion, SplitConclusion
+from detectors.metrics import Conclusion
+from detectors.neptune.upload import NeptuneArtifactStore, upload_conclusion
 
 
 class NeptuneNexus(Nexus, TrainingNexus):
@@ -21,14 +24,77 @@ class NeptuneNexus(Nexus, TrainingNexus):
         pathlib.Path('./cache').mkdir(parents=True, exist_ok=True)
 
         self.proj = neptune.init_project(neptune_proj, api_token=self.neptune_token, mode='sync')
+        self.executor = None
+        self.run_index_path = pathlib.Path('./cache').joinpath(f'run-index-{neptune_proj.replace("/", "-")}.json')
+        self.run_index = None
+        # Runs that were missing after a refresh, they do not trigger further refreshes in this process.
+        self.run_index_misses = set()
+
+    def load_run_index(self) -> Dict[str, Optional[str]]:
+        if self.run_index is None:
+            self.run_index = {}
+            if self.run_index_path.exists():
+                self.run_index = json.loads(self.run_index_path.read_text())
+        return self.run_index
+
+    def refresh_run_index(self) -> Dict[str, Optional[str]]:
+        """
+        Fetches names and ids of all runs of the project in one query and stores them in ./cache. Runs never change
+        their id, so the index is only refreshed when it misses some run.
+        :return: map of run names to run ids, None for names shared by several runs
+        """
+        self.run_index = self._fetch_run_index()
+        self.store_run_index()
+        return self.run_index
+
+    def update_run_index(self, name: str) -> Optional[str]:
+        """
+        Fetches id of a single run by its name and adds it to the index, without listing the whole project.
+        :param name: name of the run
+        :return: id of the run, None if it is unknown or ambiguous
+        """
+        found = self._fetch_run_index(f'`sys/name`:string = "{name}"')
+        if name in found:
+            self.load_run_index()[name] = found[name]
+            self.store_run_index()
+        return found.get(name)
+
+    def _fetch_run_index(self, query: Optional[str] = None) -> Dict[str, Optional[str]]:
+        runs = self.proj.fetch_runs_table(query=query, columns=['sys/id', 'sys/name']).to_pandas()
+        index = {}
+        for name, run_id in zip(runs.get('sys/name', []), runs.get('sys/id', [])):
+            index[name] = None if name in index else run_id
+        return index
+
+    def store_run_index(self) -> None:
+        """
+        Writes the index to a temporary file that replaces it atomically, so concurrent workers never read a partial
+        index.
+        """
+        temporary = self.run_index_path.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+        temporary.write_text(json.dumps(self.run_index))
+        os.replace(temporary, self.run_index_path)
+
+    def get_run_ids(self, run_ids: List[uuid4]) -> Dict[str, Optional[str]]:
+        """
+        Resolves many runs at once, with at most one query to Neptune. A single missing run is queried by its name,
+        several missing runs refresh the whole index. Runs that are still unknown after the query are remembered, so
+        asking for them again does not query Neptune.
+        :param run_ids: UUIDs of runs
+        :return: map of string UUIDs to Neptune ids, None for unknown or ambiguous runs
+        """
+        names = [str(run_id) for run_id in run_ids]
+        index = self.load_run_index()
+        missing = {name for name in names if name not in index and name not in self.run_index_misses}
+        if len(missing) == 1:
+            self.update_run_index(next(iter(missing)))
+        elif missing:
+            index = self.refresh_run_index()
+        self.run_index_misses.update(name for name in missing if name not in index)
+        return {name: index.get(name) for name in names}
 
     def get_run_id(self, run_id: uuid4):
-        runs = self.proj.fetch_runs_table(query=f'`sys/name`:string CONTAINS "{str(run_id)}"').to_pandas()
-
-        if len(runs) != 1:
-            return None
-
-        return runs['sys/id'][0]
+        return self.get_run_ids([run_id])[str(run_id)]
 
     def get_run(self, run_id: uuid4):
         run_id = self.get_run_id(run_id)
@@ -40,39 +106,46 @@ class NeptuneNexus(Nexus, TrainingNexus):
     def get_or_create_run(self, run_id: uuid4):
         existing = self.get_run(run_id)
         if existing is None:
-            return neptune.init_run(name=str(run_id), project=self.neptune_proj, api_token=self.neptune_token,
-                                    mode='sync')
+            run = neptune.init_run(name=str(run_id), project=self.neptune_proj, api_token=self.neptune_token,
+                                   mode='sync')
+            # New run is added to the index directly, so it is never looked up in Neptune.
+            self.load_run_index()[str(run_id)] = run['sys/id'].fetch()
+            self.run_index_misses.discard(str(run_id))
+            self.store_run_index()
+            return run
         return existing
 
-    def load_run_weights(self, run_id: uuid4) -> bytes:
+    def load_run_weights_path(self, run_id: uuid4) -> str:
+        """
+        Downloads weights of the run into ./cache once, weights of a run never change. Download goes to a temporary
+        file that replaces the target atomically, so concurrent workers never see a partial file.
+        """
+        path = pathlib.Path('./cache').joinpath(f'weights-run-{run_id}.pkl')
+        if path.exists():
+            return str(path)
         run = self.get_run(run_id)
         if run is None:
             raise Exception(f"Run for name {run_id} was not found.")
-        pth = pathlib.Path('./cache').joinpath(f'weights-run-{run_id}.pkl')
-        run['checkpoint'].download(str(pth))
-        return open(str(pth), 'rb').read()
-
-    def conclude_run(self, run_id: uuid4, conclusion: Conclusion, extra_data: Optional[Dict] = None):
-        run = self.get_or_create_run(run_id)
-
-        for split, concl in zip(['train', 'validation'],
-                                [conclusion.train_conclusion, conclusion.validation_conclusion]):
-            concl: SplitConclusion
+        temporary = path.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+        run['checkpoint'].download(str(temporary))
+        os.replace(temporary, path)
+        return str(path)
 
-            for k, v in asdict(concl.metrics).items():
-                run[f'metrics/{split}/{k}'] = v
-
-            for k, v in asdict(concl.representations).items():
-                run[f'charts/{split}/{k}'].upload(v, wait=True)
-
-        run[f'sys/tags'].add(conclusion.detector_handle)
-        run[f'sys/tags'].add(conclusion.datasets)
-
-        run.wait()
-        run['checkpoint'].upload(File.from_content(conclusion.weights, extension='.pkl'), wait=True)
-
-        if extra_data is not None:
-            for key, value in extra_data.items():
-                run[key] = value
+    def load_run_weights(self, run_id: uuid4) -> bytes:
+        return pathlib.Path(self.load_run_weights_path(run_id)).read_bytes()
 
-        run.wait()
+    def conclude_run(self, run_id: uuid4, conclusion: Conclusion, extra_data: Optional[Dict] = None):
+        self.conclude_run_async(run_id, conclusion, extra_data).result()
+
+    def conclude_run_async(self, run_id: uuid4, conclusion: Conclusion, extra_data: Optional[Dict] = None,
+                           max_workers: int = 4) -> Future:
+        """
+        Queues upload of run conclusion. Artifacts are uploaded concurrently by at most max_workers threads, weights
+        are streamed in chunks.
+        :return: future that completes once everything is persisted
+        """
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=1)
+        return self.executor.submit(
+            lambda: upload_conclusion(NeptuneArtifactStore(self.get_or_create_run(run_id)), conclusion, extra_data,
+                                      max_workers))
@@ -0,0 +1,152 @@
+import json
+import os
+import pathlib
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+from dataclasses import asdict
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from detectors.metrics import Conclusion
+
+CHUNK_SIZE = 8 * 1024 ** 2
+
+
+class ArtifactStore:
+    """
+    Destination of run artifacts. Implementations should be safe to call from several threads.
+    """
+
+    def assign(self, key: str, value: Any) -> None:
+        """
+        Stores a scalar or a list of scalars under the key.
+        """
+        pass
+
+    def upload(self, key: str, chunks: Iterable[bytes], extension: str) -> None:
+        """
+        Stores file content, passed as a stream of chunks, under the key. Blocks until it is stored.
+        """
+        pass
+
+    def add_tags(self, tags: List[str]) -> None:
+        pass
+
+    def flush(self) -> None:
+        """
+        Blocks until everything stored so far is persisted.
+        """
+        pass
+
+
+class NeptuneArtifactStore(ArtifactStore):
+    def __init__(self, run):
+        self.run = run
+
+    def assign(self, key: str, value: Any) -> None:
+        self.run[key] = value
+
+    def upload(self, key: str, chunks: Iterable[bytes], extension: str) -> None:
+        from neptune.types import File
+
+        # Content is spooled to disk chunk by chunk, and Neptune client uploads the file from disk in parts.
+        with tempfile.NamedTemporaryFile(suffix=f'.{extension}', delete=False) as f:
+            for chunk in chunks:
+                f.write(chunk)
+        try:
+            self.run[key].upload(File(f.name), wait=True)
+        finally:
+            os.unlink(f.name)
+
+    def add_tags(self, tags: List[str]) -> None:
+        self.run['sys/tags'].add(tags)
+
+    def flush(self) -> None:
+        self.run.wait()
+
+
+class LocalArtifactStore(ArtifactStore):
+    """
+    Stores artifacts in a local directory: files under their keys and all values in values.json. Stand-in for remote
+    backends in tests and offline runs.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = pathlib.Path(directory)
+        self.values: Dict[str, Any] = {}
+        self.lock = threading.Lock()
+
+    def assign(self, key: str, value: Any) -> None:
+        with self.lock:
+            self.values[key] = value
+
+    def upload(self, key: str, chunks: Iterable[bytes], extension: str) -> None:
+        path = self.directory.joinpath(f'{key}.{extension}')
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+
+    def add_tags(self, tags: List[str]) -> None:
+        with self.lock:
+            self.values['sys/tags'] = sorted(set(self.values.get('sys/tags', [])) | set(tags))
+
+    def flush(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with self.lock:
+            content = json.dumps(self.values, default=lambda x: x.tolist() if hasattr(x, 'tolist') else str(x))
+        self.directory.joinpath('values.json').write_text(content)
+
+
+def iterate_chunks(content: bytes, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Yields views of consecutive chunks of content without copying it.
+    """
+    view = memoryview(content)
+    for start in range(0, len(view), chunk_size):
+        yield view[start:start + chunk_size]
+
+
+def upload_conclusion(store: ArtifactStore, conclusion: Conclusion, extra_data: Optional[Dict] = None,
+                      max_workers: int = 4, chunk_size: int = CHUNK_SIZE) -> None:
+    """
+    Uploads all artifacts of the run concurrently: weights, metrics, charts (rendered in background process), tags and
+    extra data. Blocks until everything is persisted.
+    :param store: destination of artifacts
+    :param conclusion: run conclusion
+    :param extra_data: anything else to persist, keys are paths in the store
+    :param max_workers: maximal number of concurrent uploads
+    :param chunk_size: size of chunks weights are streamed in
+    :raises Exception: the first error of any upload
+    """
+    splits = {'train': conclusion.train_conclusion, 'validation': conclusion.validation_conclusion}
+    charts = {split: concl.representations.render_async() for split, concl in splits.items()}
+
+    def store_metrics(split):
+        for k, v in asdict(splits[split].metrics).items():
+            store.assign(f'metrics/{split}/{k}', v)
+
+    def store_chart(split, name):
+        store.upload(f'charts/{split}/{name}', [charts[split].result()[name]], 'png')
+
+    def store_extra_data():
+        for key, value in (extra_data or {}).items():
+            store.assign(key, value)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Weights are the largest artifact, so they are started first.
+        futures = [executor.submit(store.upload, 'checkpoint', iterate_chunks(conclusion.weights, chunk_size), 'pkl'),
+                   executor.submit(store.add_tags, [conclusion.detector_handle, *conclusion.datasets]),
+                   executor.submit(store_extra_data)]
+        futures += [executor.submit(store_metrics, split) for split in splits]
+        futures += [executor.submit(store_chart, split, name) for split in splits for name in
+                    ('roc_curve', 'clf_report')]
+
+        done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+        for future in done:
+            if future.exception() is not None:
+                for pending in futures:
+                    pending.cancel()
+                raise future.exception()
+
+    store.flush()
@@ -0,0 +1,117 @@
+from typing import List, Optional, Tuple
+
+import numpy as np
+import torch
+
+from detectors.utils.batching import length_batches, pad_sequences
+
+
+class PerplexityEngine:
+    """
+    Batched scoring of texts with causal language model. Texts are grouped into batches of similar length, padded
+    only to the longest text of the batch, and batch size is bounded by token budget.
+    Every text is prefixed by BOS token (unless tokenizer adds one itself), so that all of its tokens get scored, the
+    same way OpenAI models are scored after <|endoftext|>.
+    Texts longer than the window are scored by strided sliding windows: every window overlaps the previous one by
+    window - stride tokens of context, and scores only the tokens that previous windows did not. Windows of all texts
+    are batched together, so memory is bounded by the token budget and time is linear in text length.
+    """
+
+    def __init__(self, model, tokenizer, max_batch_tokens: int = 8192, max_batch_size: int = 64,
+                 window: Optional[int] = None, stride: Optional[int] = None):
+        """
+        :param model: HF causal language model
+        :param tokenizer: tokenizer of the model
+        :param max_batch_tokens: upper bound of padded tokens in one forward pass
+        :param max_batch_size: upper bound of windows in one forward pass
+        :param window: maximal number of tokens in one forward pass of one text, defaults to model's context size
+        :param stride: number of tokens window moves by, defaults to half of the window
+        """
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        context = getattr(model.config, 'max_position_embeddings', None) or tokenizer.model_max_length
+        self.window = window or min(tokenizer.model_max_length, context)
+        self.stride = stride or max(self.window // 2, 1)
+        if not 0 < self.stride < self.window:
+            raise Exception(f"Stride should be in range (0, {self.window}), got {self.stride}.")
+
+    def _encode(self, texts: List[str]) -> List[List[int]]:
+        bos = self.tokenizer.bos_token_id
+        if bos is None:
+            bos = self.tokenizer.eos_token_id
+        encodings = self.tokenizer(texts, verbose=False)['input_ids']
+        return [ids if len(ids) and ids[0] == bos else [bos] + ids for ids in encodings]
+
+    def _windows(self, length: int) -> List[Tuple[int, int, int]]:
+        """
+        :param length: number of tokens, including BOS
+        :return: list of (begin, end, first scored position) of every window
+        """
+        windows = []
+        scored = 1
+        begin = 0
+        while True:
+            end = min(begin + self.window, length)
+            windows.append((begin, end, scored))
+            if end == length:
+                return windows
+            scored = end
+            begin += self.stride
+
+    def token_nll(self, texts: List[str]) -> List[np.ndarray]:
+        """
+        Computes negative log-likelihood of every token of every text.
+        :param texts: input texts
+        :return: per-token NLL arrays in the same order as texts
+        """
+        return self._score(self._encode(texts))
+
+    def token_log_proba(self, texts: List[str]) -> List[Tuple[List[str], np.ndarray]]:
+        """
+        Computes log-probability of every token of every text, in the format of `EstimationLanguageModel`.
+        :param texts: input texts
+        :return: list of tuples of text tokens (without BOS) and their log-probabilities
+        """
+        encodings = self._encode(texts)
+        return [(self.tokenizer.convert_ids_to_tokens(ids[1:]), -nll)
+                for ids, nll in zip(encodings, self._score(encodings))]
+
+    def _score(self, encodings: List[List[int]]) -> List[np.ndarray]:
+        segments = [(i, begin, end, scored) for i, ids in enumerate(encodings) for begin, end, scored in
+                    self._windows(len(ids))]
+        pad_id = self.tokenizer.pad_token_id if self.tokenizer.pad_token_id is not None else 0
+
+        segment_nll = [None] * len(segments)
+        for batch in length_batches([end - begin for _, begin, end, _ in segments], self.max_batch_tokens,
+                                    self.max_batch_size):
+            windows = [encodings[segments[k][0]][segments[k][1]:segments[k][2]] for k in batch]
+            input_ids, attention_mask = pad_sequences(windows, pad_id)
+            nll = self._forward(torch.as_tensor(input_ids), torch.as_tensor(attention_mask))
+            for row, k in enumerate(batch):
+                _, begin, end, scored = segments[k]
+                # Row holds NLL of window positions 1..end - begin - 1.
+                segment_nll[k] = nll[row, scored - begin - 1:end - begin - 1]
+
+        results = [[] for _ in encodings]
+        for (i, _, _, _), nll in zip(segments, segment_nll):
+            results[i].append(nll)
+        return [np.concatenate(nll) for nll in results]
+
+    def _forward(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> np.ndarray:
+        with torch.no_grad():
+            logits = self.model(input_ids=input_ids.to(self.model.device),
+                                attention_mask=attention_mask.to(self.model.device)).logits
+            # Token t is predicted by logits at position t - 1, padded positions are masked out.
+            nll = torch.nn.functional.cross_entropy(logits[:, :-1].float().permute(0, 2, 1),
+                                                    input_ids[:, 1:].to(logits.device), reduction='none')
+            nll = nll * attention_mask[:, 1:].to(nll.device)
+        return nll.cpu().numpy()
+
+    def perplexity(self, texts: List[str]) -> np.ndarray:
+        """
+        :param texts: input texts
+        :return: perplexity of every text
+        """
+        return np.array([np.exp(np.mean(nll)) if len(nll) else np.nan for nll in self.token_nll(texts)])
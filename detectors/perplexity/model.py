@@ -1,64 +1,116 @@
 import pickle
-from typing import List
+from typing import List, Optional, TYPE_CHECKING
 
 import numpy as np
-import torch
-from openai import OpenAI
-from transformers import AutoModelForCausalLM, AutoTokenizer
 
 from detectors.interfaces import IDetector
+from detectors.models.backends import BackendConfig
+from detectors.models.cache import LogProbCache, CachedEstimationLanguageModel
+from detectors.models.hf import HFProbabilityEstimator
 from detectors.utils.loading import ensure_type, ensure_obj
 from detectors.utils.math import safe_sigmoid
 
+if TYPE_CHECKING:
+    from detectors.perplexity.engine import PerplexityEngine
+
 
 class PerplexityModel(IDetector):
-    def __init__(self, model_handle: str = None, perplexity_threshold: float = None, scaling_factor: float = None):
+    def __init__(self, model_handle: str = None, perplexity_threshold: float = None, scaling_factor: float = None,
+                 window: Optional[int] = None, stride: Optional[int] = None, backend: Optional[BackendConfig] = None):
+        """
+        :param model_handle: HF handle (containing '/') or OpenAI model name
+        :param perplexity_threshold: perplexity at which both labels are equally probable
+        :param scaling_factor: slope of the sigmoid over perplexity
+        :param window: sliding window of HF models, defaults to model's context size
+        :param stride: stride of sliding window of HF models, defaults to half of the window
+        :param backend: how HF models are loaded, defaults to configuration from environment variables
+        """
         self.model_handle = None
-        self.model = None
-        self.tokenizer = None
+        self.estimator = None
         self.openai = None
         self.perplexity_threshold = perplexity_threshold
         self.scaling_factor = scaling_factor
+        self.window = window
+        self.stride = stride
+        self.backend = backend or BackendConfig.from_env()
         self.set_model(model_handle)
 
     def set_model(self, model_handle):
+        """
+        Switches detector to the given model. HF models are taken from the shared registry and loaded on first use.
+        """
+        self.release()
         self.model_handle = model_handle
         if self.model_handle is not None:
             if '/' in model_handle:
-                self.model = AutoModelForCausalLM.from_pretrained(model_handle, device_map='auto',
-                                                                  torch_dtype='float16')
-                self.tokenizer = AutoTokenizer.from_pretrained(model_handle)
-                self.tokenizer.pad_token = self.tokenizer.eos_token
+                self.estimator = HFProbabilityEstimator(model_handle, self.backend, window=self.window,
+                                                        stride=self.stride)
             else:
-                self.openai = OpenAI()
+                from detectors.ghostbuster.openai import OpenaiProbabilityEstimator
+
+                self.openai = OpenaiProbabilityEstimator(model_name=model_handle)
+            self.use_cache(LogProbCache.from_env())
+
+    def release(self) -> None:
+        """
+        Releases the shared HF model, if any.
+        """
+        if getattr(self, 'estimator', None) is not None:
+            self.hf_estimator.release()
+        self.estimator = None
+        self.openai = None
+
+    @property
+    def hf_estimator(self) -> Optional[HFProbabilityEstimator]:
+        """
+        HF estimator, unwrapped from the cache.
+        """
+        if isinstance(self.estimator, CachedEstimationLanguageModel):
+            return self.estimator.model
+        return self.estimator
+
+    @property
+    def model(self):
+        return self.hf_estimator.lease.model if self.estimator is not None else None
+
+    @property
+    def tokenizer(self):
+        return self.hf_estimator.lease.tokenizer if self.estimator is not None else None
+
+    @property
+    def engine(self) -> Optional['PerplexityEngine']:
+        return self.hf_estimator.engine if self.estimator is not None else None
+
+    def use_cache(self, cache: Optional[LogProbCache]) -> None:
+        """
+        Wraps HF or OpenAI estimator with persistent log-probability cache. HF estimator is identified in cache by its
+        `cache_identity`, which covers sliding window and backend numerics.
+        :param cache: cache to use, None keeps estimator unchanged
+        """
+        if cache is None:
+            return
+        if self.openai is not None and not isinstance(self.openai, CachedEstimationLanguageModel):
+            self.openai = CachedEstimationLanguageModel(self.openai, cache)
+        if self.estimator is not None and not isinstance(self.estimator, CachedEstimationLanguageModel):
+            self.estimator = CachedEstimationLanguageModel(self.estimator, cache)
 
     def predict_openai(self, text):
-        response = self.openai.completions.create(
-            model=self.model_handle,
-            prompt="<|endoftext|>" + text,
-            max_tokens=0,
-            echo=True,
-            logprobs=1,
-        )
-
-        logprobs = np.array(response.choices[0].logprobs.token_logprobs[1:])
+        logprobs = self.openai.get_text_log_proba(text)[1]
         return np.exp(-np.mean(logprobs))
 
     def predict_llm(self, text):
-        inputs = self.tokenizer(text, return_tensors='pt')
-        with torch.no_grad():
-            logits = self.model(**inputs.to(self.model.device))
-
-        return torch.nn.functional.cross_entropy(logits['logits'].permute(0, 2, 1), inputs['input_ids'],
-                                                 reduction='mean').exp().cpu().numpy()
+        # Per-token log-probabilities are shared with other detectors on the same model within a request scope.
+        logprobs = self.estimator.get_text_log_proba(text)[1]
+        return np.exp(-np.mean(logprobs)) if len(logprobs) else np.nan
 
     def predict_proba(self, text):
-        if self.model is not None:
+        if self.estimator is not None:
             perplexity = self.predict_llm(text)
         else:
             perplexity = self.predict_openai(text)
 
-        return safe_sigmoid(self.scaling_factor * (perplexity - self.perplexity_threshold))
+        human = safe_sigmoid(self.scaling_factor * (perplexity - self.perplexity_threshold))
+        return np.array([1 - human, human])
 
     def get_labels(self) -> List[str]:
         return ['LLM', 'Human']
@@ -69,9 +121,17 @@ class PerplexityModel(IDetector):
         self.perplexity_threshold = ensure_obj(weights, 'perplexity_threshold')
         self.model_handle = ensure_obj(weights, 'model_handle')
         self.scaling_factor = ensure_obj(weights, 'scaling_factor')
+        self.window = weights.get('window')
+        self.stride = weights.get('stride')
+        self.set_model(self.model_handle)
 
     def store_weights(self) -> bytes:
         return pickle.dumps({
             'perplexity_threshold': self.perplexity_threshold,
             'scaling_factor': self.scaling_factor,
-            'model_handle': self.model_handle})
+            'model_handle': self.model_handle,
+            'window': self.window,
+            'stride': self.stride})
+
+    def __del__(self):
+        self.release()
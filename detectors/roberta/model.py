@@ -0,0 +1,161 @@
+import hashlib
+import logging
+import os
+import pathlib
+import pickle
+import shutil
+import tempfile
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from detectors.interfaces import IDetector
+from detectors.models.backends import BackendConfig, load_sequence_classifier
+from detectors.utils.batching import length_batches, pad_sequences
+from detectors.utils.loading import ensure_type, ensure_obj, lazy_import
+
+MODELS_DIR = './cache/roberta'
+# Conservative number of characters per BPE token, real texts average about four.
+CHARS_PER_TOKEN = 3
+
+
+def serialize_pretrained(model, tokenizer) -> Dict[str, bytes]:
+    """
+    Serializes fine-tuned model and its tokenizer into contents of their files. Floating point weights are stored in
+    float16, which halves the size, and are restored in the dtype of the backend when loaded.
+    :return: mapping of file names to their contents
+    """
+    safetensors = lazy_import('safetensors.torch')
+
+    with tempfile.TemporaryDirectory() as directory:
+        model.save_pretrained(directory, safe_serialization=True)
+        tokenizer.save_pretrained(directory)
+        for path in pathlib.Path(directory).glob('*.safetensors'):
+            tensors = safetensors.load_file(str(path))
+            safetensors.save_file({name: tensor.half() if tensor.is_floating_point() else tensor
+                                   for name, tensor in tensors.items()}, str(path), metadata={'format': 'pt'})
+        return {path.name: path.read_bytes() for path in pathlib.Path(directory).iterdir() if path.is_file()}
+
+
+def materialize(files: Dict[str, bytes], directory: Optional[str] = None) -> pathlib.Path:
+    """
+    Writes files into directory named by their content hash, so `from_pretrained` can load them. Files are written
+    once, loading the same weights again reuses the directory.
+    :param files: mapping of file names to their contents
+    :param directory: parent of content-addressed directories, defaults to MODELS_DIR
+    :return: path of the model directory
+    """
+    digest = hashlib.sha256()
+    for name in sorted(files):
+        digest.update(name.encode('utf-8'))
+        digest.update(hashlib.sha256(files[name]).digest())
+    path = pathlib.Path(directory or MODELS_DIR).joinpath(digest.hexdigest()[:32])
+    if path.exists():
+        return path
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = pathlib.Path(tempfile.mkdtemp(dir=path.parent))
+    for name, content in files.items():
+        temporary.joinpath(name).write_bytes(content)
+    try:
+        os.rename(temporary, path)
+    except OSError:
+        # Another process materialized the same weights first.
+        shutil.rmtree(temporary, ignore_errors=True)
+    return path
+
+
+class RobertaDetector(IDetector):
+    """
+    Fine-tuned transformer sequence classifier (RoBERTa by default). Texts are truncated to max_length tokens, grouped
+    into batches of similar length by token budget and padded only to the longest text of the batch, so that CPU
+    inference does not waste compute on padding.
+    """
+
+    def __init__(self, model=None, tokenizer=None, max_length: int = 512, quantize: bool = False,
+                 max_batch_tokens: int = 16384, max_batch_size: int = 64, backend: Optional[BackendConfig] = None):
+        """
+        :param model: fine-tuned sequence classification model
+        :param tokenizer: its tokenizer
+        :param max_length: texts are truncated to this number of tokens
+        :param quantize: recommend int8 dynamic quantization to CPU backends loading these weights
+        :param max_batch_tokens: upper bound of padded tokens in one forward pass
+        :param max_batch_size: upper bound of texts in one forward pass
+        :param backend: how loaded models are run, defaults to configuration from environment variables
+        """
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_length = max_length
+        self.quantize = quantize
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.backend = backend or BackendConfig.from_env()
+        # Directory the weights were loaded from, serialized files are not kept in memory next to the model.
+        self.path: Optional[pathlib.Path] = None
+
+    def predict_proba(self, text: str) -> np.array:
+        return self.predict_proba_batch([text])[0]
+
+    def predict_proba_batch(self, texts: List[str]) -> np.ndarray:
+        """
+        :param texts: input texts
+        :return: probabilities of every text in the order of `get_labels`
+        """
+        torch = lazy_import('torch')
+
+        encodings = self.tokenizer(texts, truncation=True, max_length=self.max_length, verbose=False)['input_ids']
+        truncated = sum(len(ids) >= self.max_length for ids in encodings)
+        if truncated:
+            logging.warning(f"{truncated} of {len(texts)} texts reached {self.max_length} tokens, longer texts are "
+                            f"truncated.")
+        pad_id = self.tokenizer.pad_token_id if self.tokenizer.pad_token_id is not None else 0
+        probabilities = np.zeros((len(texts), len(self.get_labels())), dtype=np.float64)
+        for batch in length_batches([len(ids) for ids in encodings], self.max_batch_tokens, self.max_batch_size):
+            input_ids, attention_mask = pad_sequences([encodings[i] for i in batch], pad_id)
+            with torch.no_grad():
+                logits = self.model(input_ids=torch.as_tensor(input_ids).to(self.model.device),
+                                    attention_mask=torch.as_tensor(attention_mask).to(self.model.device)).logits
+            probabilities[batch] = torch.softmax(logits.float(), dim=-1).cpu().numpy()
+        return probabilities
+
+    @property
+    def max_chunk_chars(self) -> int:
+        """
+        :return: estimated length of texts that fit into max_length tokens, for callers splitting long texts. Texts
+        with fewer characters per token than CHARS_PER_TOKEN, e.g. non-Latin scripts or emoji, may still be truncated,
+        which `predict_proba_batch` logs
+        """
+        return max(self.max_length - 2, 1) * CHARS_PER_TOKEN
+
+    def get_labels(self) -> List[str]:
+        id2label = self.model.config.id2label
+        return [id2label[i] for i in range(len(id2label))]
+
+    def store_weights(self) -> bytes:
+        if self.path is not None:
+            files = {path.name: path.read_bytes() for path in self.path.iterdir() if path.is_file()}
+        else:
+            files = serialize_pretrained(self.model, self.tokenizer)
+        return pickle.dumps({'files': files, 'max_length': self.max_length, 'quantize': self.quantize})
+
+    def load_weights(self, weights: bytes) -> None:
+        """
+        Loads weights stored by `store_weights` with the configured backend. Weights stored with quantize flag are
+        quantized to int8 when run on CPU, unless the backend is ONNX.
+        """
+        try:
+            dct = ensure_type(pickle.loads(weights), dict)
+            files = ensure_type(ensure_obj(dct, 'files'), dict)
+            self.max_length = ensure_obj(dct, 'max_length')
+            self.quantize = dct.get('quantize', False)
+
+            backend = self.backend
+            if self.quantize and not backend.onnx and backend.resolve_device() == 'cpu':
+                backend = BackendConfig(**{**backend.__dict__, 'device': 'cpu', 'quantize': True})
+            path = materialize(files)
+            del dct, files
+            self.path = path
+            self.tokenizer = lazy_import('transformers', 'AutoTokenizer').from_pretrained(str(path))
+            self.model = load_sequence_classifier(str(path), backend)
+        except Exception as e:
+            raise Exception("Error occurred while loading weights.", e)
@@ -0,0 +1,80 @@
+import argparse
+import time
+
+import numpy as np
+from transformers import AutoTokenizer
+
+from detectors.models.backends import BackendConfig, load_causal_lm
+from detectors.perplexity.engine import PerplexityEngine
+
+BACKENDS = {
+    'float32': BackendConfig(device='cpu', dtype='float32'),
+    'bfloat16': BackendConfig(device='cpu', dtype='bfloat16'),
+    'int8': BackendConfig(device='cpu', quantize=True),
+    'compile': BackendConfig(device='cpu', compile=True),
+    'onnx': BackendConfig(device='cpu', onnx=True),
+}
+
+SAMPLE = ("Large language models assign probabilities to sequences of tokens. Texts written by people tend to contain "
+          "more surprising word choices than texts sampled from a model, which makes perplexity a simple baseline "
+          "for detection of generated content. ")
+
+
+def benchmark(model_handle, backend, texts, repeats, num_threads):
+    backend = BackendConfig(**{**backend.__dict__, 'num_threads': num_threads})
+
+    start = time.perf_counter()
+    model = load_causal_lm(model_handle, backend)
+    tokenizer = AutoTokenizer.from_pretrained(model_handle)
+    tokenizer.pad_token = tokenizer.eos_token
+    engine = PerplexityEngine(model, tokenizer)
+    load_time = time.perf_counter() - start
+
+    perplexities = engine.perplexity(texts)  # Warm up, compiled backends compile here.
+    start = time.perf_counter()
+    for _ in range(repeats):
+        engine.perplexity(texts)
+    elapsed = (time.perf_counter() - start) / repeats
+
+    tokens = sum(len(ids) for ids in tokenizer(texts)['input_ids'])
+    return load_time, elapsed, tokens, perplexities
+
+
+def main(args):
+    texts = [SAMPLE * (1 + i % args.max_repeats) for i in range(args.num_texts)]
+    print(f'Benchmarking {args.model_handle} on {len(texts)} texts with {args.num_threads or "default"} threads.')
+
+    baseline = None
+    print(f'{"backend":>10} {"load, s":>10} {"ms/text":>10} {"tokens/s":>10} {"max rel. diff":>14}')
+    for name in args.backends:
+        try:
+            load_time, elapsed, tokens, perplexities = benchmark(args.model_handle, BACKENDS[name], texts,
+                                                                 args.repeats, args.num_threads)
+        except Exception as e:
+            print(f'{name:>10} failed: {e}')
+            continue
+        if baseline is None:
+            baseline = perplexities
+        diff = np.max(np.abs(perplexities - baseline) / baseline)
+        print(f'{name:>10} {load_time:>10.2f} {1000 * elapsed / len(texts):>10.2f} {tokens / elapsed:>10.0f} '
+              f'{diff:>14.2e}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare CPU inference backends of perplexity model.")
+
+    parser.add_argument("--model_handle", type=str, default="sshleifer/tiny-gpt2",
+                        help="HF handle or local path of a small causal language model.")
+    parser.add_argument("--backends", type=str, nargs='+', default=list(BACKENDS), choices=list(BACKENDS),
+                        help="Backends to compare, the first one is the reference for perplexity differences.")
+    parser.add_argument("--num_texts", type=int, default=32,
+                        help="Number of texts to score.")
+    parser.add_argument("--max_repeats", type=int, default=8,
+                        help="Texts consist of 1 to max_repeats copies of the sample paragraph.")
+    parser.add_argument("--repeats", type=int, default=3,
+                        help="Number of timed runs.")
+    parser.add_argument("--num_threads", type=int, default=None,
+                        help="Number of intra-op threads.")
+
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,90 @@
+import argparse
+import time
+
+import numpy as np
+from datasets import load_dataset
+from dotenv import load_dotenv
+
+from detectors.cascade.model import LABELS, label_order
+from detectors.models.scope import request_scope
+from detectors.neptune.local import MockNexus
+from detectors.student.model import StudentDetector, teacher_agreement
+from detectors.utils.loading import load_detector
+from detectors.utils.selection import select_samples
+
+
+def measure(detector, texts):
+    """
+    :return: latencies of single text predictions in seconds and probabilities of 'AI'
+    """
+    column = label_order(detector.get_labels())[LABELS.index('AI')]
+    latencies, probabilities = [], []
+    for text in texts:
+        start = time.perf_counter()
+        with request_scope():
+            probabilities.append(detector.predict_proba(text)[column])
+        latencies.append(time.perf_counter() - start)
+    return np.array(latencies), np.array(probabilities)
+
+
+def main(args):
+    load_dotenv()
+    if args.nexus == 'local':
+        nexus = MockNexus(args.nexus_dir)
+    else:
+        from detectors.neptune.nexus import NeptuneNexus
+        nexus = NeptuneNexus()
+    student = load_detector(nexus, f'{StudentDetector.__module__}.{StudentDetector.__name__}', args.student_run_id)
+    teacher = load_detector(nexus, args.teacher_classpath, args.teacher_run_id)
+
+    dataset = load_dataset(args.dataset_handle, args.dataset_config, streaming=args.streaming)['train']
+    texts = select_samples(dataset, {label: args.samples_per_label for label in args.labels},
+                           max_length=args.max_length, seed=args.seed)['output']
+    print(f'Benchmarking student {args.student_run_id} against teacher {args.teacher_run_id} on {len(texts)} texts.')
+
+    measure(student, texts[:8])  # Warm up.
+    student_latencies, student_probabilities = measure(student, texts)
+    teacher_latencies, teacher_probabilities = measure(teacher, texts)
+    start = time.perf_counter()
+    student.predict_proba_batch(texts)
+    batch_time = time.perf_counter() - start
+
+    print(f'{"model":>10} {"p50, ms":>10} {"p95, ms":>10} {"texts/s":>10}')
+    for name, latencies in [('teacher', teacher_latencies), ('student', student_latencies)]:
+        print(f'{name:>10} {1000 * np.median(latencies):>10.2f} {1000 * np.percentile(latencies, 95):>10.2f} '
+              f'{len(texts) / latencies.sum():>10.0f}')
+    print(f'{"batched":>10} {"":>10} {"":>10} {len(texts) / batch_time:>10.0f}')
+    print(f'Agreement with teacher: {teacher_agreement(student_probabilities, teacher_probabilities)}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare latency of distilled student with its teacher and measure "
+                                                 "their agreement.")
+
+    parser.add_argument("--student_run_id", type=str, required=True,
+                        help="Run of the student in nexus.")
+    parser.add_argument("--teacher_classpath", type=str, required=True,
+                        help="Classpath of the teacher, e.g. detectors.ghostbuster.model.GhostbusterDetector.")
+    parser.add_argument("--teacher_run_id", type=str, required=True,
+                        help="Run of the teacher in nexus.")
+    parser.add_argument("--dataset_handle", type=str, default="anakib1/mango-truth",
+                        help="Dataset handle to use for loading data.")
+    parser.add_argument("--dataset_config", type=str, default="xlsum",
+                        help="Dataset configuration to load.")
+    parser.add_argument("--streaming", action='store_true',
+                        help="Stream the dataset instead of downloading it.")
+    parser.add_argument("--labels", type=int, nargs='+', default=[0, 1, 2, 3],
+                        help="Labels of benchmark texts.")
+    parser.add_argument("--samples_per_label", type=int, default=100,
+                        help="Number of texts of every label.")
+    parser.add_argument("--max_length", type=int, default=1750,
+                        help="Maximum output length for filtering data.")
+    parser.add_argument("--seed", type=int, default=1,
+                        help="Seed of benchmark data selection, differs from training seed by default.")
+    parser.add_argument("--nexus", type=str, choices=['neptune', 'local'], default='neptune',
+                        help="Where the runs are loaded from.")
+    parser.add_argument("--nexus_dir", type=str, default='./cache/nexus',
+                        help="Directory of local nexus.")
+
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,97 @@
+import argparse
+import logging
+from uuid import uuid4
+
+import numpy as np
+from datasets import load_dataset
+from dotenv import load_dotenv
+from tqdm.auto import tqdm
+
+from detectors.cascade.model import CascadeDetector, CascadeStage, LABELS
+from detectors.metrics import Conclusion
+from detectors.models.scope import request_scope
+from detectors.neptune.local import MockNexus
+from detectors.utils.loading import load_detector
+from detectors.utils.selection import select_samples
+from detectors.utils.training import report_classification
+
+
+def main(args):
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    run = uuid4()
+    print(f'Starting run {run} with following arguments: ', args)
+
+    if len(args.band) != len(args.stage) - 1:
+        raise Exception(f"Every stage except the last one needs a band, got {len(args.band)} bands for "
+                        f"{len(args.stage)} stages.")
+
+    if args.nexus == 'local':
+        nexus = MockNexus(args.nexus_dir)
+    else:
+        from detectors.neptune.nexus import NeptuneNexus
+        nexus = NeptuneNexus()
+
+    stages = []
+    for (name, classpath, run_id), (lower, upper) in zip(args.stage, args.band + [(0.0, 1.0)]):
+        stages.append(CascadeStage(name, load_detector(nexus, classpath, run_id), lower, upper))
+    cascade = CascadeDetector(stages)
+
+    dataset = load_dataset(args.dataset_handle, args.dataset_config, streaming=args.streaming)['train']
+    selection = select_samples(dataset, {args.human_label: args.human_samples, args.llm_label: args.llm_samples},
+                               max_length=args.max_length, seed=args.seed)
+
+    y_true = np.asarray(selection['label']) == args.llm_label
+    y_scores = []
+    for text in tqdm(selection['output'], desc='Evaluating cascade'):
+        with request_scope():
+            y_scores.append(cascade.predict_proba(text)[LABELS.index('AI')])
+
+    validation = report_classification(y_true, np.array(y_scores))
+    rates = cascade.decision_rates()
+    print(f'Evaluation of cascade {run} finished, metrics: {validation.metrics}, decided by stages: {rates}')
+
+    # Cascade is assembled from trained stages, so it has no training split of its own.
+    conclusion = Conclusion(weights=cascade.store_weights(), detector_handle='cascade', datasets=[args.dataset_config],
+                            train_conclusion=validation, validation_conclusion=validation)
+    extra_data = {'info': 'CORRECT', 'args': str(vars(args))}
+    extra_data.update({f'cascade/decided/{name}': rate for name, rate in rates.items()})
+    nexus.conclude_run(run, conclusion=conclusion, extra_data=extra_data)
+    print(f'Upload of run {run} finished successfully.')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Assemble cascade of trained detectors, evaluate it and upload it as "
+                                                 "a new run.")
+
+    parser.add_argument("--stage", type=str, nargs=3, action='append', required=True,
+                        metavar=('NAME', 'CLASSPATH', 'RUN_ID'),
+                        help="Stage of the cascade, from the cheapest to the most expensive one.")
+    parser.add_argument("--band", type=float, nargs=2, action='append', default=[], metavar=('LOWER', 'UPPER'),
+                        help="Uncertainty band of AI probability of every stage except the last one. Requests "
+                             "inside the band are escalated to the next stage.")
+    parser.add_argument("--dataset_handle", type=str, default="anakib1/mango-truth",
+                        help="Dataset handle to use for loading data.")
+    parser.add_argument("--dataset_config", type=str, default="xlsum",
+                        help="Dataset configuration to load.")
+    parser.add_argument("--streaming", action='store_true',
+                        help="Stream the dataset instead of downloading it.")
+    parser.add_argument("--human_label", type=int, default=0,
+                        help="Label of human texts.")
+    parser.add_argument("--llm_label", type=int, default=3,
+                        help="Label of generated texts.")
+    parser.add_argument("--human_samples", type=int, default=500,
+                        help="Number of human samples used for evaluation.")
+    parser.add_argument("--llm_samples", type=int, default=500,
+                        help="Number of generated samples used for evaluation.")
+    parser.add_argument("--max_length", type=int, default=1750,
+                        help="Maximum output length for filtering data.")
+    parser.add_argument("--seed", type=int, default=1,
+                        help="Seed of evaluation data selection.")
+    parser.add_argument("--nexus", type=str, choices=['neptune', 'local'], default='neptune',
+                        help="Where stage runs are loaded from and the cascade is uploaded to.")
+    parser.add_argument("--nexus_dir", type=str, default='./cache/nexus',
+                        help="Directory of local nexus.")
+
+    args = parser.parse_args()
+    main(args)
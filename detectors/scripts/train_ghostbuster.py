@@ -19,8 +19,10 @@ from detectors.ghostbuster.model import GhostbusterDetector
 from detectors.ghostbuster.ngrams import UnigramModel, TrigramModel
 from detectors.ghostbuster.openai import OpenaiProbabilityEstimator
 from detectors.metrics import Conclusion
+from detectors.models.cache import LogProbCache, CachedEstimationLanguageModel
 from detectors.neptune.nexus import NeptuneNexus
-from detectors.utils.training import calculate_classification
+from detectors.utils.selection import select_samples
+from detectors.utils.training import report_classification
 
 
 def get_obj_from_persistance(filename: str) -> Any:
@@ -40,34 +42,42 @@ def main(args):
     run = uuid4()
 
     print(f'Starting run {run} with following arguments: ', args)
-    dataset = load_dataset(args.dataset_handle, args.dataset_config)
+    dataset = load_dataset(args.dataset_handle, args.dataset_config, streaming=args.streaming)
 
-    length_match = dataset['train'].filter(lambda x: len(x['output']) < args.max_length)
-    reference = length_match.filter(lambda x: x['label'] == 0).take(args.human_samples)
-    generated = length_match.filter(lambda x: x['label'] == 3)
+    selection = select_samples(dataset['train'], {0: args.human_samples, 3: None}, max_length=args.max_length,
+                               seed=args.seed, num_proc=args.num_workers or None)
 
-    X = reference['output'] + generated['output']
-    y = [0] * len(reference) + [1] * len(generated)
+    X = selection['output']
+    y = [int(label == 3) for label in selection['label']]
+
+    if args.ngram_corpus == 'split':
+        corpus = lambda: (row['output'] for row in dataset['train'])
+    else:
+        corpus = lambda: X
 
     unigram = UnigramModel(tokenizer_handle='gugarosa/cl100k_base')
-    unigram.train(X)
+    unigram.train(corpus(), num_workers=args.num_workers)
 
     trigram = TrigramModel(tokenizer_handle='gugarosa/cl100k_base')
-    trigram.train(X)
+    trigram.train(corpus(), num_workers=args.num_workers)
 
     estimator = OpenaiProbabilityEstimator(model_name=args.llm_handles[0])
+    cached_estimator = CachedEstimationLanguageModel(estimator, LogProbCache(args.logprob_cache))
 
     # IMPORTANT: Assertions of not broken tokenizer.
     for _ in range(10):
         i = random.randint(0, len(X) - 1)
-        assert estimator.get_text_log_proba(X[i])[1].shape == unigram.get_text_log_proba(X[i])[1].shape
+        assert cached_estimator.get_text_log_proba(X[i])[1].shape == unigram.get_text_log_proba(X[i])[1].shape
 
     models = [unigram, trigram, estimator]
+    scoring_models = [unigram, trigram, cached_estimator]
     feats = get_obj_from_persistance('feats.pkl')
     if feats is None: feats = []
 
-    for i in tqdm(range(len(feats), len(X))):
-        feats.append(extract_features([model.get_text_log_proba(X[i])[1] for model in models]))
+    for start in tqdm(range(len(feats), len(X), args.batch_size)):
+        batch = X[start:start + args.batch_size]
+        log_probas = [model.get_text_log_proba_batch(batch) for model in scoring_models]
+        feats.extend(extract_features([log_proba[i][1] for log_proba in log_probas]) for i in range(len(batch)))
         persist_obj(feats, 'feats.pkl')
 
     print(f'Feature extraction for run {run} finished successfully.')
@@ -80,8 +90,8 @@ def main(args):
     y_test_hat = model.predict_proba(X_test)
     y_train_hat = model.predict_proba(X_train)
 
-    train = calculate_classification(y_train, y_train_hat[:, 1])
-    valid = calculate_classification(y_test, y_test_hat[:, 1])
+    train = report_classification(y_train, y_train_hat[:, 1])
+    valid = report_classification(y_test, y_test_hat[:, 1])
 
     print(f'Training {run} finished successfully, uploading results to nexus.')
 
@@ -120,6 +130,18 @@ if __name__ == "__main__":
                         help="Number of human samples to use for training.")
     parser.add_argument("--llm_handles", type=str, nargs='+', default=['babbage-002'],
                         help="List of LLM model handles to use.")
+    parser.add_argument("--ngram_corpus", type=str, choices=['selection', 'split'], default='selection',
+                        help="Train n-gram models on selected samples only or stream the whole train split.")
+    parser.add_argument("--batch_size", type=int, default=64,
+                        help="Number of texts scored by estimators at once.")
+    parser.add_argument("--logprob_cache", type=str, default='./cache/logprobs.sqlite',
+                        help="Path of persistent log-probabilities cache.")
+    parser.add_argument("--num_workers", type=int, default=0,
+                        help="Number of worker processes for data selection and n-gram counting.")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed of data selection.")
+    parser.add_argument("--streaming", action='store_true',
+                        help="Stream the dataset instead of downloading it, memory is bounded by selection size.")
 
     args = parser.parse_args()
     main(args)
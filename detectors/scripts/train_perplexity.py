@@ -4,82 +4,32 @@ from uuid import uuid4
 import traceback
 
 import numpy as np
-import torch
-from datasets import concatenate_datasets
 from datasets import load_dataset
 from dotenv import load_dotenv
 from matplotlib import pyplot as plt
-from sklearn.metrics import f1_score, roc_auc_score
 from sklearn.model_selection import train_test_split
 from tqdm.auto import tqdm
 
 from detectors.metrics import Conclusion
+from detectors.models.cache import LogProbCache
 from detectors.neptune.nexus import NeptuneNexus
 from detectors.perplexity.model import PerplexityModel
+from detectors.utils.calibration import best_f1_threshold, fit_sigmoid_slope
+from detectors.utils.selection import select_samples
 from detectors.utils.math import safe_sigmoid
-from detectors.utils.training import calculate_classification
+from detectors.utils.training import report_classification
 
 
-def batch_calculate_perplexity(dataset, tokenizer, llm, batch_size):
+def batch_calculate_perplexity(texts, estimator, batch_size):
     results = []
-    for i in tqdm(range(0, len(dataset), batch_size)):
-        inputs = tokenizer(dataset['output'][i:i + batch_size], padding='max_length', truncation=True,
-                           return_tensors='pt',
-                           max_length=tokenizer.model_max_length)
-        with torch.no_grad():
-            logits = llm(**inputs.to(llm.device))
-        raw_perplexity = torch.nn.functional.cross_entropy(logits['logits'].permute(0, 2, 1), inputs['input_ids'],
-                                                           reduction='none')
-
-        raw_perplexity[inputs['input_ids'] == tokenizer.pad_token_id] = 0
-        perplexities = raw_perplexity.sum(dim=1) / inputs['attention_mask'].sum(dim=1)
-        results.append(perplexities.exp().cpu())
-
-    return torch.concatenate(results, dim=0).numpy()
-
-
-def train_threshold(X, y):
-    """
-    Solves regression problem by finding the best threshold that separates binary data in y based by X.
-    :param X: 1d array
-    :param y: 1d boolean array
-    :return: the best threshold C.
-    """
-    thresholds = np.sort(X)
-    max_f1 = 0
-    optimal_C = thresholds[0]
-
-    for C in thresholds:
-        predictions = (X > C).astype(int)
-        f1 = f1_score(y, predictions)
-
-        if f1 > max_f1:
-            max_f1 = f1
-            optimal_C = C
-
-    return optimal_C
-
-
-def train_scaling_factor(X, y, c):
-    """
-     Solves regression problem by finding the best scaling factor that maximises ROC curve for binary data in y based by X.
-     Data is approxiumated by sigmoid distribution with argument k * (x - c)
-    :param X: 1d array
-    :param y: 1d boolean array
-    :param c: threshold factor
-    :return: the best scaling threshold k.
-    """
-    max_roc = 0
-    optimal_K = None
-    for k in np.linspace(0.0001, 1, 1000):
-        probabilities = safe_sigmoid(k * (np.array(X) - c))
-
-        roc = roc_auc_score(y, probabilities)
-        if roc > max_roc:
-            max_roc = roc
-            optimal_K = k
-
-    return optimal_K
+    for i in tqdm(range(0, len(texts), batch_size)):
+        batch = texts[i:i + batch_size]
+        results.append(catch_and_return(
+            lambda: np.array([np.exp(-np.mean(logprobs)) if len(logprobs) else np.nan
+                              for _, logprobs in estimator.get_text_log_proba_batch(batch)]),
+            np.full(len(batch), np.nan)))
+
+    return np.concatenate(results)
 
 
 def catch_and_return(callable, default):
@@ -96,35 +46,38 @@ def main(args):
 
     print(f'Starting run {run} with following arguments: ', args)
 
-    model = PerplexityModel(args.perplexity_model)
+    model = PerplexityModel(args.perplexity_model, window=args.window, stride=args.stride)
+    model.use_cache(LogProbCache(args.logprob_cache))
 
-    data = load_dataset(args.dataset_handle, args.dataset_config)['train']
+    data = load_dataset(args.dataset_handle, args.dataset_config, streaming=args.streaming)['train']
     labler = data.features['label']
+    human, llm = labler.str2int('human'), labler.str2int('gpt-4o-mini')
 
-    human_data = data.filter(lambda x: x['label'] == labler.str2int('human')).take(args.human_samples)
-    llm_data = data.filter(lambda x: x['label'] == labler.str2int('gpt-4o-mini')).take(args.llm_samples)
-
-    labels = np.concat([np.ones(len(human_data)), np.zeros(len(llm_data))])
-    data = concatenate_datasets([human_data, llm_data])
+    data = select_samples(data, {human: args.human_samples, llm: args.llm_samples}, seed=args.seed,
+                          num_proc=args.num_workers)
+    labels = (np.asarray(data['label']) == human).astype(float)
+    human_samples = int(labels.sum())
 
-    if model.model is not None:  # Can use batching
-        perplexities = batch_calculate_perplexity(data, model.tokenizer, model.model, args.batch_size)
+    # Both estimators are cached, so retraining on the same texts does not score them again.
+    if model.estimator is not None:  # HF model
+        model.engine.max_batch_tokens = args.max_batch_tokens
+        perplexities = batch_calculate_perplexity(data['output'], model.estimator, args.hf_batch_size)
     else:
-        perplexities = np.array([catch_and_return(lambda: model.predict_openai(x['output']), np.nan) for x in tqdm(data)])
+        perplexities = batch_calculate_perplexity(data['output'], model.openai, args.batch_size)
 
     perplexities[perplexities == np.nan] = np.mean(perplexities[perplexities != np.nan])
 
     bins = np.linspace(np.percentile(perplexities, 5),
                        np.percentile(perplexities, 95), 50)
 
-    print(f"Human Mean Perplexity: {perplexities[:len(human_data)].mean()}")
-    print(f"AI Mean Perplexity: {perplexities[len(human_data):].mean()}")
+    print(f"Human Mean Perplexity: {perplexities[:human_samples].mean()}")
+    print(f"AI Mean Perplexity: {perplexities[human_samples:].mean()}")
 
     plt.figure(figsize=(10, 6))
 
-    plt.hist(perplexities[:len(human_data)], bins=bins, alpha=0.7, label='Human', color='blue', edgecolor='black',
+    plt.hist(perplexities[:human_samples], bins=bins, alpha=0.7, label='Human', color='blue', edgecolor='black',
              density=True)
-    plt.hist(perplexities[len(human_data):], bins=bins, alpha=0.7, label='AI', color='green', edgecolor='black',
+    plt.hist(perplexities[human_samples:], bins=bins, alpha=0.7, label='AI', color='green', edgecolor='black',
              density=True)
 
     plt.xlabel('Perplexity Score')
@@ -137,14 +90,14 @@ def main(args):
 
     X_train, X_test, y_train, y_test = train_test_split(perplexities, labels, shuffle=True, test_size=0.3,
                                                         stratify=labels)
-    model.perplexity_threshold = train_threshold(X_train, y_train)
-    model.scaling_factor = train_scaling_factor(X_train, y_train, model.perplexity_threshold)
+    model.perplexity_threshold = best_f1_threshold(X_train, y_train)
+    model.scaling_factor = fit_sigmoid_slope(X_train, y_train, model.perplexity_threshold)
 
     y_train_hat = safe_sigmoid(model.scaling_factor * (X_train - model.perplexity_threshold))
     y_test_hat = safe_sigmoid(model.scaling_factor * (X_test - model.perplexity_threshold))
 
-    train = calculate_classification(y_train, y_train_hat)
-    valid = calculate_classification(y_test, y_test_hat)
+    train = report_classification(y_train, y_train_hat)
+    valid = report_classification(y_test, y_test_hat)
 
     print(f'Training {run} finished successfully, uploading results to nexus.')
 
@@ -186,7 +139,23 @@ if __name__ == '__main__':
     parser.add_argument("--perplexity_model", type=str, default='babbage-002',
                         help="LLM model for perplexity computation to use. Both HF and openai models are supported.")
     parser.add_argument("--batch_size", type=int, default=4,
-                        help="Batch size for batched training (HF models)")
+                        help="Batch size of OpenAI requests")
+    parser.add_argument("--hf_batch_size", type=int, default=1024,
+                        help="Number of texts passed to HF model at once, they are batched by length within it")
+    parser.add_argument("--max_batch_tokens", type=int, default=8192,
+                        help="Maximal number of padded tokens in one forward pass (HF models)")
+    parser.add_argument("--window", type=int, default=None,
+                        help="Sliding window size for long texts, defaults to model's context size (HF models)")
+    parser.add_argument("--stride", type=int, default=None,
+                        help="Sliding window stride, defaults to half of the window (HF models)")
+    parser.add_argument("--logprob_cache", type=str, default='./cache/logprobs.sqlite',
+                        help="Path of persistent log-probabilities cache.")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed of data selection.")
+    parser.add_argument("--num_workers", type=int, default=None,
+                        help="Number of worker processes for data selection.")
+    parser.add_argument("--streaming", action='store_true',
+                        help="Stream the dataset instead of downloading it, memory is bounded by selection size.")
 
     args = parser.parse_args()
     main(args)
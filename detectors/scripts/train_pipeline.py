@@ -0,0 +1,250 @@
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+
+import numpy as np
+from datasets import load_dataset
+from dotenv import load_dotenv
+from sklearn.calibration import CalibratedClassifierCV
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import train_test_split
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+from tqdm.auto import tqdm
+
+from detectors.ghostbuster.features import extract_features
+from detectors.ghostbuster.model import GhostbusterDetector
+from detectors.ghostbuster.ngrams import UnigramModel, TrigramModel, tokenize_corpus
+from detectors.metrics import Conclusion
+from detectors.models.cache import LogProbCache, CachedEstimationLanguageModel
+from detectors.models.tokenizers import get_tokenizer, tokenize_batch
+from detectors.neptune.local import MockNexus
+from detectors.perplexity.model import PerplexityModel
+from detectors.utils.calibration import best_f1_threshold, fit_sigmoid_slope
+from detectors.utils.math import safe_sigmoid
+from detectors.utils.selection import select_samples
+from detectors.utils.stages import StageCache
+from detectors.utils.training import report_classification
+
+NGRAM_MODELS = {'unigram': UnigramModel, 'trigram': TrigramModel}
+
+
+def make_estimator(handle):
+    if '/' in handle:
+        from detectors.models.hf import HFProbabilityEstimator
+        return HFProbabilityEstimator(handle)
+    from detectors.ghostbuster.openai import OpenaiProbabilityEstimator
+    return OpenaiProbabilityEstimator(model_name=handle)
+
+
+def selection_stage(cache, args):
+    params = {key: getattr(args, key) for key in ['dataset_handle', 'dataset_config', 'human_label', 'llm_label',
+                                                  'human_samples', 'llm_samples', 'max_length', 'seed']}
+
+    def compute():
+        dataset = load_dataset(args.dataset_handle, args.dataset_config, streaming=args.streaming)['train']
+        selection = select_samples(dataset, {args.human_label: args.human_samples, args.llm_label: args.llm_samples},
+                                   max_length=args.max_length, seed=args.seed, num_proc=args.num_workers or None)
+        return {'texts': selection['output'], 'is_llm': np.asarray(selection['label']) == args.llm_label}
+
+    return cache.run('selection', params, compute)
+
+
+def tokens_stage(cache, selection, tokenizer_handle, training, batch_size=1000):
+    """
+    Training tokens keep special tokens like `train` does, scoring tokens are the ones estimators score at inference.
+    """
+    key, data = selection
+
+    def compute():
+        tokenizer = get_tokenizer(tokenizer_handle)
+        texts = data['texts']
+        batches = (texts[start:start + batch_size] for start in range(0, len(texts), batch_size))
+        tokenize = (lambda batch: tokenize_corpus(tokenizer, batch)) if training else \
+            (lambda batch: tokenize_batch(tokenizer_handle, batch))
+        return [np.asarray(ids, dtype=np.int32) for batch in batches for ids in tokenize(batch)]
+
+    return cache.run(f'tokens/{"training" if training else "scoring"}',
+                     {'selection': key, 'tokenizer': tokenizer_handle}, compute)
+
+
+def ngram_logprobs_stage(cache, selection, name, args):
+    if args.ngram_corpus == 'selection':
+        corpus, training_tokens = tokens_stage(cache, selection, args.tokenizer_handle, training=True)
+    else:
+        corpus = [args.dataset_handle, args.dataset_config]
+
+    def train():
+        model = NGRAM_MODELS[name](tokenizer_handle=args.tokenizer_handle)
+        if args.ngram_corpus == 'selection':
+            model.train_tokens(training_tokens)
+        else:
+            dataset = load_dataset(args.dataset_handle, args.dataset_config, streaming=True)['train']
+            model.train((row['output'] for row in dataset), num_workers=args.num_workers)
+        return model
+
+    model_key, model = cache.run(f'ngram/{name}', {'corpus': corpus, 'tokenizer': args.tokenizer_handle}, train)
+    tokens_key, tokens = tokens_stage(cache, selection, args.tokenizer_handle, training=False)
+    key, logprobs = cache.run(f'logprobs/{name}', {'model': model_key, 'tokens': tokens_key},
+                              lambda: [model.get_tokens_log_proba(ids) for ids in tokens])
+    return key, logprobs, model
+
+
+def llm_logprobs_stage(cache, selection, handle, args):
+    selection_key, data = selection
+
+    def compute():
+        estimator = CachedEstimationLanguageModel(make_estimator(handle), LogProbCache(args.logprob_cache))
+        texts = data['texts']
+        logprobs = []
+        for start in tqdm(range(0, len(texts), args.batch_size), desc=handle):
+            batch = texts[start:start + args.batch_size]
+            logprobs.extend(result for _, result in estimator.get_text_log_proba_batch(batch))
+        return logprobs
+
+    key, logprobs = cache.run(f'logprobs/{handle}', {'selection': selection_key, 'model': handle}, compute)
+    return key, logprobs, make_estimator(handle)
+
+
+def features_stage(cache, detector, logprobs):
+    keys = [key for key, _, _ in logprobs]
+
+    def compute():
+        if detector == 'perplexity':
+            return np.array([[np.exp(-np.mean(values))] for values in logprobs[0][1]])
+        features = []
+        for i, values in enumerate(zip(*[values for _, values, _ in logprobs])):
+            if len({len(x) for x in values}) != 1:
+                raise Exception(f"Estimators tokenize text {i} differently: {[len(x) for x in values]} tokens.")
+            features.append(extract_features(list(values)))
+        return np.array(features)
+
+    return cache.run('features', {'detector': detector, 'logprobs': keys}, compute)
+
+
+def fit_stage(cache, selection, features, args):
+    params = {'selection': selection[0], 'features': features[0], 'detector': args.detector,
+              'test_size': args.test_size, 'seed': args.seed}
+    if args.detector == 'ghostbuster':
+        params.update({'C': args.C, 'max_iter': args.max_iter})
+    # Ghostbuster predicts probability of LLM label, perplexity model predicts probability of human label.
+    y = selection[1]['is_llm'].astype(int) if args.detector == 'ghostbuster' else (~selection[1]['is_llm']).astype(int)
+
+    def compute():
+        X_train, X_test, y_train, y_test = train_test_split(features[1], y, shuffle=True, test_size=args.test_size,
+                                                            stratify=y, random_state=args.seed)
+        if args.detector == 'ghostbuster':
+            clf = make_pipeline(StandardScaler(),
+                                CalibratedClassifierCV(LogisticRegression(C=args.C, max_iter=args.max_iter)))
+            clf.fit(X_train, y_train)
+            predict = lambda X: clf.predict_proba(X)[:, 1]
+        else:
+            threshold = best_f1_threshold(X_train[:, 0], y_train)
+            clf = {'perplexity_threshold': threshold, 'scaling_factor': fit_sigmoid_slope(X_train[:, 0], y_train,
+                                                                                          threshold)}
+            predict = lambda X: safe_sigmoid(clf['scaling_factor'] * (X[:, 0] - clf['perplexity_threshold']))
+        return {'clf': clf, 'train': (y_train, predict(X_train)), 'validation': (y_test, predict(X_test))}
+
+    return cache.run('fit', params, compute)
+
+
+def main(args):
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    run = uuid4()
+    print(f'Starting run {run} with following arguments: ', args)
+
+    if args.detector == 'perplexity' and not args.llm_handles:
+        raise Exception("Perplexity detector needs an LLM estimator.")
+    cache = StageCache(args.stage_cache, recompute=args.recompute)
+    selection = selection_stage(cache, args)
+
+    # Estimator branches are independent, n-gram training overlaps with waiting for LLM log-probabilities.
+    ngram_models = args.ngram_models if args.detector == 'ghostbuster' else []
+    llm_handles = args.llm_handles if args.detector == 'ghostbuster' else args.llm_handles[:1]
+    with ThreadPoolExecutor(max_workers=max(len(ngram_models) + len(llm_handles), 1)) as executor:
+        branches = [executor.submit(ngram_logprobs_stage, cache, selection, name, args) for name in ngram_models]
+        branches += [executor.submit(llm_logprobs_stage, cache, selection, handle, args) for handle in llm_handles]
+        logprobs = [branch.result() for branch in branches]
+
+    features = features_stage(cache, args.detector, logprobs)
+    _, fit = fit_stage(cache, selection, features, args)
+
+    if args.detector == 'ghostbuster':
+        detector = GhostbusterDetector(fit['clf'], [estimator for _, _, estimator in logprobs])
+    else:
+        detector = PerplexityModel(llm_handles[0], **fit['clf'])
+
+    train, valid = report_classification(*fit['train']), report_classification(*fit['validation'])
+    print(f'Training {run} finished, validation metrics: {valid.metrics}')
+
+    if args.nexus == 'none':
+        return
+    nexus = MockNexus(args.nexus_dir) if args.nexus == 'local' else None
+    if nexus is None:
+        from detectors.neptune.nexus import NeptuneNexus
+        nexus = NeptuneNexus()
+    conclusion = Conclusion(weights=detector.store_weights(), detector_handle=args.detector,
+                            datasets=[args.dataset_config], train_conclusion=train, validation_conclusion=valid)
+    nexus.conclude_run(run, conclusion=conclusion, extra_data={'info': 'CORRECT', 'args': str(vars(args))})
+    print(f'Upload of run {run} finished successfully.')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Train detector with stage-cached pipeline: selection, tokenization, "
+                                                 "log-probabilities, features and classifier fit.")
+
+    parser.add_argument("--detector", type=str, choices=['ghostbuster', 'perplexity'], default='ghostbuster',
+                        help="Detector to train.")
+    parser.add_argument("--dataset_handle", type=str, default="anakib1/mango-truth",
+                        help="Dataset handle to use for loading data.")
+    parser.add_argument("--dataset_config", type=str, default="xlsum",
+                        help="Dataset configuration to load.")
+    parser.add_argument("--streaming", action='store_true',
+                        help="Stream the dataset instead of downloading it.")
+    parser.add_argument("--human_label", type=int, default=0,
+                        help="Label of human texts.")
+    parser.add_argument("--llm_label", type=int, default=3,
+                        help="Label of generated texts.")
+    parser.add_argument("--human_samples", type=int, default=1000,
+                        help="Number of human samples, all if not set.")
+    parser.add_argument("--llm_samples", type=int, default=None,
+                        help="Number of generated samples, all if not set.")
+    parser.add_argument("--max_length", type=int, default=1750,
+                        help="Maximum output length for filtering data.")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed of data selection and train/validation split.")
+    parser.add_argument("--tokenizer_handle", type=str, default='gugarosa/cl100k_base',
+                        help="Tokenizer of n-gram models.")
+    parser.add_argument("--ngram_models", type=str, nargs='*', default=['unigram', 'trigram'],
+                        choices=list(NGRAM_MODELS), help="N-gram estimators of ghostbuster.")
+    parser.add_argument("--ngram_corpus", type=str, choices=['selection', 'split'], default='selection',
+                        help="Train n-gram models on selected samples only or stream the whole train split.")
+    parser.add_argument("--llm_handles", type=str, nargs='*', default=['babbage-002'],
+                        help="LLM estimators, HF handles (containing '/') or OpenAI model names. Ghostbuster without "
+                             "them uses n-gram features only, as a cheap stage of a cascade.")
+    parser.add_argument("--batch_size", type=int, default=64,
+                        help="Number of texts scored by LLM estimators at once.")
+    parser.add_argument("--logprob_cache", type=str, default='./cache/logprobs.sqlite',
+                        help="Path of persistent log-probabilities cache.")
+    parser.add_argument("--num_workers", type=int, default=0,
+                        help="Number of worker processes for data selection and n-gram counting.")
+    parser.add_argument("--C", type=float, default=1.0,
+                        help="Inverse regularization strength of ghostbuster classifier.")
+    parser.add_argument("--max_iter", type=int, default=1000,
+                        help="Maximal number of iterations of ghostbuster classifier.")
+    parser.add_argument("--test_size", type=float, default=0.3,
+                        help="Fraction of validation samples.")
+    parser.add_argument("--stage_cache", type=str, default='./cache/stages',
+                        help="Directory of cached stage results.")
+    parser.add_argument("--recompute", type=str, nargs='*', default=[],
+                        choices=['selection', 'tokens', 'ngram', 'logprobs', 'features', 'fit'],
+                        help="Stages to recompute even if cached.")
+    parser.add_argument("--nexus", type=str, choices=['neptune', 'local', 'none'], default='neptune',
+                        help="Where to upload the trained detector.")
+    parser.add_argument("--nexus_dir", type=str, default='./cache/nexus',
+                        help="Directory of local nexus.")
+
+    args = parser.parse_args()
+    main(args)
@@ -3,7 +3,7 @@ from uuid import uuid4
 import argparse
 
 import torch
-from datasets import load_dataset, concatenate_datasets
+from datasets import load_dataset
 from dotenv import load_dotenv
 from transformers import AutoModelForSequenceClassification, TrainingArguments, Trainer
 from transformers import AutoTokenizer
@@ -12,12 +12,14 @@ from transformers import EarlyStoppingCallback
 
 from detectors.metrics import Conclusion
 from detectors.neptune.nexus import NeptuneNexus
+from detectors.roberta.model import RobertaDetector
+from detectors.utils.selection import select_samples
 from detectors.utils.training import calculate_classification
 from detectors.utils.training import report_classification
 
 
-def preprocess(row, tokenizer):
-    return tokenizer(row["output"], truncation=True)
+def preprocess(row, tokenizer, max_length):
+    return tokenizer(row["output"], truncation=True, max_length=max_length)
 
 
 def compute_metrics(eval_pred):
@@ -57,16 +59,11 @@ def perform_evaluation(eval_data, model, data_collator):
     return results
 
 
-def process_data_split(split, selection_size, tokenizer):
-    split = split.filter(lambda x: len(x['output']) < 15000)
-    human = split.filter(lambda x: x['label'] == 0)
-    ai = split.filter(lambda x: x['label'] == 3).map(lambda x: {"label": 1})
+def process_data_split(split, selection_size, tokenizer, max_length, seed=0):
+    split = select_samples(split, {0: selection_size, 3: selection_size}, max_length=15000, balance=True, seed=seed)
+    split = split.map(lambda x: {"label": [int(label == 3) for label in x['label']]}, batched=True)
 
-    selection_size = min(selection_size, len(human), len(ai))
-
-    split = concatenate_datasets([human.shuffle().take(selection_size), ai.shuffle().take(selection_size)])
-
-    return split.map(lambda x: preprocess(x, tokenizer), batched=True, remove_columns=['prompt', 'user_id'])
+    return split.map(lambda x: preprocess(x, tokenizer, max_length), batched=True, remove_columns=['prompt', 'user_id'])
 
 
 def main():
@@ -78,6 +75,10 @@ def main():
     parser.add_argument('--train_size', type=int, default=5000, help='Number of training examples.')
     parser.add_argument('--test_size', type=int, default=1000, help='Number of test examples.')
     parser.add_argument('--batch_size', type=int, default=64, help='batch size for both training and evaluation.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of data selection.')
+    parser.add_argument('--max_length', type=int, default=512, help='Texts are truncated to this number of tokens.')
+    parser.add_argument('--quantize', action='store_true',
+                        help='Quantize the detector to int8 when it is served on CPU.')
 
     args = parser.parse_args()
 
@@ -92,12 +93,13 @@ def main():
 
     tokenizer = AutoTokenizer.from_pretrained(model_handle)
 
-    finetune_data = process_data_split(data['train'], train_size, tokenizer).train_test_split(test_size=0.3)
-    test_data = process_data_split(data['test'], test_size, tokenizer)
+    finetune_data = process_data_split(data['train'], train_size, tokenizer, args.max_length,
+                                       args.seed).train_test_split(test_size=0.3)
+    test_data = process_data_split(data['test'], test_size, tokenizer, args.max_length, args.seed)
 
     data_collator = DataCollatorWithPadding(tokenizer=tokenizer)
 
-    id2label = {0: "HUMAN", 1: "AI"}
+    id2label = {0: "Human", 1: "AI"}
     label2id = {v: k for k, v in id2label.items()}
 
     model = AutoModelForSequenceClassification.from_pretrained(
@@ -122,7 +124,7 @@ def main():
         load_best_model_at_end=True,
         metric_for_best_model='f1',
         report_to="neptune",
-        fp16=True
+        fp16=torch.cuda.is_available()
     )
 
     trainer = Trainer(
@@ -140,7 +142,9 @@ def main():
 
     nexus = NeptuneNexus()
 
-    ret = Conclusion("empty".encode("UTF-8"), run_surname, [f"xlsum[{train_size}]"],
+    detector = RobertaDetector(trainer.model, tokenizer, max_length=args.max_length, quantize=args.quantize)
+
+    ret = Conclusion(detector.store_weights(), run_surname, [f"xlsum[{train_size}]"],
                      perform_evaluation(finetune_data["train"], model, data_collator),
                      perform_evaluation(test_data, model, data_collator))
 
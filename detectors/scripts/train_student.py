@@ -0,0 +1,129 @@
+import argparse
+import logging
+from uuid import uuid4
+
+import numpy as np
+from datasets import load_dataset
+from dotenv import load_dotenv
+from sklearn.model_selection import train_test_split
+from tqdm.auto import tqdm
+
+from detectors.cascade.model import LABELS, label_order
+from detectors.metrics import Conclusion
+from detectors.models.scope import request_scope
+from detectors.neptune.local import MockNexus
+from detectors.student.model import StudentDetector, make_student, fit_student, teacher_agreement
+from detectors.utils.loading import load_detector
+from detectors.utils.selection import select_samples
+from detectors.utils.stages import StageCache
+from detectors.utils.training import report_classification
+
+
+def make_nexus(args):
+    if args.nexus == 'local':
+        return MockNexus(args.nexus_dir)
+    from detectors.neptune.nexus import NeptuneNexus
+    return NeptuneNexus()
+
+
+def teacher_probabilities(detector, texts):
+    """
+    :return: teacher's probabilities of 'AI'
+    """
+    column = label_order(detector.get_labels())[LABELS.index('AI')]
+    probabilities = []
+    for text in tqdm(texts, desc='Scoring texts by teacher'):
+        with request_scope():
+            probabilities.append(detector.predict_proba(text)[column])
+    return np.array(probabilities)
+
+
+def main(args):
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    run = uuid4()
+    print(f'Starting run {run} with following arguments: ', args)
+
+    nexus = make_nexus(args)
+    dataset = load_dataset(args.dataset_handle, args.dataset_config, streaming=args.streaming)['train']
+    # Distillation needs no ground truth, so texts of any label are useful, labels are only used for evaluation.
+    selection = select_samples(dataset, {label: args.samples_per_label for label in args.labels},
+                               max_length=args.max_length, seed=args.seed)
+    texts, is_llm = selection['output'], np.asarray(selection['label']) != args.human_label
+
+    # Teacher probabilities are the expensive part, they are reused by runs with other student parameters.
+    cache = StageCache(args.stage_cache, recompute=args.recompute)
+    params = {key: getattr(args, key) for key in ['teacher_classpath', 'teacher_run_id', 'dataset_handle',
+                                                  'dataset_config', 'labels', 'samples_per_label', 'max_length',
+                                                  'seed']}
+    _, teacher = cache.run('teacher', params, lambda: teacher_probabilities(
+        load_detector(nexus, args.teacher_classpath, args.teacher_run_id), texts))
+
+    indices_train, indices_test = train_test_split(np.arange(len(texts)), test_size=args.test_size, shuffle=True,
+                                                   stratify=is_llm, random_state=args.seed)
+    student = make_student(n_features=2 ** args.hash_bits, ngram_range=args.ngram_range, C=args.C,
+                           max_iter=args.max_iter)
+    fit_student(student, [texts[i] for i in indices_train], teacher[indices_train])
+    detector = StudentDetector(student, teacher=f'{args.teacher_classpath}:{args.teacher_run_id}')
+
+    conclusions, agreements = [], {}
+    for split, indices in [('train', indices_train), ('validation', indices_test)]:
+        scores = detector.predict_proba_batch([texts[i] for i in indices])[:, LABELS.index('AI')]
+        conclusions.append(report_classification(is_llm[indices], scores))
+        agreements.update({f'teacher/{split}/{k}': v for k, v in teacher_agreement(scores, teacher[indices]).items()})
+    print(f'Training {run} finished, validation metrics: {conclusions[1].metrics}, agreement with teacher: '
+          f'{agreements}')
+
+    conclusion = Conclusion(weights=detector.store_weights(), detector_handle='student',
+                            datasets=[args.dataset_config], train_conclusion=conclusions[0],
+                            validation_conclusion=conclusions[1])
+    nexus.conclude_run(run, conclusion=conclusion,
+                       extra_data={'info': 'CORRECT', 'args': str(vars(args)), **agreements})
+    print(f'Upload of run {run} finished successfully.')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Distill trained detector into a fast CPU-only student over hashed "
+                                                 "character n-grams.")
+
+    parser.add_argument("--teacher_classpath", type=str, required=True,
+                        help="Classpath of the teacher, e.g. detectors.ghostbuster.model.GhostbusterDetector.")
+    parser.add_argument("--teacher_run_id", type=str, required=True,
+                        help="Run of the teacher in nexus.")
+    parser.add_argument("--dataset_handle", type=str, default="anakib1/mango-truth",
+                        help="Dataset handle to use for loading data.")
+    parser.add_argument("--dataset_config", type=str, default="xlsum",
+                        help="Dataset configuration to load.")
+    parser.add_argument("--streaming", action='store_true',
+                        help="Stream the dataset instead of downloading it.")
+    parser.add_argument("--labels", type=int, nargs='+', default=[0, 1, 2, 3],
+                        help="Labels of texts used for distillation.")
+    parser.add_argument("--human_label", type=int, default=0,
+                        help="Label of human texts, the others are generated.")
+    parser.add_argument("--samples_per_label", type=int, default=5000,
+                        help="Number of texts of every label.")
+    parser.add_argument("--max_length", type=int, default=1750,
+                        help="Maximum output length for filtering data.")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed of data selection and train/validation split.")
+    parser.add_argument("--hash_bits", type=int, default=20,
+                        help="Student uses 2 ** hash_bits hashed features.")
+    parser.add_argument("--ngram_range", type=int, nargs=2, default=[1, 4],
+                        help="Lengths of character n-grams.")
+    parser.add_argument("--C", type=float, default=1.0,
+                        help="Inverse regularization strength of the student.")
+    parser.add_argument("--max_iter", type=int, default=1000,
+                        help="Maximal number of iterations of the student.")
+    parser.add_argument("--test_size", type=float, default=0.2,
+                        help="Fraction of validation samples.")
+    parser.add_argument("--stage_cache", type=str, default='./cache/stages',
+                        help="Directory of cached teacher probabilities.")
+    parser.add_argument("--recompute", type=str, nargs='*', default=[], choices=['teacher'],
+                        help="Recompute teacher probabilities even if cached.")
+    parser.add_argument("--nexus", type=str, choices=['neptune', 'local'], default='neptune',
+                        help="Where the teacher is loaded from and the student is uploaded to.")
+    parser.add_argument("--nexus_dir", type=str, default='./cache/nexus',
+                        help="Directory of local nexus.")
+
+    args = parser.parse_args()
+    main(args)
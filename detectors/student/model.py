@@ -0,0 +1,96 @@
+import pickle
+from typing import Dict, List
+
+import numpy as np
+from sklearn.pipeline import Pipeline
+
+from detectors.cascade.model import LABELS
+from detectors.interfaces import IDetector
+from detectors.utils.loading import ensure_type, ensure_obj
+
+
+def make_student(n_features: int = 2 ** 20, ngram_range=(1, 4), C: float = 1.0, max_iter: int = 1000) -> Pipeline:
+    """
+    Student is a linear model over hashed character n-grams. Hashing needs no vocabulary, so features of a text are
+    computed in one pass over it, and the model is as fast as tokenization.
+    :param n_features: number of hashed features
+    :param ngram_range: lengths of character n-grams
+    :param C: inverse regularization strength
+    :param max_iter: maximal number of iterations of the solver
+    :return: untrained student
+    """
+    from sklearn.feature_extraction.text import HashingVectorizer
+    from sklearn.linear_model import LogisticRegression
+
+    return Pipeline([
+        ('features', HashingVectorizer(analyzer='char_wb', ngram_range=tuple(ngram_range), n_features=n_features,
+                                       alternate_sign=False, norm='l2', dtype=np.float32)),
+        ('clf', LogisticRegression(C=C, max_iter=max_iter, solver='liblinear'))])
+
+
+def fit_student(student: Pipeline, texts: List[str], teacher_probabilities) -> Pipeline:
+    """
+    Distills teacher into student by minimizing cross-entropy with teacher's soft labels: every text is used once as AI
+    with weight of teacher's AI probability, and once as human with the remaining weight.
+    :param student: student to fit, see `make_student`
+    :param texts: training texts, they need no ground truth labels
+    :param teacher_probabilities: teacher's probability of 'AI' for every text
+    :return: fitted student
+    """
+    teacher_probabilities = np.asarray(teacher_probabilities, dtype=np.float64)
+    if len(texts) != len(teacher_probabilities):
+        raise Exception(f"Got {len(texts)} texts, but {len(teacher_probabilities)} teacher probabilities.")
+    labels = np.concatenate([np.ones(len(texts)), np.zeros(len(texts))])
+    weights = np.concatenate([teacher_probabilities, 1 - teacher_probabilities])
+    student.fit(list(texts) * 2, labels, clf__sample_weight=weights)
+    return student
+
+
+def teacher_agreement(student_probabilities, teacher_probabilities) -> Dict[str, float]:
+    """
+    :param student_probabilities: student's probabilities of 'AI'
+    :param teacher_probabilities: teacher's probabilities of 'AI' for the same texts
+    :return: fraction of texts with the same decision at 0.5, and mean absolute difference of probabilities
+    """
+    student_probabilities = np.asarray(student_probabilities)
+    teacher_probabilities = np.asarray(teacher_probabilities)
+    return {'agreement': float(np.mean((student_probabilities > 0.5) == (teacher_probabilities > 0.5))),
+            'mean_absolute_difference': float(np.mean(np.abs(student_probabilities - teacher_probabilities)))}
+
+
+class StudentDetector(IDetector):
+    """
+    CPU-only detector distilled from an expensive teacher, see `fit_student`.
+    """
+
+    def __init__(self, clf: Pipeline = None, teacher: str = None):
+        """
+        :param clf: fitted student
+        :param teacher: description of the teacher, e.g. its classpath and run
+        """
+        self.clf: Pipeline = clf
+        self.teacher = teacher
+
+    def predict_proba(self, text: str) -> np.array:
+        return self.predict_proba_batch([text])[0]
+
+    def predict_proba_batch(self, texts: List[str]) -> np.ndarray:
+        """
+        :return: probabilities of every text in the order of `get_labels`
+        """
+        ai = self.clf.predict_proba(texts)[:, list(self.clf.classes_).index(1)]
+        return np.stack([1 - ai, ai], axis=1)
+
+    def get_labels(self) -> List[str]:
+        return LABELS
+
+    def store_weights(self) -> bytes:
+        return pickle.dumps({'clf': self.clf, 'teacher': self.teacher})
+
+    def load_weights(self, weights: bytes) -> None:
+        try:
+            dct = ensure_type(pickle.loads(weights), dict)
+            self.clf = ensure_type(ensure_obj(dct, 'clf'), Pipeline)
+            self.teacher = dct.get('teacher')
+        except Exception as e:
+            raise Exception("Error occurred while loading weights.", e)
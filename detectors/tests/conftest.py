@@ -0,0 +1,26 @@
+import pytest
+import torch
+from tokenizers import Tokenizer, models, pre_tokenizers
+from transformers import GPT2Config, GPT2LMHeadModel, PreTrainedTokenizerFast
+
+WORDS = ['<pad>', '<unk>', '<bos>', 'the', 'quick', 'brown', 'fox', 'jumps', 'over', 'lazy', 'dog']
+
+
+@pytest.fixture(scope='session')
+def tokenizer():
+    """
+    Word level tokenizer of `WORDS`, BOS is not added by the tokenizer itself.
+    """
+    backend = Tokenizer(models.WordLevel({word: i for i, word in enumerate(WORDS)}, unk_token='<unk>'))
+    backend.pre_tokenizer = pre_tokenizers.Whitespace()
+    return PreTrainedTokenizerFast(tokenizer_object=backend, bos_token='<bos>', eos_token='<bos>', pad_token='<pad>',
+                                   unk_token='<unk>', model_max_length=64)
+
+
+@pytest.fixture(scope='session')
+def model():
+    """
+    Tiny randomly initialized GPT-2 over `WORDS`.
+    """
+    torch.manual_seed(0)
+    return GPT2LMHeadModel(GPT2Config(vocab_size=len(WORDS), n_positions=64, n_embd=16, n_layer=2, n_head=2)).eval()
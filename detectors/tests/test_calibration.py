@@ -0,0 +1,41 @@
+import numpy as np
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import f1_score
+
+from detectors.utils.calibration import best_f1_threshold, fit_sigmoid, fit_sigmoid_slope
+
+
+def brute_force_threshold(X, y):
+    best, optimal = 0, np.sort(X)[0]
+    for C in np.sort(X):
+        f1 = f1_score(y, (X > C).astype(int))
+        if f1 > best:
+            best, optimal = f1, C
+    return optimal
+
+
+def test_sorted_sweep_matches_brute_force():
+    rng = np.random.default_rng(0)
+    for n in [1, 7, 100]:
+        X = np.round(np.concatenate([rng.normal(10, 3, n), rng.normal(13, 3, n)]), 1)
+        y = np.concatenate([np.zeros(n), np.ones(n)])
+        assert best_f1_threshold(X, y) == brute_force_threshold(X, y)
+
+
+def test_sigmoid_fit_matches_logistic_regression():
+    rng = np.random.default_rng(1)
+    X = np.concatenate([rng.normal(10, 3, 5000), rng.normal(14, 3, 5000)])
+    y = np.concatenate([np.zeros(5000), np.ones(5000)])
+
+    slope, threshold = fit_sigmoid(X, y)
+    reference = LogisticRegression(C=1e9).fit(X[:, None], y)
+    np.testing.assert_allclose(slope, reference.coef_[0, 0], rtol=1e-3)
+    np.testing.assert_allclose(threshold, -reference.intercept_[0] / reference.coef_[0, 0], rtol=1e-3)
+
+    np.testing.assert_allclose(fit_sigmoid_slope(X, y, threshold), slope, rtol=1e-6)
+
+
+def test_sigmoid_fit_is_finite_on_separable_data():
+    slope, threshold = fit_sigmoid([1, 2, 3, 4], [0, 0, 1, 1])
+    assert np.isfinite(slope) and slope > 0
+    np.testing.assert_allclose(threshold, 2.5)
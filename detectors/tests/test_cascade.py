@@ -0,0 +1,70 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from compute.core.engine import ComputeEngine
+from compute.core.detectors import MockDetectorsEngine
+from compute.core.mock_broker import MockMessageBroker
+from compute.models.communication import ComputeRequest
+from detectors.cascade.model import CascadeDetector, CascadeStage
+from detectors.mocks import MockDetector
+
+
+class FixedDetector(MockDetector):
+    def __init__(self, probabilities=None, labels=None):
+        super().__init__(labels)
+        self.probabilities = probabilities
+        self.calls = 0
+
+    def predict_proba(self, text: str) -> np.array:
+        self.calls += 1
+        return np.array(self.probabilities)
+
+    def store_weights(self) -> bytes:
+        return pickle.dumps((self.probabilities, self.labels))
+
+    def load_weights(self, weights: bytes) -> None:
+        self.probabilities, self.labels = pickle.loads(weights)
+
+
+def make_cascade(cheap_ai):
+    cheap = FixedDetector([1 - cheap_ai, cheap_ai], ['Human', 'AI'])
+    expensive = FixedDetector([0.9, 0.1], ['LLM', 'Human'])
+    return CascadeDetector([CascadeStage('cheap', cheap, 0.2, 0.8), CascadeStage('expensive', expensive)])
+
+
+def test_certain_cheap_stage_decides_alone():
+    cascade = make_cascade(0.95)
+
+    probabilities, stage = cascade.predict_decision('text')
+
+    assert stage == 'cheap' and cascade.stages[1].detector.calls == 0
+    assert np.allclose(probabilities, [0.05, 0.95])
+
+
+def test_uncertain_cheap_stage_escalates_with_labels_mapped_by_name():
+    cascade = make_cascade(0.5)
+
+    probabilities, stage = cascade.predict_decision('text')
+
+    assert stage == 'expensive'
+    assert np.allclose(probabilities, [0.1, 0.9])
+    assert cascade.decision_rates() == {'cheap': 0.0, 'expensive': 1.0}
+
+
+def test_stage_missing_label_is_rejected():
+    with pytest.raises(Exception):
+        CascadeDetector([CascadeStage('cheap', FixedDetector([0.5, 0.5], ['Spam', 'Human']))])
+
+
+def test_weights_round_trip_and_compute_reports_stage():
+    cascade = CascadeDetector()
+    cascade.load_weights(make_cascade(0.5).store_weights())
+    engine = ComputeEngine(MockDetectorsEngine(cascade), MockMessageBroker())
+
+    response = engine.process_request(ComputeRequest('id', 'text', 'mock_detector'))
+
+    assert response.verdict['stage'] == 'expensive'
+    assert [x['label'] for x in response.verdict['labels']] == ['Human', 'AI']
+    assert np.isclose(response.verdict['labels'][1]['probability'], 0.9)
@@ -0,0 +1,61 @@
+import sys
+
+import numpy as np
+from sklearn.metrics import roc_curve, roc_auc_score, precision_score, recall_score, f1_score, accuracy_score
+
+from detectors.utils.training import ClassificationAccumulator, calculate_classification, report_classification, \
+    tpr_at_fpr_threshold
+
+
+def sample(n, seed=0):
+    rng = np.random.default_rng(seed)
+    y = rng.integers(0, 2, n)
+    return y, np.round(np.clip(rng.normal(0.4 + 0.2 * y, 0.2), 0, 1), 3)
+
+
+def test_metrics_match_sklearn():
+    y, scores = sample(2000)
+    fpr, tpr, _ = roc_curve(y, scores)
+    y_pred = scores > 0.5
+
+    metrics = calculate_classification(y, scores)
+
+    np.testing.assert_allclose(metrics.auc, roc_auc_score(y, scores))
+    np.testing.assert_allclose(metrics.tpr_at_1_percent_fpr, tpr_at_fpr_threshold(fpr, tpr, 0.01))
+    np.testing.assert_allclose(metrics.tpr_at_10_percent_fpr, tpr_at_fpr_threshold(fpr, tpr, 0.1))
+    np.testing.assert_allclose(metrics.precision, precision_score(y, y_pred))
+    np.testing.assert_allclose(metrics.recall, recall_score(y, y_pred))
+    np.testing.assert_allclose(metrics.f1, f1_score(y, y_pred))
+    np.testing.assert_allclose(metrics.accuracy, accuracy_score(y, y_pred))
+
+
+def test_streaming_histogram_approximates_exact_metrics():
+    y, scores = sample(10000, seed=1)
+    exact = ClassificationAccumulator().update(y, scores).metrics()
+
+    streaming = ClassificationAccumulator(bins=1000)
+    for i in range(0, len(y), 512):
+        streaming.update(y[i:i + 512], scores[i:i + 512])
+    approximate = streaming.metrics()
+
+    assert approximate.f1 == exact.f1 and approximate.accuracy == exact.accuracy
+    np.testing.assert_allclose(approximate.auc, exact.auc, atol=1e-3)
+    np.testing.assert_allclose(approximate.tpr_at_10_percent_fpr, exact.tpr_at_10_percent_fpr, atol=1e-2)
+
+
+def test_single_class_gives_diagonal_roc():
+    assert ClassificationAccumulator().update(np.ones(5), np.linspace(0, 1, 5)).roc()[2] == 0.5
+
+
+def test_representations_render_without_leaking_figures():
+    y, scores = sample(200)
+    representations = report_classification(y, scores).representations
+
+    for _ in range(5):
+        charts = representations.render()
+    assert set(charts) == {'roc_curve', 'clf_report'}
+    assert all(png.startswith(b'\x89PNG') for png in charts.values())
+    assert 'matplotlib.pyplot' not in sys.modules or not sys.modules['matplotlib.pyplot'].get_fignums()
+
+    background = representations.render_async().result(timeout=60)
+    assert all(png.startswith(b'\x89PNG') for png in background.values())
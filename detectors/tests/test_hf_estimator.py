@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from detectors.models import registry as registry_module
+from detectors.models.backends import BackendConfig
+from detectors.models.cache import LogProbCache
+from detectors.models.hf import HFProbabilityEstimator
+from detectors.models.scope import request_scope
+from detectors.perplexity.engine import PerplexityEngine
+from detectors.perplexity.model import PerplexityModel
+
+TEXTS = ['the quick brown fox', 'lazy dog jumps over the fox', 'the dog']
+
+
+@pytest.fixture
+def forwards(monkeypatch, model, tokenizer):
+    monkeypatch.setattr(registry_module, 'load_causal_lm', lambda handle, backend: model)
+    monkeypatch.setattr(registry_module, 'get_tokenizer', lambda handle: tokenizer)
+
+    calls = []
+    forward = PerplexityEngine._forward
+    monkeypatch.setattr(PerplexityEngine, '_forward', lambda self, *args: calls.append(1) or forward(self, *args))
+    return calls
+
+
+def test_log_probas_match_engine(forwards):
+    estimator = HFProbabilityEstimator('org/tiny', BackendConfig(device='cpu'))
+
+    results = estimator.get_text_log_proba_batch(TEXTS)
+
+    for text, (tokens, logprobs), nll in zip(TEXTS, results, estimator.engine.token_nll(TEXTS)):
+        assert tokens == text.split()
+        np.testing.assert_allclose(logprobs, -nll)
+
+
+def test_request_scope_shares_forward_pass(forwards):
+    backend = BackendConfig(device='cpu')
+    estimator = HFProbabilityEstimator('org/tiny', backend)
+    detector = PerplexityModel('org/tiny', perplexity_threshold=10, scaling_factor=0.1, backend=backend)
+
+    with request_scope():
+        logprobs = estimator.get_text_log_proba(TEXTS[0])[1]
+        proba = detector.predict_proba(TEXTS[0])
+        assert len(forwards) == 1
+    detector.predict_proba(TEXTS[0])
+    assert len(forwards) == 2
+
+    human = 1 / (1 + np.exp(-0.1 * (np.exp(-np.mean(logprobs)) - 10)))
+    np.testing.assert_allclose(proba, [1 - human, human])
+
+
+def test_perplexity_model_caches_hf_log_probas(forwards, tmp_path):
+    detector = PerplexityModel('org/tiny', perplexity_threshold=10, scaling_factor=0.1,
+                               backend=BackendConfig(device='cpu'))
+    detector.use_cache(LogProbCache(str(tmp_path / 'cache.sqlite')))
+
+    first = detector.predict_proba(TEXTS[0])
+    second = detector.predict_proba(TEXTS[0])
+
+    assert len(forwards) == 1
+    np.testing.assert_allclose(first, second)
+    assert detector.engine is not None
+
+    bfloat16 = PerplexityModel('org/tiny', perplexity_threshold=10, scaling_factor=0.1,
+                                backend=BackendConfig(device='cpu', dtype='bfloat16'))
+    bfloat16.use_cache(LogProbCache(str(tmp_path / 'cache.sqlite')))
+    assert bfloat16.estimator.model_handle != detector.estimator.model_handle
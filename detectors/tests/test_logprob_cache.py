@@ -0,0 +1,61 @@
+import numpy as np
+
+from detectors.interfaces import EstimationLanguageModel
+from detectors.models.cache import LogProbCache, CachedEstimationLanguageModel
+
+
+class CountingEstimator(EstimationLanguageModel):
+    model_name = 'counting'
+
+    def __init__(self):
+        self.calls = 0
+
+    def get_text_log_proba(self, text):
+        self.calls += 1
+        tokens = text.split()
+        return tokens, -np.arange(1, len(tokens) + 1) / 3
+
+
+def test_repeated_texts_are_served_from_cache(tmp_path):
+    estimator = CountingEstimator()
+    cached = CachedEstimationLanguageModel(estimator, LogProbCache(str(tmp_path / 'cache.sqlite')))
+
+    first = cached.get_text_log_proba_batch(['a b c', 'd e'])
+    second = cached.get_text_log_proba_batch(['d e', 'a b c', 'f'])
+
+    assert estimator.calls == 3
+    assert second[0][0] == ['d', 'e']
+    np.testing.assert_array_equal(second[1][1], first[0][1])
+    np.testing.assert_allclose(second[1][1], [-1 / 3, -2 / 3, -1], rtol=1e-6)
+
+    reopened = CachedEstimationLanguageModel(estimator, LogProbCache(str(tmp_path / 'cache.sqlite')))
+    reopened.get_text_log_proba('a b c')
+    assert estimator.calls == 3
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    estimator = CountingEstimator()
+    cache = LogProbCache(str(tmp_path / 'cache.sqlite'), max_bytes=1000)
+    cached = CachedEstimationLanguageModel(estimator, cache)
+
+    for i in range(50):
+        cached.get_text_log_proba(' '.join(['token'] * 10) + str(i))
+
+    total, = cache._connect().execute('SELECT SUM(size) FROM logprobs').fetchone()
+    assert total <= 1000
+    cached.get_text_log_proba(' '.join(['token'] * 10) + '49')
+    assert estimator.calls == 50
+
+
+def test_hits_do_not_write_and_size_is_tracked(tmp_path):
+    cache = LogProbCache(str(tmp_path / 'cache.sqlite'))
+    cache.put_many([('a', ['x'], np.zeros(4)), ('b', ['y', 'z'], np.zeros(8)), ('a', ['x'], np.zeros(4))])
+    cache.put_many([('b', ['y'], np.zeros(2))])
+    connection = cache._connect()
+
+    changes = connection.total_changes
+    assert cache.get_many(['a', 'b', 'c'])[2] is None
+    assert connection.total_changes == changes
+
+    size, = connection.execute('SELECT SUM(size) FROM logprobs').fetchone()
+    assert cache._size(connection) == size
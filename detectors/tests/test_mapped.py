@@ -0,0 +1,53 @@
+import pickle
+from uuid import uuid4
+
+import numpy as np
+import pytest
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+from detectors.ghostbuster.model import GhostbusterDetector
+from detectors.neptune.local import MockNexus
+from detectors.utils import mapped
+from detectors.utils.loading import load_detector
+from detectors.utils.mapped import dump_mapped, is_mapped, load_mapped
+
+
+def test_mapped_round_trip_from_bytes_and_path(tmp_path):
+    obj = {"keys": np.arange(10000, dtype=np.int64), "small": np.ones(3), "nested": [np.full((64, 32), 0.5)]}
+    content = dump_mapped(obj)
+
+    assert is_mapped(content)
+    assert not is_mapped(pickle.dumps(obj))
+
+    from_bytes = load_mapped(content, cache_dir=str(tmp_path))
+    path = next(tmp_path.glob('*.map'))
+    from_path = load_mapped(path)
+
+    for loaded in [from_bytes, from_path]:
+        np.testing.assert_array_equal(loaded["keys"], obj["keys"])
+        np.testing.assert_array_equal(loaded["small"], obj["small"])
+        np.testing.assert_array_equal(loaded["nested"][0], obj["nested"][0])
+        assert not loaded["keys"].flags.writeable
+        assert loaded["keys"].ctypes.data % 64 == 0
+
+
+def test_same_content_is_spilled_once(tmp_path):
+    content = dump_mapped(np.zeros(4096))
+
+    load_mapped(content, cache_dir=str(tmp_path))
+    load_mapped(content, cache_dir=str(tmp_path))
+
+    assert len(list(tmp_path.glob('*.map'))) == 1
+
+
+def test_detector_maps_weights_from_nexus_file(tmp_path, monkeypatch):
+    run = uuid4()
+    nexus = MockNexus(str(tmp_path))
+    clf = Pipeline([('scaler', StandardScaler())])
+    nexus.store_run_weights(run, dump_mapped({'clf': clf, 'estimator': [], 'table': np.arange(4096)}))
+    monkeypatch.setattr(mapped, 'spill_mapped', lambda *args: pytest.fail('Weights file should be mapped directly.'))
+
+    detector = load_detector(nexus, 'detectors.ghostbuster.model.GhostbusterDetector', run)
+
+    assert isinstance(detector, GhostbusterDetector)
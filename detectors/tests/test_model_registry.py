@@ -0,0 +1,26 @@
+from detectors.models import registry as registry_module
+from detectors.models.backends import BackendConfig
+from detectors.models.registry import ModelRegistry
+
+
+def test_models_are_shared_and_loaded_lazily(monkeypatch):
+    loads = []
+    monkeypatch.setattr(registry_module, 'load_causal_lm', lambda handle, backend: loads.append(handle) or object())
+    registry = ModelRegistry()
+    cpu = BackendConfig(device='cpu')
+
+    first = registry.acquire('org/model', cpu)
+    second = registry.acquire('org/model', cpu)
+    other_dtype = registry.acquire('org/model', BackendConfig(device='cpu', dtype='bfloat16'))
+    assert loads == []
+
+    assert first.model is second.model
+    assert other_dtype.model is not first.model
+    assert loads == ['org/model', 'org/model']
+    assert registry.loaded()[('org/model', cpu)] == 2
+
+    first.release()
+    first.release()
+    assert registry.loaded()[('org/model', cpu)] == 1
+    second.release()
+    assert ('org/model', cpu) not in registry.loaded()
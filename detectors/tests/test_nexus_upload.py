@@ -0,0 +1,71 @@
+import json
+import threading
+import time
+from uuid import uuid4
+
+import numpy as np
+import pytest
+
+from detectors.metrics import Conclusion
+from detectors.neptune.local import MockNexus
+from detectors.neptune.upload import LocalArtifactStore, upload_conclusion
+from detectors.utils.training import report_classification
+
+
+def make_conclusion(weights=b'weights'):
+    rng = np.random.default_rng(0)
+    y = rng.integers(0, 2, 100)
+    split = report_classification(y, np.clip(0.3 + 0.4 * y + rng.normal(0, 0.2, 100), 0, 1))
+    return Conclusion(weights=weights, detector_handle='mock', datasets=['xlsum'], train_conclusion=split,
+                      validation_conclusion=split)
+
+
+class SlowStore(LocalArtifactStore):
+    def __init__(self, directory, fail=False):
+        super().__init__(directory)
+        self.fail = fail
+        self.active = 0
+        self.max_active = 0
+        self.counter_lock = threading.Lock()
+
+    def upload(self, key, chunks, extension):
+        with self.counter_lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(0.2)
+        if self.fail and key == 'checkpoint':
+            raise Exception('Upload failed.')
+        super().upload(key, chunks, extension)
+        with self.counter_lock:
+            self.active -= 1
+
+
+def test_mock_nexus_stores_conclusion(tmp_path):
+    nexus = MockNexus(str(tmp_path))
+    run = uuid4()
+    weights = bytes(range(256)) * 1000
+
+    handle = nexus.conclude_run_async(run, make_conclusion(weights), extra_data={'info': 'CORRECT'})
+    handle.result(timeout=60)
+
+    assert nexus.load_run_weights(run) == weights
+    values = json.loads(tmp_path.joinpath(str(run), 'values.json').read_text())
+    assert values['info'] == 'CORRECT'
+    assert values['sys/tags'] == ['mock', 'xlsum']
+    assert 0 < values['metrics/validation/auc'] <= 1
+    assert tmp_path.joinpath(str(run), 'charts', 'train', 'roc_curve.png').read_bytes().startswith(b'\x89PNG')
+
+
+def test_uploads_are_concurrent_and_bounded(tmp_path):
+    store = SlowStore(str(tmp_path))
+    weights = b'x' * 10000
+
+    upload_conclusion(store, make_conclusion(weights), max_workers=3, chunk_size=1024)
+
+    assert 1 < store.max_active <= 3
+    assert tmp_path.joinpath('checkpoint.pkl').read_bytes() == weights
+
+
+def test_upload_errors_propagate(tmp_path):
+    with pytest.raises(Exception, match='Upload failed.'):
+        upload_conclusion(SlowStore(str(tmp_path), fail=True), make_conclusion())
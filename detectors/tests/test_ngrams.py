@@ -0,0 +1,165 @@
+import pickle
+from argparse import Namespace
+from collections import OrderedDict, defaultdict
+
+import numpy as np
+import pytest
+import transformers
+from nltk import FreqDist, bigrams, trigrams
+
+from detectors.ghostbuster.features import extract_features
+from detectors.ghostbuster.model import GhostbusterDetector
+from detectors.ghostbuster.ngrams import UnigramModel, TrigramModel, MIN_PROBABILITY, tokenize_corpus
+from detectors.ghostbuster.tables import NgramTable, pack_ngrams
+from detectors.models import tokenizers
+from detectors.scripts.train_pipeline import features_stage, ngram_logprobs_stage
+from detectors.utils.stages import StageCache
+
+CORPUS = [
+    "the quick brown fox jumps over the lazy dog",
+    "the lazy dog sleeps while the quick fox runs",
+    "a quick brown dog jumps over a lazy fox",
+]
+
+
+class CharTokenizer:
+    pad_token = '<pad>'
+    bos_token_id = 1
+
+    def __call__(self, text, add_special_tokens=True):
+        if isinstance(text, list):
+            return {'input_ids': [self(x, add_special_tokens)['input_ids'] for x in text]}
+        return {'input_ids': [self.bos_token_id] * add_special_tokens + [ord(c) for c in text]}
+
+
+@pytest.fixture(autouse=True)
+def char_tokenizer(monkeypatch):
+    monkeypatch.setattr(tokenizers, '_tokenizers', {})
+    monkeypatch.setattr(tokenizers, '_tokenizations', OrderedDict())
+    monkeypatch.setattr(transformers.AutoTokenizer, 'from_pretrained', lambda handle: CharTokenizer())
+
+
+def reference_trigram_log_proba(corpus, text, discount=0.9):
+    tokens = [token for x in corpus for token in CharTokenizer()(x)['input_ids']]
+    bigram_freq = FreqDist(bigrams(tokens))
+    trigram_freq = FreqDist(trigrams(tokens))
+    bigram_continuation_counts = defaultdict(int)
+    trigram_continuation_counts = defaultdict(int)
+    for (w1, w2) in bigram_freq:
+        bigram_continuation_counts[w2] += 1
+    for (w1, w2, w3) in trigram_freq:
+        trigram_continuation_counts[(w2, w3)] += 1
+    total_trigrams = sum(trigram_freq.values())
+
+    tokens = CharTokenizer()(text, add_special_tokens=False)['input_ids']
+    probabilities = []
+    for w1, w2, w3 in trigrams(tokens + ['<pad>', '<pad>']):
+        trigram_discounted = max(trigram_freq.get((w1, w2, w3), 0) - discount, 0) / total_trigrams
+        bigram_continuation = (discount * trigram_continuation_counts.get((w2, w3), 0)) / total_trigrams
+        bigram_prob = (max(bigram_freq.get((w2, w3), 0) - discount, 0) / len(tokens) +
+                       (discount * bigram_continuation_counts.get(w3, 0)) / len(tokens))
+        probabilities.append(trigram_discounted + bigram_continuation * bigram_prob)
+    probabilities = np.array(probabilities)
+    return np.log(probabilities, out=np.ones(len(tokens)) * np.log(MIN_PROBABILITY), where=(probabilities != 0.0))
+
+
+def test_pack_ngrams_round_trip():
+    keys = pack_ngrams([1, 2, 3, 4], 3)
+    assert keys.dtype == np.int64
+    assert len(keys) == 2
+    assert len(set(keys)) == 2
+    assert len(pack_ngrams([1], 2)) == 0
+
+
+def test_table_lookup_missing_keys():
+    table = NgramTable.from_keys(np.array([5, 3, 5, 7]))
+    assert table.lookup(np.array([5, 3, 7, 4, 100])).tolist() == [2, 1, 1, 0, 0]
+    assert table.total() == 4
+
+
+@pytest.mark.parametrize("text", ["the quick dog", "zzz unseen text", "ab", "x", ""])
+def test_trigram_matches_reference(text):
+    model = TrigramModel()
+    model.train(CORPUS)
+
+    tokens, log_proba = model.get_text_log_proba(text)
+
+    assert len(tokens) == len(log_proba)
+    np.testing.assert_allclose(log_proba, reference_trigram_log_proba(CORPUS, text), rtol=1e-12)
+
+
+def test_unigram_log_proba():
+    model = UnigramModel()
+    model.train(CORPUS)
+
+    tokens, log_proba = model.get_text_log_proba("the zebra")
+
+    counts = FreqDist([token for x in CORPUS for token in CharTokenizer()(x)['input_ids']])
+    total = sum(counts.values())
+    expected = [np.log(counts[token] / total) if token in counts else np.log(MIN_PROBABILITY) for token in tokens]
+    np.testing.assert_allclose(log_proba, expected, rtol=1e-12)
+
+
+def test_trigram_quantized_and_pruned_tables():
+    exact = TrigramModel()
+    exact.train(CORPUS)
+    compact = TrigramModel(min_count=2, table_dtype='float16')
+    compact.train(CORPUS)
+
+    assert len(compact.trigram_log_proba) < len(exact.trigram_log_proba)
+    assert compact.trigram_log_proba.values.dtype == np.float16
+
+    quantized = TrigramModel(table_dtype='float16')
+    quantized.train(CORPUS)
+    np.testing.assert_allclose(quantized.get_text_log_proba("the lazy fox")[1],
+                               exact.get_text_log_proba("the lazy fox")[1], atol=1e-2)
+
+
+@pytest.mark.parametrize("chunk_size,num_workers", [(1, 0), (2, 0), (1, 2)])
+def test_streaming_training_matches_single_pass(chunk_size, num_workers):
+    corpus = CORPUS + ["x", "", "yz"] + CORPUS[::-1]
+    single = TrigramModel()
+    single.train(corpus, chunk_size=len(corpus))
+    streamed = TrigramModel()
+    streamed.train(iter(corpus), chunk_size=chunk_size, num_workers=num_workers)
+
+    for table in ['trigram_log_proba', 'backoff_log_proba']:
+        np.testing.assert_array_equal(getattr(single, table).keys, getattr(streamed, table).keys)
+        np.testing.assert_allclose(getattr(single, table).values, getattr(streamed, table).values, rtol=1e-12)
+
+
+
+def test_training_on_tokens_matches_training_on_texts():
+    corpus = CORPUS + ["x", "", "yz"]
+    texts = TrigramModel()
+    texts.train(corpus)
+    tokens = TrigramModel()
+    tokens.train_tokens(tokenize_corpus(CharTokenizer(), corpus), chunk_size=2)
+
+    for table in ['trigram_log_proba', 'backoff_log_proba']:
+        np.testing.assert_array_equal(getattr(texts, table).keys, getattr(tokens, table).keys)
+        np.testing.assert_allclose(getattr(texts, table).values, getattr(tokens, table).values, rtol=1e-12)
+
+def test_weights_store_tokenizer_handle_only():
+    model = UnigramModel(tokenizer_handle='chars')
+    model.train(CORPUS)
+
+    restored = pickle.loads(pickle.dumps(model))
+
+    assert 'tokenizer' not in restored.__dict__
+    assert restored.tokenizer is model.tokenizer
+    np.testing.assert_array_equal(restored.get_text_log_proba("the dog")[1], model.get_text_log_proba("the dog")[1])
+
+
+def test_pipeline_features_match_detector_features(tmp_path):
+    cache = StageCache(str(tmp_path))
+    selection = ('selection', {'texts': CORPUS})
+    args = Namespace(tokenizer_handle='chars', ngram_corpus='selection')
+
+    logprobs = [ngram_logprobs_stage(cache, selection, name, args) for name in ['unigram', 'trigram']]
+    _, features = features_stage(cache, 'ghostbuster', logprobs)
+
+    detector = GhostbusterDetector(None, [model for _, _, model in logprobs])
+    for text, row in zip(CORPUS, features):
+        expected = extract_features([estimator.get_text_log_proba(text)[1] for estimator in detector.estimators])
+        np.testing.assert_allclose(row, expected, rtol=1e-12)
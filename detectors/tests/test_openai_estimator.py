@@ -0,0 +1,92 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pytest
+
+from detectors.ghostbuster.openai import OpenaiProbabilityEstimator
+
+
+class CompletionsHandler(BaseHTTPRequestHandler):
+    """Stand-in for the completions endpoint that echoes prompts split by whitespace."""
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        server = self.server
+        with server.lock:
+            server.requests.append(len(body['prompt']))
+            rate_limited = server.rate_limited > 0
+            server.rate_limited -= 1
+
+        if rate_limited:
+            self._respond(429, {"error": {"message": "Rate limit reached", "type": "requests"}}, {'retry-after': '0'})
+            return
+
+        choices = []
+        for i, prompt in enumerate(body['prompt']):
+            tokens = ['<|endoftext|>'] + prompt[len('<|endoftext|>'):].split()
+            choices.append({"index": i, "text": prompt, "finish_reason": "length",
+                            "logprobs": {"tokens": tokens,
+                                         "token_logprobs": [None] + [-float(len(t)) for t in tokens[1:]],
+                                         "top_logprobs": None, "text_offset": [0] * len(tokens)}})
+        # Choices are returned shuffled, estimator must restore the order.
+        self._respond(200, {"id": "cmpl", "object": "text_completion", "created": 0, "model": body['model'],
+                            "choices": choices[::-1]})
+
+    def _respond(self, status, payload, headers=None):
+        content = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), CompletionsHandler)
+    server.lock = threading.Lock()
+    server.requests = []
+    server.rate_limited = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def estimator(server):
+    return OpenaiProbabilityEstimator(api_key='test', model_name='test-model',
+                                      base_url=f'http://127.0.0.1:{server.server_port}/v1',
+                                      batch_size=3, max_concurrency=2, backoff=0.01)
+
+
+def test_batch_preserves_order(server, estimator):
+    texts = [' '.join(['w' * (i + 1)] * (i % 4 + 1)) for i in range(10)]
+
+    results = estimator.get_text_log_proba_batch(texts)
+
+    assert sorted(server.requests) == [1, 3, 3, 3]
+    for text, (tokens, log_proba) in zip(texts, results):
+        assert tokens == text.split()
+        np.testing.assert_array_equal(log_proba, [-len(t) for t in text.split()])
+
+
+def test_rate_limited_requests_are_retried(server):
+    estimator = OpenaiProbabilityEstimator(api_key='test', model_name='test-model',
+                                           base_url=f'http://127.0.0.1:{server.server_port}/v1',
+                                           max_concurrency=8, backoff=0.01)
+    server.rate_limited = 3
+
+    tokens, log_proba = estimator.get_text_log_proba('a bb ccc')
+
+    assert tokens == ['a', 'bb', 'ccc']
+    np.testing.assert_array_equal(log_proba, [-1, -2, -3])
+    assert len(server.requests) == 4
+    assert estimator.limiter.limit < estimator.max_concurrency
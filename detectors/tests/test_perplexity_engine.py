@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+import torch
+
+from detectors.perplexity.engine import PerplexityEngine
+from detectors.utils.batching import length_batches
+
+TEXTS = ['the quick brown fox jumps over the lazy dog', 'the dog', 'fox', 'lazy lazy dog jumps over the fox',
+         'the quick brown fox jumps over the lazy dog ' * 3]
+
+
+def window_nll(model, ids):
+    ids = torch.tensor([ids])
+    with torch.no_grad():
+        logits = model(input_ids=ids).logits
+    return torch.nn.functional.cross_entropy(logits[0, :-1], ids[0, 1:], reduction='none').numpy()
+
+
+def reference_nll(model, tokenizer, text):
+    return window_nll(model, [tokenizer.bos_token_id] + tokenizer(text)['input_ids'])
+
+
+def test_length_batches_respect_token_budget():
+    lengths = [5, 50, 7, 20, 3, 49]
+    batches = length_batches(lengths, max_batch_tokens=100, max_batch_size=3)
+
+    assert sorted(np.concatenate(batches).tolist()) == list(range(len(lengths)))
+    for batch in batches:
+        assert len(batch) <= 3
+        assert len(batch) == 1 or len(batch) * max(lengths[i] for i in batch) <= 100
+
+
+@pytest.mark.parametrize('max_batch_tokens', [16, 64, 1024])
+def test_batched_nll_matches_single_pass(model, tokenizer, max_batch_tokens):
+    engine = PerplexityEngine(model, tokenizer, max_batch_tokens=max_batch_tokens)
+
+    results = engine.token_nll(TEXTS)
+
+    for text, nll in zip(TEXTS, results):
+        assert len(nll) == len(text.split())
+        np.testing.assert_allclose(nll, reference_nll(model, tokenizer, text), rtol=1e-4, atol=1e-5)
+
+    perplexities = engine.perplexity(TEXTS)
+    np.testing.assert_allclose(perplexities, [np.exp(np.mean(nll)) for nll in results])
+
+
+def reference_sliding_nll(model, tokenizer, text, window, stride):
+    ids = [tokenizer.bos_token_id] + tokenizer(text)['input_ids']
+    nll = []
+    begin, scored = 0, 1
+    while True:
+        end = min(begin + window, len(ids))
+        nll.extend(window_nll(model, ids[begin:end])[scored - begin - 1:])
+        if end == len(ids):
+            return np.array(nll)
+        scored, begin = end, begin + stride
+
+
+@pytest.mark.parametrize('window,stride', [(8, 3), (8, 7), (5, 1)])
+def test_sliding_window_nll(model, tokenizer, window, stride):
+    engine = PerplexityEngine(model, tokenizer, max_batch_tokens=32, window=window, stride=stride)
+
+    results = engine.token_nll(TEXTS)
+
+    for text, nll in zip(TEXTS, results):
+        assert len(nll) == len(text.split())
+        np.testing.assert_allclose(nll, reference_sliding_nll(model, tokenizer, text, window, stride),
+                                   rtol=1e-4, atol=1e-5)
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+import torch
+from tokenizers import Tokenizer, models, pre_tokenizers, processors
+from transformers import PreTrainedTokenizerFast, RobertaConfig, RobertaForSequenceClassification
+
+from detectors.models.backends import BackendConfig
+from detectors.roberta import model as roberta_module
+from detectors.roberta.model import RobertaDetector
+
+WORDS = ['<s>', '<pad>', '</s>', '<unk>', 'the', 'quick', 'brown', 'fox', 'jumps', 'over', 'lazy', 'dog']
+TEXTS = ['the quick brown fox', 'lazy dog jumps over the fox ' * 10, 'the dog', 'fox']
+
+
+@pytest.fixture
+def detector(tmp_path, monkeypatch):
+    monkeypatch.setattr(roberta_module, 'MODELS_DIR', str(tmp_path))
+    backend = Tokenizer(models.WordLevel({word: i for i, word in enumerate(WORDS)}, unk_token='<unk>'))
+    backend.pre_tokenizer = pre_tokenizers.Whitespace()
+    backend.post_processor = processors.TemplateProcessing(single='<s> $A </s>', special_tokens=[('<s>', 0),
+                                                                                                  ('</s>', 2)])
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=backend, bos_token='<s>', eos_token='</s>',
+                                        pad_token='<pad>', unk_token='<unk>', model_max_length=32)
+    torch.manual_seed(0)
+    config = RobertaConfig(vocab_size=len(WORDS), hidden_size=16, num_hidden_layers=2, num_attention_heads=2,
+                           intermediate_size=32, max_position_embeddings=40, pad_token_id=1,
+                           id2label={0: 'Human', 1: 'AI'}, label2id={'Human': 0, 'AI': 1})
+    model = RobertaForSequenceClassification(config).eval()
+    return RobertaDetector(model, tokenizer, max_length=32, max_batch_tokens=64, backend=BackendConfig(device='cpu'))
+
+
+def test_batches_match_single_predictions(detector):
+    probabilities = detector.predict_proba_batch(TEXTS)
+
+    assert detector.get_labels() == ['Human', 'AI']
+    assert np.allclose(probabilities.sum(axis=1), 1)
+    assert np.allclose(probabilities, [detector.predict_proba(text) for text in TEXTS], atol=1e-5)
+
+
+@pytest.mark.parametrize('quantize', [False, True])
+def test_weights_round_trip(detector, quantize):
+    detector.quantize = quantize
+    loaded = RobertaDetector(backend=BackendConfig(device='cpu'))
+    loaded.load_weights(detector.store_weights())
+
+    assert loaded.get_labels() == ['Human', 'AI']
+    assert np.allclose(loaded.predict_proba_batch(TEXTS), detector.predict_proba_batch(TEXTS), atol=0.05)
+    assert isinstance(loaded.model.classifier.dense, torch.ao.nn.quantized.dynamic.Linear) == quantize
+
+    reloaded = RobertaDetector(backend=BackendConfig(device='cpu'))
+    reloaded.load_weights(loaded.store_weights())
+    assert reloaded.path == loaded.path
+    assert np.allclose(reloaded.predict_proba_batch(TEXTS), loaded.predict_proba_batch(TEXTS))
+
+
+def test_truncation_is_logged(detector, caplog):
+    detector.predict_proba_batch(TEXTS[:1])
+    assert not caplog.records
+
+    detector.predict_proba_batch(TEXTS)
+    assert '1 of 4 texts reached 32 tokens' in caplog.text
@@ -0,0 +1,78 @@
+import json
+
+import numpy as np
+import pytest
+from datasets import ClassLabel, Dataset, Features, Value, load_dataset
+
+from detectors.utils.selection import select_samples
+
+
+@pytest.fixture
+def dataset():
+    rng = np.random.default_rng(0)
+    features = Features({'output': Value('string'), 'label': ClassLabel(names=['human', 'a', 'b', 'llm'])})
+    return Dataset.from_dict({'output': ['x' * int(length) for length in rng.integers(1, 200, 5000)],
+                              'label': rng.integers(0, 4, 5000).tolist()}, features=features)
+
+
+def reference(dataset, max_length):
+    rows = [(i, row) for i, row in enumerate(dataset) if len(row['output']) < max_length]
+    return {label: [i for i, row in rows if row['label'] == label] for label in range(4)}
+
+
+def test_selection_is_filtered_reproducible_and_cached(dataset, tmp_path):
+    candidates = reference(dataset, 100)
+
+    selection = select_samples(dataset, {0: 50, 3: None}, max_length=100, seed=1, num_proc=2, cache_dir=tmp_path)
+
+    labels = np.asarray(selection['label'])
+    assert (labels[:50] == 0).all() and (labels[50:] == 3).all()
+    assert len(selection) == 50 + len(candidates[3])
+    assert max(len(text) for text in selection['output']) < 100
+    assert len(list(tmp_path.iterdir())) == 1
+
+    cached = select_samples(dataset, {0: 50, 3: None}, max_length=100, seed=1, cache_dir=tmp_path)
+    assert cached['output'] == selection['output']
+    other_seed = select_samples(dataset, {0: 50, 3: None}, max_length=100, seed=2, cache_dir=tmp_path)
+    assert other_seed['output'] != selection['output']
+
+
+def test_balanced_and_streaming_selection(dataset, tmp_path):
+    balanced = select_samples(dataset, {0: 10000, 3: 10000}, max_length=20, balance=True, cache_dir=tmp_path)
+    smallest = min(len(reference(dataset, 20)[label]) for label in (0, 3))
+    assert np.bincount(balanced['label'], minlength=4).tolist() == [smallest, 0, 0, smallest]
+
+    streamed = select_samples(dataset.to_iterable_dataset(), {0: 30, 3: 20}, max_length=100, cache_dir=tmp_path)
+    assert np.bincount(streamed['label'], minlength=4).tolist() == [30, 0, 0, 20]
+    assert streamed.features == dataset.features
+
+
+def test_balanced_streaming_selection_is_not_stream_prefix(tmp_path):
+    features = Features({'output': Value('string'), 'label': ClassLabel(names=['human', 'llm'])})
+    dataset = Dataset.from_dict({'output': [str(i) for i in range(250)], 'label': [0] * 200 + [1] * 50},
+                                features=features)
+
+    streamed = select_samples(dataset.to_iterable_dataset(), {0: 1000, 1: 1000}, balance=True, cache_dir=tmp_path)
+
+    humans = [int(text) for text, label in zip(streamed['output'], streamed['label']) if label == 0]
+    assert len(humans) == 50 and max(humans) >= 50
+
+
+def test_streams_are_cached_by_their_files(tmp_path):
+    cache_dir = tmp_path.joinpath('selections')
+    streams = []
+    for name, text in [('first', 'a'), ('second', 'b')]:
+        path = tmp_path.joinpath(f'{name}.jsonl')
+        path.write_text('\n'.join(json.dumps({'output': text * (i + 1), 'label': i % 2}) for i in range(20)))
+        streams.append(load_dataset('json', data_files=str(path), streaming=True)['train'])
+
+    selections = [select_samples(stream, {0: 5, 1: 5}, cache_dir=cache_dir) for stream in streams]
+
+    assert {text[0] for text in selections[0]['output']} == {'a'}
+    assert {text[0] for text in selections[1]['output']} == {'b'}
+    assert len(list(cache_dir.iterdir())) == 2
+    assert select_samples(streams[0], {0: 5, 1: 5}, cache_dir=cache_dir)['output'] == selections[0]['output']
+
+    in_memory = Dataset.from_dict({'output': ['c'] * 10, 'label': [0, 1] * 5}).to_iterable_dataset()
+    assert len(select_samples(in_memory, {0: 5, 1: 5}, cache_dir=cache_dir)) == 10
+    assert len(list(cache_dir.iterdir())) == 2
@@ -0,0 +1,29 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from detectors.utils.stages import StageCache
+
+
+def test_stages_are_cached_by_parameters_and_inputs(tmp_path):
+    calls = []
+    compute = lambda value: lambda: calls.append(value) or value
+    cache = StageCache(str(tmp_path))
+
+    upstream_key, _ = cache.run('tokens', {'tokenizer': 'a'}, compute(1))
+    assert cache.run('tokens', {'tokenizer': 'a'}, compute(2)) == (upstream_key, 1)
+    fit_key, _ = cache.run('fit', {'tokens': upstream_key, 'C': 1}, compute(3))
+    assert cache.run('fit', {'tokens': upstream_key, 'C': 2}, compute(4))[1] == 4
+    assert calls == [1, 3, 4]
+
+    assert StageCache(str(tmp_path)).run('fit', {'tokens': upstream_key, 'C': 1}, compute(5)) == (fit_key, 3)
+    assert StageCache(str(tmp_path), recompute=['fit']).run('fit', {'tokens': upstream_key, 'C': 1}, compute(6))[1] == 6
+
+
+def test_concurrent_runs_compute_stage_once(tmp_path):
+    calls = []
+    cache = StageCache(str(tmp_path))
+
+    with ThreadPoolExecutor(4) as executor:
+        results = list(executor.map(lambda _: cache.run('tokens', {}, lambda: calls.append(1) or 'tokens')[1],
+                                    range(8)))
+
+    assert results == ['tokens'] * 8 and calls == [1]
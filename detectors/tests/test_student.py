@@ -0,0 +1,22 @@
+import numpy as np
+
+from detectors.student.model import StudentDetector, make_student, fit_student, teacher_agreement
+
+
+def test_student_imitates_teacher_and_round_trips():
+    rng = np.random.default_rng(0)
+    words = ['delve', 'tapestry', 'furthermore', 'lol', 'gonna', 'btw']
+    texts = [' '.join(rng.choice(words[:3] if i % 2 else words[3:], size=12)) for i in range(200)]
+    # Teacher is confident on texts with AI vocabulary, and uncertain otherwise.
+    teacher = np.array([0.9 if i % 2 else 0.3 for i in range(200)])
+
+    student = StudentDetector(fit_student(make_student(n_features=2 ** 12), texts, teacher))
+    scores = student.predict_proba_batch(texts)[:, 1]
+
+    assert teacher_agreement(scores, teacher)['agreement'] == 1.0
+    assert teacher_agreement(scores, teacher)['mean_absolute_difference'] < 0.1
+
+    loaded = StudentDetector()
+    loaded.load_weights(student.store_weights())
+    assert loaded.get_labels() == ['Human', 'AI']
+    assert np.allclose(loaded.predict_proba(texts[1]), student.predict_proba_batch(texts[1:2])[0])
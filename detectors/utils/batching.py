@@ -0,0 +1,40 @@
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+
+def length_batches(lengths: Sequence[int], max_batch_tokens: int, max_batch_size: int) -> List[np.ndarray]:
+    """
+    Groups sequences of similar length into batches. Sequences are sorted by length, so padding to the longest
+    sequence of the batch wastes little compute, and batch size is capped so that padded batch has at most
+    max_batch_tokens tokens. Sequence longer than the budget gets a batch of its own.
+    :param lengths: length of every sequence
+    :param max_batch_tokens: upper bound of batch_size * longest sequence in batch
+    :param max_batch_size: upper bound of number of sequences in batch
+    :return: list of arrays of sequence indices, longest sequences first
+    """
+    order = np.argsort(-np.asarray(lengths, dtype=np.int64), kind='stable')
+    batches = []
+    start = 0
+    while start < len(order):
+        longest = max(int(lengths[order[start]]), 1)
+        size = max(1, min(max_batch_size, max_batch_tokens // longest, len(order) - start))
+        batches.append(order[start:start + size])
+        start += size
+    return batches
+
+
+def pad_sequences(sequences: List[Sequence[int]], pad_id: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Right-pads sequences to the longest one.
+    :param sequences: token id sequences
+    :param pad_id: id to pad with
+    :return: tuple of input ids and attention mask, both of shape (len(sequences), longest)
+    """
+    longest = max((len(sequence) for sequence in sequences), default=0)
+    input_ids = np.full((len(sequences), longest), pad_id, dtype=np.int64)
+    attention_mask = np.zeros((len(sequences), longest), dtype=np.int64)
+    for i, sequence in enumerate(sequences):
+        input_ids[i, :len(sequence)] = sequence
+        attention_mask[i, :len(sequence)] = 1
+    return input_ids, attention_mask
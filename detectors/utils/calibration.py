@@ -0,0 +1,101 @@
+from typing import Tuple
+
+import numpy as np
+
+from detectors.utils.math import safe_sigmoid
+
+
+def best_f1_threshold(scores, labels) -> float:
+    """
+    Finds threshold C, such that predicting positive label for scores > C maximises F1 score. All candidate thresholds
+    are evaluated in one pass over sorted scores, in O(n log n).
+    :param scores: 1d array of scores, higher scores indicate positive label
+    :param labels: 1d boolean array
+    :return: the smallest of the observed scores with the best F1 score
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    labels = np.asarray(labels).astype(bool)
+    if len(scores) == 0:
+        raise Exception("Can not find threshold of empty data.")
+
+    order = np.argsort(scores, kind='stable')
+    sorted_scores = scores[order]
+    positives_upto = np.cumsum(labels[order])
+    # Candidate C = sorted_scores[i] is evaluated at the last index i of its group of equal scores.
+    last = np.append(sorted_scores[1:] != sorted_scores[:-1], True)
+    candidates = np.flatnonzero(last)
+
+    total_positives = positives_upto[-1]
+    true_positives = total_positives - positives_upto[candidates]
+    predicted_positives = len(scores) - 1 - candidates
+    denominator = predicted_positives + total_positives
+    f1 = np.divide(2 * true_positives, denominator, out=np.zeros(len(candidates)), where=denominator > 0)
+
+    return float(sorted_scores[candidates[np.argmax(f1)]])
+
+
+def _log_loss(z, targets) -> float:
+    # Numerically stable -sum(t * log(sigmoid(z)) + (1 - t) * log(1 - sigmoid(z))).
+    return float(np.sum(np.logaddexp(0, z) - targets * z))
+
+
+def fit_sigmoid(scores, labels, threshold=None, max_iterations: int = 100, tolerance: float = 1e-10) \
+        -> Tuple[float, float]:
+    """
+    Platt scaling: fits P(label | score) = sigmoid(k * (score - c)) by maximum likelihood with Newton iterations.
+    Targets are smoothed as in Platt's method, so the fit stays finite even on separable data.
+    :param scores: 1d array of scores
+    :param labels: 1d boolean array
+    :param threshold: if given, c is fixed to it and only the slope k is fitted
+    :param max_iterations: upper bound of Newton iterations
+    :param tolerance: stop once the relative decrease of the loss is below it
+    :return: tuple of slope k and threshold c
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    labels = np.asarray(labels).astype(bool)
+    positives = labels.sum()
+    negatives = len(labels) - positives
+    targets = np.where(labels, (positives + 1) / (positives + 2), 1 / (negatives + 2))
+
+    # Work with standardized scores, so that Newton steps are well conditioned, and fit z = a * x + b.
+    center = np.mean(scores) if threshold is None else threshold
+    scale = np.std(scores) or 1.0
+    x = (scores - center) / scale
+    features = np.stack([x, np.ones_like(x)], axis=1) if threshold is None else x[:, None]
+
+    weights = np.zeros(features.shape[1])
+    loss = _log_loss(features @ weights, targets)
+    for _ in range(max_iterations):
+        p = safe_sigmoid(features @ weights)
+        gradient = features.T @ (p - targets)
+        hessian = (features * (p * (1 - p))[:, None]).T @ features + 1e-12 * np.eye(len(weights))
+        step = np.linalg.solve(hessian, gradient)
+
+        # Backtracking keeps every step decreasing the loss.
+        rate = 1.0
+        while rate > 1e-8:
+            candidate = weights - rate * step
+            candidate_loss = _log_loss(features @ candidate, targets)
+            if candidate_loss <= loss:
+                break
+            rate /= 2
+        else:
+            break
+        converged = loss - candidate_loss <= tolerance * max(loss, 1.0)
+        weights, loss = candidate, candidate_loss
+        if converged:
+            break
+
+    slope = weights[0] / scale
+    if threshold is None:
+        # a * (s - center) / scale + b = slope * (s - c)
+        threshold = center - weights[1] / weights[0] * scale if weights[0] != 0 else center
+    return float(slope), float(threshold)
+
+
+def fit_sigmoid_slope(scores, labels, threshold) -> float:
+    """
+    Fits slope k of P(label | score) = sigmoid(k * (score - threshold)), see `fit_sigmoid`.
+    :return: the slope k
+    """
+    return fit_sigmoid(scores, labels, threshold)[0]
@@ -0,0 +1,84 @@
+import atexit
+import io
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, Optional
+
+import numpy as np
+
+_executor: Optional[ProcessPoolExecutor] = None
+_lock = threading.Lock()
+
+
+def _to_png(figure) -> bytes:
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    FigureCanvasAgg(figure)
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format='png')
+    figure.clear()
+    return buffer.getvalue()
+
+
+def render_roc(fpr: np.ndarray, tpr: np.ndarray, auc: float) -> bytes:
+    """
+    Renders ROC curve to PNG. Figures are created without pyplot, so they are not registered in its global state and
+    are freed as soon as they are rendered.
+    """
+    from matplotlib.figure import Figure
+    from sklearn.metrics import RocCurveDisplay
+
+    figure = Figure()
+    RocCurveDisplay(fpr=fpr, tpr=tpr, roc_auc=auc).plot(ax=figure.subplots())
+    return _to_png(figure)
+
+
+def render_confusion(confusion: np.ndarray) -> bytes:
+    """
+    Renders confusion matrix to PNG.
+    """
+    from matplotlib.figure import Figure
+    from sklearn.metrics import ConfusionMatrixDisplay
+
+    figure = Figure()
+    ConfusionMatrixDisplay(confusion).plot(ax=figure.subplots())
+    return _to_png(figure)
+
+
+def render_representations(representations) -> Dict[str, bytes]:
+    """
+    :param representations: ClassificationRepresentations to render
+    :return: PNG bytes of every chart by its name
+    """
+    return {
+        'roc_curve': render_roc(representations.fpr, representations.tpr, representations.auc),
+        'clf_report': render_confusion(representations.confusion),
+    }
+
+
+def render_in_background(representations) -> Future:
+    """
+    Renders charts in a background process, so that training loop is not blocked by matplotlib. The process is
+    spawned rather than forked, so it does not inherit threads and locks of the training process, and it is shut down
+    at interpreter exit.
+    :param representations: ClassificationRepresentations to render
+    :return: future of the result of `render_representations`
+    """
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+            atexit.register(shutdown)
+        return _executor.submit(render_representations, representations)
+
+
+def shutdown() -> None:
+    """
+    Waits for pending renders and stops the background process.
+    """
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
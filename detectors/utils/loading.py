@@ -1,4 +1,6 @@
-from typing import Any, Dict
+import importlib
+import threading
+from typing import Any, Dict, Optional
 
 
 def ensure_type(obj: Any, clazz) -> Any:
@@ -12,3 +14,46 @@ def ensure_obj(dct: Dict, handle: str) -> Any:
         raise Exception(f"Dictionary is missing key {handle}.")
 
     return dct[handle]
+
+
+_import_lock = threading.RLock()
+
+
+def lazy_import(module: str, attribute: Optional[str] = None) -> Any:
+    """
+    Imports heavy dependency on first use. Imports are serialized, since concurrent first imports of lazy packages
+    such as transformers fail with ImportError.
+    :param module: module name
+    :param attribute: name of the attribute of the module to return
+    :return: module or its attribute
+    """
+    with _import_lock:
+        imported = importlib.import_module(module)
+        return imported if attribute is None else getattr(imported, attribute)
+
+
+def get_class_constructor(classpath: str) -> Any:
+    """
+    :param classpath: full path of the class, such as 'detectors.mocks.MockDetector'
+    :return: the class
+    """
+    module_path, class_name = classpath.rsplit('.', 1)
+    return lazy_import(module_path, class_name)
+
+
+def load_detector(nexus, classpath: str, run_id) -> Any:
+    """
+    Instantiates detector by its classpath and loads weights of the run from nexus. Weights that nexus keeps in local
+    file are loaded from the path, so detectors can map them instead of reading them.
+    :param nexus: nexus storing the run
+    :param classpath: full path of the detector class
+    :param run_id: UUID of the run
+    :return: the detector
+    """
+    detector = get_class_constructor(classpath)()
+    path = nexus.load_run_weights_path(run_id) if hasattr(nexus, 'load_run_weights_path') else None
+    if path is not None:
+        detector.load_weights_from_path(path)
+    else:
+        detector.load_weights(nexus.load_run_weights(run_id))
+    return detector
@@ -0,0 +1,133 @@
+import hashlib
+import io
+import mmap
+import os
+import pathlib
+import pickle
+import struct
+from typing import Any, List, Union
+
+import numpy as np
+
+MAGIC = b'MANGOMAP'
+ALIGNMENT = 64
+MIN_MAPPED_BYTES = 4096
+DEFAULT_CACHE_DIR = './cache/mapped'
+
+_HEADER = struct.Struct('<8sQQ')
+_OFFSET = struct.Struct('<Q')
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _is_mappable(obj: Any) -> bool:
+    return (isinstance(obj, np.ndarray) and obj.nbytes >= MIN_MAPPED_BYTES and obj.dtype.fields is None
+            and not obj.dtype.hasobject)
+
+
+class _ArrayPickler(pickle.Pickler):
+    def __init__(self, file):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.arrays: List[np.ndarray] = []
+
+    def persistent_id(self, obj):
+        if _is_mappable(obj):
+            self.arrays.append(np.ascontiguousarray(obj))
+            return 'ndarray', len(self.arrays) - 1, obj.dtype.str, obj.shape
+        return None
+
+
+class _ArrayUnpickler(pickle.Unpickler):
+    def __init__(self, file, buffer, offsets: List[int]):
+        super().__init__(file)
+        self.buffer = buffer
+        self.offsets = offsets
+
+    def persistent_load(self, pid):
+        kind, index, dtype, shape = pid
+        if kind != 'ndarray':
+            raise pickle.UnpicklingError(f"Unknown persistent object {kind}.")
+        dtype = np.dtype(dtype)
+        count = int(np.prod(shape, dtype=np.int64))
+        return np.frombuffer(self.buffer, dtype=dtype, count=count, offset=self.offsets[index]).reshape(shape)
+
+
+def dump_mapped(obj: Any) -> bytes:
+    """
+    Serializes object into mappable format: pickle of the object where every large numpy array is replaced by
+    reference into aligned raw data section. Loading such file with `load_mapped` maps arrays instead of copying them.
+    :param obj: object to serialize
+    :return: serialized bytes
+    """
+    stream = io.BytesIO()
+    pickler = _ArrayPickler(stream)
+    pickler.dump(obj)
+    payload = stream.getvalue()
+
+    offset = _align(_HEADER.size + _OFFSET.size * len(pickler.arrays) + len(payload))
+    offsets = []
+    for array in pickler.arrays:
+        offsets.append(offset)
+        offset = _align(offset + array.nbytes)
+
+    out = bytearray(offset)
+    _HEADER.pack_into(out, 0, MAGIC, len(pickler.arrays), len(payload))
+    for i, array_offset in enumerate(offsets):
+        _OFFSET.pack_into(out, _HEADER.size + _OFFSET.size * i, array_offset)
+    payload_offset = _HEADER.size + _OFFSET.size * len(offsets)
+    out[payload_offset:payload_offset + len(payload)] = payload
+    for array, array_offset in zip(pickler.arrays, offsets):
+        out[array_offset:array_offset + array.nbytes] = array.tobytes()
+    return bytes(out)
+
+
+def is_mapped(content: Union[bytes, str, os.PathLike]) -> bool:
+    """
+    Checks if content (or file with the content) was produced by `dump_mapped`.
+    """
+    if isinstance(content, (bytes, bytearray, memoryview)):
+        return bytes(content[:len(MAGIC)]) == MAGIC
+    with open(content, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def spill_mapped(content: bytes, cache_dir: str = DEFAULT_CACHE_DIR) -> str:
+    """
+    Stores content in content-addressed file, so every process that loads the same content maps the same file.
+    :param content: bytes produced by `dump_mapped`
+    :param cache_dir: directory to store the file in
+    :return: path to the file
+    """
+    pathlib.Path(cache_dir).mkdir(parents=True, exist_ok=True)
+    path = pathlib.Path(cache_dir).joinpath(f'{hashlib.sha256(content).hexdigest()}.map')
+    if not path.exists():
+        tmp = path.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp, 'wb') as f:
+            f.write(content)
+        os.replace(tmp, path)
+    return str(path)
+
+
+def load_mapped(content: Union[bytes, str, os.PathLike], cache_dir: str = DEFAULT_CACHE_DIR) -> Any:
+    """
+    Loads object stored by `dump_mapped`. Arrays are read-only views of memory mapped file, so loading takes time
+    independent of the arrays size, and all processes mapping the same file share one copy in the OS page cache.
+    :param content: serialized bytes or path to file with them. Bytes are spilled to cache_dir first.
+    :param cache_dir: directory for spilled bytes
+    :return: loaded object
+    """
+    if isinstance(content, (bytes, bytearray, memoryview)):
+        content = spill_mapped(bytes(content), cache_dir)
+
+    with open(content, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, num_arrays, payload_size = _HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise Exception(f"File {content} is not in mapped format.")
+    offsets = [_OFFSET.unpack_from(buffer, _HEADER.size + _OFFSET.size * i)[0] for i in range(num_arrays)]
+    payload_offset = _HEADER.size + _OFFSET.size * num_arrays
+    payload = io.BytesIO(buffer[payload_offset:payload_offset + payload_size])
+    return _ArrayUnpickler(payload, buffer, offsets).load()
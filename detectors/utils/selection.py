@@ -0,0 +1,149 @@
+import hashlib
+import json
+import os
+import pathlib
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+
+SELECTION_CACHE = './cache/selections'
+
+
+def _lengths(batch, text_column: str) -> Dict[str, np.ndarray]:
+    import pyarrow.compute as pc
+
+    return {'length': pc.utf8_length(batch[text_column]).to_numpy(zero_copy_only=False)}
+
+
+def _stream_source(dataset) -> Optional[list]:
+    # Streams are identified by the files they read, hub files are resolved with the revision in their paths. Local
+    # files add their size and modification time. Transformed streams and streams over memory have no stable identity.
+    files = getattr(dataset._ex_iterable, 'kwargs', {}).get('files')
+    if not files:
+        return None
+    source = []
+    for path in (str(path) for group in files for path in ([group] if isinstance(group, str) else group)):
+        source.append([path, os.path.getsize(path), os.path.getmtime(path)] if os.path.isfile(path) else path)
+    info = dataset.info
+    return [info.dataset_name, info.config_name, str(info.version), str(dataset.split), source]
+
+
+def _fingerprint(dataset, **params) -> Optional[str]:
+    source = getattr(dataset, '_fingerprint', None)
+    if source is None:
+        source = _stream_source(dataset)
+        if source is None:
+            return None
+    content = json.dumps([source, {key: str(value) for key, value in sorted(params.items())}])
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()[:32]
+
+
+def _quotas(samples: Dict[int, Optional[int]], available: Dict[int, int], balance: bool) -> Dict[int, int]:
+    quotas = {label: available[label] if count is None else min(count, available[label])
+              for label, count in samples.items()}
+    if balance:
+        smallest = min(quotas.values(), default=0)
+        quotas = {label: smallest for label in quotas}
+    return quotas
+
+
+def _select_indices(labels: np.ndarray, mask: np.ndarray, samples: Dict[int, Optional[int]], balance: bool,
+                    seed: int) -> List[int]:
+    rng = np.random.default_rng(seed)
+    candidates = {label: np.flatnonzero(mask & (labels == label)) for label in samples}
+    quotas = _quotas(samples, {label: len(indices) for label, indices in candidates.items()}, balance)
+
+    indices = []
+    for label, quota in quotas.items():
+        chosen = candidates[label] if quota == len(candidates[label]) else \
+            rng.choice(candidates[label], size=quota, replace=False)
+        indices.extend(np.sort(chosen).tolist())
+    return indices
+
+
+def _select_streaming(dataset, samples: Dict[int, Optional[int]], max_length: Optional[int], balance: bool,
+                      seed: int, text_column: str, label_column: str, batch_size: int):
+    """
+    Reservoir sampling over streamed rows, memory is bounded by the number of requested samples. Labels without
+    a limit keep all of their rows.
+    """
+    from datasets import Dataset
+
+    rng = np.random.default_rng(seed)
+    reservoirs = {label: [] for label in samples}
+    seen = {label: 0 for label in samples}
+    for batch in dataset.iter(batch_size=batch_size):
+        for position, (text, label) in enumerate(zip(batch[text_column], batch[label_column])):
+            if label not in reservoirs or (max_length is not None and len(text) >= max_length):
+                continue
+            row = {column: values[position] for column, values in batch.items()}
+            seen[label] += 1
+            limit = samples[label]
+            if limit is None or len(reservoirs[label]) < limit:
+                reservoirs[label].append((seen[label], row))
+            else:
+                slot = rng.integers(seen[label])
+                if slot < limit:
+                    reservoirs[label][slot] = (seen[label], row)
+
+    quotas = _quotas(samples, {label: len(rows) for label, rows in reservoirs.items()}, balance)
+    rows = []
+    for label, quota in quotas.items():
+        # Reservoirs that never filled up keep stream order, so they are shuffled before they are cut to the quota.
+        reservoir = reservoirs[label]
+        kept = [reservoir[i] for i in rng.permutation(len(reservoir))[:quota]]
+        rows.extend(row for _, row in sorted(kept, key=lambda x: x[0]))
+    return Dataset.from_list(rows, features=dataset.features)
+
+
+def select_samples(dataset, samples: Dict[int, Optional[int]], max_length: Optional[int] = None,
+                   balance: bool = False, seed: int = 0, num_proc: Optional[int] = None,
+                   cache_dir: Union[str, pathlib.Path] = SELECTION_CACHE, text_column: str = 'output',
+                   label_column: str = 'label', batch_size: int = 10000):
+    """
+    Selects random samples of the given labels among texts shorter than max_length, in one batched pass over the
+    dataset. Text lengths are computed by vectorized arrow kernels in num_proc processes, labels are read directly from
+    arrow storage. Selection is reproducible for the same seed and is cached as arrow file named by fingerprint of the
+    dataset and arguments, so repeated runs load it without touching the dataset.
+    Streamed (iterable) datasets are sampled with bounded memory by reservoir sampling. They are cached only if they
+    read files directly, streams without a stable identity are sampled again on every call.
+    :param dataset: HF dataset split, regular or streamed
+    :param samples: maximal number of samples of every label, None selects all rows of the label
+    :param max_length: upper bound (exclusive) of text length in characters
+    :param balance: select the same number of samples of every label
+    :param seed: seed of sampling
+    :param num_proc: number of processes computing text lengths
+    :param cache_dir: directory of cached selections
+    :param text_column: name of the text column
+    :param label_column: name of the label column
+    :param batch_size: number of rows processed at once
+    :return: dataset of selected rows, grouped by label in the order of samples and ordered as in source within label
+    """
+    from datasets import Dataset, IterableDataset
+
+    fingerprint = _fingerprint(dataset, samples=samples, max_length=max_length, balance=balance, seed=seed,
+                               text_column=text_column, label_column=label_column)
+    path = pathlib.Path(cache_dir).joinpath(f'selection-{fingerprint}.arrow') if fingerprint else None
+    if path is not None and path.exists():
+        return Dataset.from_file(str(path))
+
+    if isinstance(dataset, IterableDataset):
+        selection = _select_streaming(dataset, samples, max_length, balance, seed, text_column, label_column,
+                                      batch_size)
+        if path is None:
+            return selection
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return selection.flatten_indices(cache_file_name=str(path))
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    labels = np.asarray(dataset.with_format('numpy', columns=[label_column])[label_column])
+    mask = np.ones(len(dataset), dtype=bool)
+    if max_length is not None:
+        lengths = dataset.select_columns([text_column]).with_format('arrow').map(
+            _lengths, batched=True, batch_size=batch_size, num_proc=num_proc, fn_kwargs={'text_column': text_column},
+            remove_columns=[text_column], desc='Measuring texts')
+        mask &= lengths.data.column('length').to_numpy() < max_length
+
+    indices = _select_indices(labels, mask, samples, balance, seed)
+    return dataset.select(indices).flatten_indices(cache_file_name=str(path), new_fingerprint=fingerprint)
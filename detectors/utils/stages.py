@@ -0,0 +1,67 @@
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import pickle
+import threading
+from typing import Any, Callable, Dict, Iterable, Tuple
+
+STAGE_CACHE = './cache/stages'
+
+
+class StageCache:
+    """
+    On-disk cache of pipeline stages. Every stage result is stored under a key hashed from the stage name, its
+    parameters and keys of its inputs, so a stage is recomputed only if something it depends on changed, and
+    everything upstream of a changed stage is reused.
+    """
+
+    def __init__(self, directory: str = STAGE_CACHE, recompute: Iterable[str] = ()):
+        """
+        :param directory: directory of stage results
+        :param recompute: names of stages that are recomputed even if cached, 'logprobs' matches 'logprobs/<model>'
+        """
+        self.directory = pathlib.Path(directory)
+        self.recompute = set(recompute)
+        self.locks: Dict[str, threading.Lock] = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def make_key(name: str, params: Dict[str, Any]) -> str:
+        """
+        :param name: stage name
+        :param params: JSON serializable parameters of the stage, including keys of its input stages
+        :return: content hash identifying the stage result
+        """
+        content = json.dumps([name, params], sort_keys=True, default=str)
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()[:32]
+
+    def run(self, name: str, params: Dict[str, Any], compute: Callable[[], Any]) -> Tuple[str, Any]:
+        """
+        Returns cached result of the stage, or computes and stores it. Concurrent runs of the same stage compute it
+        once.
+        :param name: stage name
+        :param params: JSON serializable parameters of the stage, including keys of its input stages
+        :param compute: computes the result, it should be picklable
+        :return: tuple of the stage key and its result
+        """
+        key = self.make_key(name, params)
+        path = self.directory.joinpath(name.replace('/', '-'), f'{key}.pkl')
+        with self.lock:
+            lock = self.locks.setdefault(key, threading.Lock())
+
+        with lock:
+            if path.exists() and name.split('/')[0] not in self.recompute:
+                logging.info(f'Stage {name} is cached as {key}.')
+                with open(path, 'rb') as f:
+                    return key, pickle.load(f)
+
+            logging.info(f'Computing stage {name} as {key}.')
+            result = compute()
+            path.parent.mkdir(parents=True, exist_ok=True)
+            temporary = path.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+            with open(temporary, 'wb') as f:
+                pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, path)
+            return key, result
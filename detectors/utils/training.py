@@ -1,9 +1,7 @@
-import traceback
+import logging
+from typing import List, Optional, Tuple
 
 import numpy as np
-from sklearn.metrics import ConfusionMatrixDisplay, confusion_matrix
-from sklearn.metrics import accuracy_score, recall_score, precision_score, f1_score, roc_curve, roc_auc_score, \
-    RocCurveDisplay
 
 from detectors.metrics import ClassificationMetrics, SplitConclusion, ClassificationRepresentations
 
@@ -18,49 +16,114 @@ def tpr_at_fpr_threshold(fpr, tpr, target_fpr=0.1):
         return tpr_interp
 
 
-def safe_roc(y_true, y_scores):
-    try:
-        fpr, tpr, thresholds = roc_curve(y_true, y_scores)
-        auc = roc_auc_score(y_true, y_scores)
-        return fpr, tpr, auc
-    except Exception as e:
-        print(traceback.format_exc())
-
-    return np.array([0.0, 0.5, 1.0]), np.array([0.0, 0.5, 1.0]), 0.5
+class ClassificationAccumulator:
+    """
+    Streaming binary classification metrics. Batches of labels and scores are added by `update`, and ROC curve is
+    computed once for all metrics and charts. Threshold metrics (precision, recall, F1, accuracy) are exact counts at
+    score 0.5. ROC is exact when all scores are kept, or approximated by histograms of scores of both classes with
+    constant memory when `bins` is given.
+    """
+
+    def __init__(self, bins: Optional[int] = None):
+        """
+        :param bins: number of equal-width score bins over [0, 1], None keeps all scores and computes exact ROC
+        """
+        self.bins = bins
+        self.confusion = np.zeros((2, 2), dtype=np.int64)
+        self.labels: List[np.ndarray] = []
+        self.scores: List[np.ndarray] = []
+        self.positives = np.zeros(bins or 0, dtype=np.int64)
+        self.negatives = np.zeros(bins or 0, dtype=np.int64)
+        self._roc = None
+
+    def update(self, y_true, y_scores) -> 'ClassificationAccumulator':
+        """
+        :param y_true: 1d array of binary labels
+        :param y_scores: 1d array of scores of positive label
+        :return: self
+        """
+        y_true = np.asarray(y_true).astype(bool).ravel()
+        y_scores = np.asarray(y_scores, dtype=np.float64).ravel()
+        y_pred = y_scores > 0.5
+        np.add.at(self.confusion, (y_true.astype(np.int64), y_pred.astype(np.int64)), 1)
+
+        if self.bins is None:
+            self.labels.append(y_true)
+            self.scores.append(y_scores)
+        else:
+            index = np.clip((y_scores * self.bins).astype(np.int64), 0, self.bins - 1)
+            self.positives += np.bincount(index[y_true], minlength=self.bins)
+            self.negatives += np.bincount(index[~y_true], minlength=self.bins)
+        self._roc = None
+        return self
+
+    def _counts(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :return: cumulative true and false positives at decreasing thresholds
+        """
+        if self.bins is not None:
+            return np.cumsum(self.positives[::-1]), np.cumsum(self.negatives[::-1])
+
+        labels = np.concatenate(self.labels) if self.labels else np.zeros(0, dtype=bool)
+        scores = np.concatenate(self.scores) if self.scores else np.zeros(0)
+        order = np.argsort(-scores, kind='stable')
+        scores, labels = scores[order], labels[order]
+        last = np.append(np.flatnonzero(np.diff(scores)), len(scores) - 1)
+        tps = np.cumsum(labels)[last]
+        return tps, last + 1 - tps
+
+    def roc(self) -> Tuple[np.ndarray, np.ndarray, float]:
+        """
+        :return: false positive rates, true positive rates and area under ROC curve. Degenerate diagonal ROC is returned
+        if only one class was seen.
+        """
+        if self._roc is None:
+            tps, fps = self._counts()
+            if len(tps) == 0 or tps[-1] == 0 or fps[-1] == 0:
+                logging.warning("ROC is undefined when only one class is present.")
+                self._roc = np.array([0.0, 0.5, 1.0]), np.array([0.0, 0.5, 1.0]), 0.5
+            else:
+                # Points that lie on a straight line between their neighbours do not change the curve.
+                keep = np.flatnonzero(np.r_[True, np.logical_or(np.diff(fps, 2), np.diff(tps, 2)), True])
+                fpr = np.r_[0, fps[keep]] / fps[-1]
+                tpr = np.r_[0, tps[keep]] / tps[-1]
+                self._roc = fpr, tpr, float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2))
+        return self._roc
+
+    def metrics(self) -> ClassificationMetrics:
+        (tn, fp), (fn, tp) = self.confusion
+        fpr, tpr, auc = self.roc()
+        ratio = lambda a, b: a / b if b else 0.0
+
+        return ClassificationMetrics(
+            tpr_at_1_percent_fpr=float(tpr_at_fpr_threshold(fpr, tpr, target_fpr=0.01)),
+            tpr_at_10_percent_fpr=float(tpr_at_fpr_threshold(fpr, tpr, target_fpr=0.1)),
+            auc=auc,
+            precision=float(ratio(tp, tp + fp)),
+            recall=float(ratio(tp, tp + fn)),
+            f1=float(ratio(2 * tp, 2 * tp + fp + fn)),
+            accuracy=float(ratio(tp + tn, self.confusion.sum()))
+        )
+
+    def representations(self) -> ClassificationRepresentations:
+        fpr, tpr, auc = self.roc()
+        return ClassificationRepresentations(fpr=fpr, tpr=tpr, auc=auc, confusion=self.confusion.copy())
+
+    def conclusion(self) -> SplitConclusion:
+        return SplitConclusion(metrics=self.metrics(), representations=self.representations())
 
 
-def draw_classification(y_true, y_scores) -> ClassificationRepresentations:
-    y_pred = y_scores > 0.5
-
-    fpr, tpr, auc = safe_roc(y_true, y_scores)
+def safe_roc(y_true, y_scores):
+    return ClassificationAccumulator().update(y_true, y_scores).roc()
 
-    display = RocCurveDisplay(fpr=fpr, tpr=tpr, roc_auc=auc)
-    display.plot()
 
-    mtrix = ConfusionMatrixDisplay(confusion_matrix(y_true, y_pred))
-    mtrix.plot()
-    return ClassificationRepresentations(
-        roc_curve=display.figure_,
-        clf_report=mtrix.figure_
-    )
+def draw_classification(y_true, y_scores) -> ClassificationRepresentations:
+    return ClassificationAccumulator().update(y_true, y_scores).representations()
 
 
 def calculate_classification(y_true, y_scores) -> ClassificationMetrics:
-    y_pred = y_scores > 0.5
-
-    fpr, tpr, auc = safe_roc(y_true, y_scores)
-
-    return ClassificationMetrics(
-        tpr_at_1_percent_fpr=tpr_at_fpr_threshold(fpr, tpr, target_fpr=0.01),
-        tpr_at_10_percent_fpr=tpr_at_fpr_threshold(fpr, tpr, target_fpr=0.1),
-        auc=auc,
-        precision=precision_score(y_true, y_pred),
-        recall=recall_score(y_true, y_pred),
-        f1=f1_score(y_true, y_pred),
-        accuracy=accuracy_score(y_true, y_pred)
-    )
+    return ClassificationAccumulator().update(y_true, y_scores).metrics()
 
 
 def report_classification(y_true, y_scores) -> SplitConclusion:
-    return SplitConclusion(metrics=calculate_classification(y_true, y_scores),
-                           representations=draw_classification(y_true, y_scores))
+    return ClassificationAccumulator().update(y_true, y_scores).conclusion()